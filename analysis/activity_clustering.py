@@ -0,0 +1,223 @@
+# 活跃时段的一维最优聚类
+# plot_activity_clusters原来对每条评论的小时（0-23的整数）运行KMeans：初始化是随机的，每次运行结果和类别编号都可能不同，
+# 耗时还随评论数增长。这里先把评论按小时（或分钟）统计成直方图，再在直方图上用动态规划求一维加权k-means的精确最优划分：
+# 每个活跃段是连续的若干个时段，目标与KMeans相同（各段内到段中心的加权平方距离之和最小）。
+# 耗时只与时段数和段数有关，与评论数无关；结果是确定的，类别按活跃段在一天中的起始时间编号。
+# 可以允许活跃段跨过午夜（例如23点到次日1点为一段）
+
+import numpy as np
+
+# 直方图的分辨率：名称 -> 一天的时段数
+RESOLUTIONS = {'hour': 24, 'minute': 24 * 60}
+
+
+def activity_histogram(pubdate, resolution='hour'):
+    """
+    评论数按时段的直方图
+    :param pubdate: 评论时间，datetime64的Series，空值不统计
+    :param resolution: 'hour'为24个小时，'minute'为一天的1440分钟
+    :return: int64数组，第i个元素为第i个时段的评论数
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"不支持的分辨率：{resolution}，可选 {list(RESOLUTIONS)}")
+    pubdate = pubdate.dropna()
+    slots = pubdate.dt.hour.to_numpy(dtype=np.int64)
+    if resolution == 'minute':
+        slots = slots * 60 + pubdate.dt.minute.to_numpy(dtype=np.int64)
+    return np.bincount(slots, minlength=RESOLUTIONS[resolution])
+
+
+def _prefix_sums(weights):
+    """
+    权重、加权位置、加权位置的平方的前缀和，时段的位置为它的下标
+    """
+    positions = np.arange(len(weights), dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    return tuple(np.concatenate([[0.0], np.cumsum(values)]) for values in (weights, weights * positions,
+                                                                          weights * positions ** 2))
+
+
+def _interval_costs(prefix, starts, ends):
+    """
+    连续时段[i, j)作为一段时的代价：段内各时段到加权中心的加权平方距离之和，只计算i取自starts、j取自ends的区间
+    :param prefix: _prefix_sums得到的前缀和
+    :return: len(starts) × len(ends)的数组，i >= j的位置为inf
+    """
+    total, first, second = prefix
+    starts, ends = np.asarray(starts)[:, None], np.asarray(ends)[None, :]
+    w = total[ends] - total[starts]
+    s1 = first[ends] - first[starts]
+    s2 = second[ends] - second[starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        costs = np.where(w > 0, s2 - s1 ** 2 / w, 0.0)
+    # 舍入误差可能产生很小的负数
+    costs = np.maximum(costs, 0.0)
+    costs[starts >= ends] = np.inf
+    return costs
+
+
+def _segment_costs(weights):
+    """
+    所有连续时段[i, j)作为一段时的代价
+    :param weights: 各时段的评论数
+    :return: (n + 1) × (n + 1)的数组，只有i < j的位置有意义，其余为inf
+    """
+    points = np.arange(len(weights) + 1)
+    return _interval_costs(_prefix_sums(weights), points, points)
+
+
+def _linear_partition(costs, k):
+    """
+    动态规划：把n个时段划分为k个非空的连续段，使各段代价之和最小
+    :param costs: _segment_costs得到的(n + 1) × (n + 1)代价矩阵
+    :return: (最小代价, 各段的起点列表)
+    """
+    size = costs.shape[0]
+    # best[j]：前j个时段分为m段的最小代价，第一段一定从0开始
+    best = costs[0].copy()
+    choices = []
+    for _ in range(k - 2):
+        # total[i, j]：前i个时段分为m - 1段、[i, j)为第m段时的代价；argmin取第一个最小值，结果确定
+        total = best[:, None] + costs
+        choices.append(total.argmin(axis=0))
+        best = total.min(axis=0)
+    starts, end = [0], size - 1
+    if k > 1:
+        # 最后一段一定到第n个时段结束，只需要计算这一列
+        last = best + costs[:, end]
+        end = int(last.argmin())
+        cost = float(last[end])
+        starts.append(end)
+        for choice in reversed(choices):
+            end = int(choice[end])
+            starts.append(end)
+        starts = [0] + starts[:0:-1]
+    else:
+        cost = float(best[end])
+    return cost, starts
+
+
+def _wrap_partition(weights, k):
+    """
+    允许一段跨过午夜时的最优划分
+    区间代价满足四边形不等式，存在一个跨午夜的最优划分与从0点开始的最优划分交错（每段各含对方的一个起点），
+    所以第一段的起点只需要在从0点开始的最优划分中最短的一段内尝试，之后每一段的起点都在对方的下一段内；
+    只计算相邻两段起点的范围之间的代价，不需要整个(2n + 1) × (2n + 1)的代价矩阵
+    :return: (最小代价, 各段的起点列表，跨过午夜的加n)
+    """
+    n = len(weights)
+    # 时段序列接在自己后面，从第s个时段开始的一天为[s, s + n)，跨过午夜的段的位置是连续的
+    prefix = _prefix_sums(np.concatenate([weights, weights]))
+    _, linear_starts = _linear_partition(_segment_costs(weights), k)
+    bounds = linear_starts + [n]
+    shortest = int(np.argmin(np.diff(bounds)))
+    # 第m段的起点所在的范围：从0点开始的最优划分的第shortest + m段（两端都包括）
+    windows = []
+    for m in range(k):
+        index = (shortest + m) % k
+        windows.append(np.arange(bounds[index], bounds[index + 1] + 1) + (n if shortest + m >= k else 0))
+    # 相邻两段起点之间的代价与第一段的起点无关，先算好；最后一段到第一段的起点加n结束
+    steps = [_interval_costs(prefix, windows[m], windows[m + 1]) for m in range(k - 1)]
+    closing = _interval_costs(prefix, windows[-1], windows[0] + n)
+
+    cost, starts = np.inf, None
+    for first, start in enumerate(windows[0].tolist()):
+        if k == 1:
+            candidate, candidate_starts = float(closing[first, first]), [start]
+        else:
+            # best[j]：第m段从windows[m][j]开始时，前m段的最小代价
+            best = steps[0][first]
+            choices = []
+            for step in steps[1:]:
+                total = best[:, None] + step
+                choices.append(total.argmin(axis=0))
+                best = total.min(axis=0)
+            last = best + closing[:, first]
+            end = int(last.argmin())
+            candidate = float(last[end])
+            candidate_starts = [int(windows[-1][end])]
+            for m in range(k - 2, 0, -1):
+                end = int(choices[m - 1][end])
+                candidate_starts.append(int(windows[m][end]))
+            candidate_starts = [start] + candidate_starts[::-1]
+        # 代价相同时取先尝试的起点，结果确定
+        if starts is None or candidate < cost - 1e-9 * max(cost, 1.0):
+            cost, starts = candidate, candidate_starts
+    return cost, starts
+
+
+def optimal_partition(weights, k, wrap=True):
+    """
+    直方图的一维最优k段划分
+    :param weights: 各时段的评论数（见activity_histogram）
+    :param k: 段数，不能超过时段数
+    :param wrap: 是否允许一段跨过午夜（最后一个时段与第一个时段相邻）；需要对第一段的多个起点（不超过n / k + 1个）分别求解，
+                 每个起点的计算量约为(n / k)² × (k - 2)，分钟分辨率（n = 1440）时为几百毫秒
+    :return: (各时段的类别（0到k-1，按段在一天中的起始时段编号）, 各段内的加权平方距离之和)
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    if not 1 <= k <= n:
+        raise ValueError(f"段数应在1到{n}之间，当前为：{k}")
+    if wrap:
+        cost, starts = _wrap_partition(weights, k)
+    else:
+        cost, starts = _linear_partition(_segment_costs(weights), k)
+    # 各段在一天中的起始时段，按时间顺序编号
+    day_starts = sorted(start % n for start in starts)
+    labels = np.searchsorted(day_starts, np.arange(n), side='right') - 1
+    # 第一个起点之前的时段属于跨过午夜的最后一段
+    labels[labels < 0] = k - 1
+    return labels, cost
+
+
+if __name__ == '__main__':
+    # 与KMeans比较：耗时、目标值和多次运行的结果是否相同；再在小时直方图上用穷举检查动态规划的结果是最优的
+    import time
+    from itertools import combinations
+    from pathlib import Path
+
+    import pandas as pd
+    from sklearn.cluster import KMeans
+
+    pubdate = pd.concat([pd.read_parquet(file, columns=['pubdate'])
+                         for file in sorted(Path('../data_processed').glob('*.parquet'))])['pubdate']
+    hours = pubdate.dropna().dt.hour.to_numpy()
+    histogram = activity_histogram(pubdate)
+    print(f">>>{len(hours)} 条评论")
+
+    labels_seen = set()
+    start_time = time.perf_counter()
+    for seed in range(5):
+        kmeans = KMeans(n_clusters=3, n_init=1, random_state=seed).fit(hours.reshape(-1, 1))
+        labels_seen.add(tuple(kmeans.predict(np.arange(24).reshape(-1, 1))))
+    kmeans_time = (time.perf_counter() - start_time) / 5
+    print(f">>>KMeans（每条评论一行）: 每次 {kmeans_time * 1000:.0f} 毫秒，目标值 {kmeans.inertia_:,.0f}，"
+          f"5次运行得到 {len(labels_seen)} 种不同的类别编号")
+
+    for resolution in RESOLUTIONS:
+        weights = activity_histogram(pubdate, resolution)
+        for wrap in (False, True):
+            start_time = time.perf_counter()
+            labels, cost = optimal_partition(weights, 3, wrap=wrap)
+            elapsed = time.perf_counter() - start_time
+            scale = 1 if resolution == 'hour' else 60 ** 2
+            print(f">>>直方图动态规划（{resolution}，{'允许' if wrap else '不允许'}跨过午夜）: "
+                  f"{elapsed * 1000:.1f} 毫秒，目标值 {cost / scale:,.0f}（按小时计），"
+                  f"各段起点 {np.flatnonzero(labels != np.roll(labels, 1)).tolist()}")
+
+    def brute_force(weights, k, wrap):
+        n = len(weights)
+        costs = _segment_costs(np.concatenate([weights, weights]))
+        best = np.inf
+        for cuts in combinations(range(n), k):
+            if not wrap and cuts[0] != 0:
+                continue
+            bounds = list(cuts) + [cuts[0] + n]
+            best = min(best, sum(costs[a, b] for a, b in zip(bounds[:-1], bounds[1:])))
+        return best
+
+    for wrap in (False, True):
+        for k in (2, 3, 4):
+            _, cost = optimal_partition(histogram, k, wrap=wrap)
+            print(f">>>穷举检查 k={k}，{'允许' if wrap else '不允许'}跨过午夜：{np.isclose(cost, brute_force(histogram, k, wrap))}")
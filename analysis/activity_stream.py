@@ -0,0 +1,389 @@
+# 流式活跃度统计和爆发检测
+# plot_active_points原来先读入全部评论，按天统计评论数后取diff()，与固定的threshold=100比较找出"活跃点"：
+# 只能按天统计，而且同一个阈值对几百条评论的视频和几万条评论的视频意义完全不同。
+# 这里逐批接收评论时间，同时按分钟、小时、天统计各时段的评论数（按时段保存，内存与有评论的时段数有关，与评论数无关），
+# 时段结束时用指数加权的均值和方差计算这个时段评论数的z分数，明显高于近期水平时发出爆发事件；
+# 阈值以标准差为单位，与视频的评论规模无关。
+# write_rows与评论存储（data_acquisition/comment_sink.py）的接口相同，可以直接接在爬虫后面，一边爬取一边统计：
+# 爬虫不按时间顺序写入评论，默认在爬取结束（finish/close）时用最终的计数检测；评论按时间顺序到达时可以设置lateness边接收边检测。
+# 这个模块不导入matplotlib
+
+import math
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# 分辨率：名称 -> (每个时段的秒数, 默认保留的时段数)
+RESOLUTIONS = {
+    'minute': (60, 24 * 60),
+    'hour': (3600, 24 * 7),
+    'day': (86400, 90),
+}
+# 爬虫写入的评论行中各列的顺序（与data_acquisition/comment_sink.COLUMNS相同）
+COLUMNS = ['id', 'contents', 'parent_id', 'pubdate', 'like_count']
+# 爬取时页面上的发布时间：完整的日期时间，或"N秒/分钟/小时/天前"、"刚刚"
+FULL_FORMAT = '%Y-%m-%d %H:%M'
+AGO_PATTERN = re.compile(r'^\s*(\d+)\s*(秒|分钟|小时|天)前\s*$')
+AGO_UNITS = {'秒': 1, '分钟': 60, '小时': 3600, '天': 86400}
+
+
+def to_seconds(values, now=None):
+    """
+    评论时间转换为秒数（Unix时间，按本地时间不带时区）
+    :param values: datetime64、Timestamp或爬取时页面上的发布时间文字
+    :param now: 相对时间（"3小时前"）的参照时间，默认为当前时间
+    :return: float64数组，无法识别的时间为NaN（例如只有月日的时间，需要经过清洗才能确定年份）
+    """
+    values = pd.Series(values).reset_index(drop=True)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return (values - pd.Timestamp(0)).dt.total_seconds().to_numpy(dtype=np.float64)
+    values = values.astype(object)
+    is_text = values.map(lambda value: isinstance(value, str))
+    # 文字按完整的日期时间解析，其余的值（datetime、Timestamp）直接转换
+    parsed = pd.to_datetime(values.where(is_text), format=FULL_FORMAT, errors='coerce')
+    parsed = parsed.fillna(pd.to_datetime(values.mask(is_text), errors='coerce'))
+    seconds = (parsed - pd.Timestamp(0)).dt.total_seconds().to_numpy(dtype=np.float64, copy=True)
+    text = values.map(lambda value: value.strip() if isinstance(value, str) else '')
+    relative = np.isnan(seconds) & (text != '').to_numpy()
+    if relative.any():
+        now = pd.Timestamp(now if now is not None else time.strftime('%Y-%m-%d %H:%M:%S'))
+        reference = (now - pd.Timestamp(0)).total_seconds()
+        for position in np.flatnonzero(relative):
+            value = text.iat[position]
+            match = AGO_PATTERN.match(value)
+            if match:
+                seconds[position] = reference - int(match.group(1)) * AGO_UNITS[match.group(2)]
+            elif value == '刚刚':
+                seconds[position] = reference
+    return seconds
+
+
+class BurstDetector:
+    """
+    指数加权的z分数爆发检测
+    每个时段结束时，z = (评论数 - 加权均值) / 加权标准差；标准差至少取sqrt(均值)（泊松噪声）且至少为1，
+    评论很少时几条评论的波动不会被当作爆发
+    """
+
+    def __init__(self, alpha=0.1, threshold=3.0, min_count=5, warmup=5):
+        """
+        :param alpha: 指数加权的系数，越大越侧重最近的时段
+        :param threshold: z分数的阈值
+        :param min_count: 爆发时段至少要有的评论数
+        :param warmup: 前几个时段只用于估计均值和方差，不检测
+        """
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        self.warmup = warmup
+        self.mean = 0.0
+        self.variance = 0.0
+        self.seen = 0
+
+    def update(self, count):
+        """
+        一个时段结束，用它的评论数更新均值和方差
+        :return: 爆发时返回 (z分数, 之前的加权均值)，否则为None
+        """
+        std = math.sqrt(max(self.variance, self.mean, 1.0))
+        zscore = (count - self.mean) / std
+        burst = self.seen >= self.warmup and count >= self.min_count and zscore >= self.threshold
+        expected = self.mean
+        difference = count - self.mean
+        increment = self.alpha * difference
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + difference * increment)
+        self.seen += 1
+        return (zscore, expected) if burst else None
+
+    def skip(self, bins):
+        """
+        连续bins个没有评论的时段，按update(0)重复bins次的结果直接计算（没有评论的时段不会是爆发）
+        """
+        if bins <= 0:
+            return
+        decay = (1 - self.alpha) ** bins
+        self.variance = decay * (self.variance + self.mean ** 2 * (1 - decay))
+        self.mean *= decay
+        self.seen += bins
+
+
+class RollingCounter:
+    """
+    一种分辨率的计数：按时段编号（绝对时间）保存有评论的时段的评论数，评论的到达顺序不影响计数
+    lateness为None时所有时段都在finish()时才结束并交给爆发检测，检测结果与到达顺序无关（爬虫不按时间顺序写入，
+    例如接口爬取按最新排序，从新到旧）；lateness为整数时，最新的时段之前lateness个时段还没有结束，
+    更早的时段结束后立即交给爆发检测（边接收边检测，要求评论大致按时间顺序到达），之后到达的评论仍然计入计数（如果还在窗口内），
+    记为晚到，不再参与检测
+    """
+
+    def __init__(self, seconds, window, lateness=None, detector=None):
+        """
+        :param seconds: 每个时段的秒数
+        :param window: series()返回的时段数；边接收边检测时，只保留最近window个已结束的时段
+        :param lateness: 允许晚到的时段数，为None时等到finish()才检测
+        :param detector: BurstDetector，为None时不检测
+        """
+        if lateness is not None and lateness >= window:
+            raise ValueError(f"允许晚到的时段数应小于保留的时段数：{lateness} >= {window}")
+        self.seconds = seconds
+        self.window = window
+        self.lateness = lateness
+        self.detector = detector
+        self.bins = {}  # 时段编号 -> 评论数，只有有评论的时段
+        self.head = None  # 最新的时段编号
+        self.closed = None  # 已结束（交给爆发检测）的最后一个时段编号
+        self.late = 0
+
+    def _close_until(self, last):
+        """
+        结束编号不超过last的时段，返回爆发的时段 [(时段编号, 评论数, z分数, 加权均值)]
+        """
+        bursts = []
+        if self.closed is None:
+            # 最早的时段之前的时段视为已结束，不参与检测
+            self.closed = min(self.bins) - 1
+        if last <= self.closed:
+            return bursts
+        if self.detector is not None:
+            previous = self.closed
+            for number in sorted(number for number in self.bins if self.closed < number <= last):
+                # 两个有评论的时段之间的时段没有评论
+                self.detector.skip(number - previous - 1)
+                count = self.bins[number]
+                result = self.detector.update(count)
+                if result is not None:
+                    bursts.append((number, count) + result)
+                previous = number
+            self.detector.skip(last - previous)
+        self.closed = last
+        return bursts
+
+    def add(self, numbers, counts):
+        """
+        计入若干个时段的评论数
+        :param numbers: 时段编号，不重复
+        :param counts: 每个时段的评论数
+        :return: 爆发的时段（lateness为None时总是空列表）
+        """
+        for number, count in zip(numbers.tolist(), counts.tolist()):
+            if self.closed is not None and number <= self.closed:
+                self.late += count
+                if number <= self.head - self.window:
+                    # 已经不在窗口内
+                    continue
+            self.bins[number] = self.bins.get(number, 0) + count
+            if self.head is None or number > self.head:
+                self.head = number
+        if self.lateness is None or self.head is None:
+            return []
+        bursts = self._close_until(self.head - self.lateness - 1)
+        # 已结束并且不在窗口内的时段不再需要
+        expired = min(self.closed, self.head - self.window)
+        for number in [number for number in self.bins if number <= expired]:
+            del self.bins[number]
+        return bursts
+
+    def finish(self):
+        """
+        结束所有时段（数据已经全部到达），用最终的计数检测还没有结束的时段
+        """
+        if self.head is None:
+            return []
+        return self._close_until(self.head)
+
+    def series(self):
+        """
+        最新的window个时段的评论数，索引为时段的开始时间
+        """
+        if self.head is None:
+            return pd.Series(dtype=np.int64)
+        numbers = np.arange(self.head - self.window + 1, self.head + 1)
+        index = pd.to_datetime(numbers * self.seconds, unit='s')
+        counts = np.fromiter((self.bins.get(number, 0) for number in numbers.tolist()), dtype=np.int64,
+                             count=len(numbers))
+        return pd.Series(counts, index=index)
+
+
+class ActivityStream:
+    """
+    流式活跃度统计：同时维护多种分辨率的滚动计数，时段结束时检测爆发
+    """
+
+    def __init__(self, resolutions=('minute', 'hour', 'day'), alpha=0.1, threshold=3.0, min_count=5, warmup=5,
+                 lateness=None, windows=None, on_burst=None, sink=None, columns=None, now=None):
+        """
+        :param resolutions: 统计的分辨率，见RESOLUTIONS
+        :param alpha: 指数加权的系数，见BurstDetector
+        :param threshold: z分数的阈值
+        :param min_count: 爆发时段至少要有的评论数
+        :param warmup: 每种分辨率的前几个时段不检测
+        :param lateness: 允许晚到的时段数，为None时在finish()时检测，结果与评论的到达顺序无关；
+                         评论按时间顺序到达时可以设为较小的整数，时段结束后立即检测
+        :param windows: {分辨率: 保留的时段数}，默认见RESOLUTIONS
+        :param on_burst: 发现爆发时调用的函数，参数为爆发事件
+        :param sink: 用作爬虫的评论存储时，评论同时写入的下一个存储
+        :param columns: write_rows中每行的列名，默认为COLUMNS
+        :param now: 相对时间（"3小时前"）的参照时间，默认为当前时间
+        """
+        windows = windows or {}
+        for resolution in resolutions:
+            if resolution not in RESOLUTIONS:
+                raise ValueError(f"不支持的分辨率：{resolution}，可选 {list(RESOLUTIONS)}")
+        self.counters = {
+            resolution: RollingCounter(RESOLUTIONS[resolution][0], windows.get(resolution, RESOLUTIONS[resolution][1]),
+                                       lateness, BurstDetector(alpha, threshold, min_count, warmup))
+            for resolution in resolutions
+        }
+        self.on_burst = on_burst
+        self.sink = sink
+        self.columns = list(columns or COLUMNS)
+        self.now = now
+        self.events = []
+        self.rows = 0
+        self.unparsed = 0
+
+    def _emit(self, resolution, bursts):
+        seconds = self.counters[resolution].seconds
+        events = [{
+            'resolution': resolution,
+            'start': pd.Timestamp(number * seconds, unit='s'),
+            'count': count,
+            'expected': expected,
+            'zscore': zscore,
+        } for number, count, zscore, expected in bursts]
+        for event in events:
+            self.events.append(event)
+            if self.on_burst is not None:
+                self.on_burst(event)
+        return events
+
+    def update(self, pubdates):
+        """
+        接收一批评论的时间
+        :param pubdates: datetime64的Series/数组，或爬取时页面上的发布时间文字
+        :return: 这一批评论使已结束的时段中出现的爆发事件（lateness为None时为空）
+        """
+        seconds = to_seconds(pubdates, self.now)
+        valid = ~np.isnan(seconds)
+        self.rows += len(seconds)
+        self.unparsed += int((~valid).sum())
+        seconds = seconds[valid].astype(np.int64)
+        events = []
+        for resolution, counter in self.counters.items():
+            numbers, counts = np.unique(seconds // counter.seconds, return_counts=True)
+            events.extend(self._emit(resolution, counter.add(numbers, counts)))
+        return events
+
+    def finish(self):
+        """
+        数据全部到达后结束所有时段，用最终的计数检测，返回这时发现的爆发事件
+        """
+        events = []
+        for resolution, counter in self.counters.items():
+            events.extend(self._emit(resolution, counter.finish()))
+        return events
+
+    def counts(self, resolution):
+        """
+        一种分辨率下窗口内各时段的评论数
+        """
+        return self.counters[resolution].series()
+
+    def bursts(self, resolution=None):
+        """
+        已发现的爆发事件，resolution为None时返回所有分辨率的
+        """
+        events = [event for event in self.events if resolution is None or event['resolution'] == resolution]
+        return pd.DataFrame(events, columns=['resolution', 'start', 'count', 'expected', 'zscore'])
+
+    # 与评论存储相同的接口，可以作为爬虫的sink，写入的行同时交给下一个存储
+
+    def write_rows(self, rows):
+        """
+        接收爬虫写入的评论行
+        :param rows: 行的列表，每行与columns一一对应
+        """
+        if self.sink is not None:
+            self.sink.write_rows(rows)
+        column = self.columns.index('pubdate')
+        self.update([row[column] for row in rows])
+
+    def flush(self, sync=False):
+        if self.sink is not None:
+            self.sink.flush(sync=sync)
+
+    def position(self):
+        return self.sink.position() if self.sink is not None else self.rows
+
+    def rollback(self, position):
+        """
+        回退下一个存储；已经统计的评论不会从计数中减去（断点续爬时在写入新评论之前回退，不影响统计）
+        """
+        if self.sink is not None:
+            self.sink.rollback(position)
+
+    @property
+    def rows_written(self):
+        return self.sink.rows_written if self.sink is not None else self.rows
+
+    @property
+    def file_path(self):
+        return self.sink.file_path if self.sink is not None else None
+
+    def close(self):
+        self.finish()
+        if self.sink is not None:
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    # 一次性统计与分批流式统计的结果一致性检查，并比较两者各时段的爆发事件；测速
+    from pathlib import Path
+
+    pubdate = pd.concat([pd.read_parquet(file, columns=['pubdate'])
+                         for file in sorted(Path('../data_processed').glob('*.parquet'))])['pubdate'].dropna()
+    print(f">>>{len(pubdate)} 条评论，{pubdate.min()} ~ {pubdate.max()}")
+
+    whole = ActivityStream()
+    start_time = time.perf_counter()
+    whole.update(pubdate)
+    whole.finish()
+    elapsed = time.perf_counter() - start_time
+    print(f">>>一次性输入：耗时 {elapsed * 1000:.0f} 毫秒，爆发事件 "
+          f"{ {resolution: len(whole.bursts(resolution)) for resolution in whole.counters} }")
+
+    # 分批输入（模拟一边爬取一边统计）：按时间顺序边接收边检测，以及从新到旧、打乱顺序时在结束时检测，结果都应与一次性输入一致
+    def same_bursts(left, right):
+        # 边接收边检测时一段空白时段可能分两次跳过，均值和z分数只有舍入误差
+        return left[['start', 'count']].equals(right[['start', 'count']]) and \
+            np.allclose(left[['expected', 'zscore']], right[['expected', 'zscore']])
+
+    daily_expected = pubdate.dt.floor('D').value_counts().sort_index().tail(RESOLUTIONS['day'][1])
+    orders = {
+        '从旧到新，lateness=1': (pubdate.sort_values(), 1),
+        '从新到旧': (pubdate.sort_values(ascending=False), None),
+        '打乱顺序': (pubdate.sample(frac=1, random_state=0), None),
+    }
+    for name, (ordered, lateness) in orders.items():
+        stream = ActivityStream(lateness=lateness)
+        start_time = time.perf_counter()
+        for start in range(0, len(ordered), 20):
+            stream.update(ordered.iloc[start:start + 20])
+        stream.finish()
+        elapsed = time.perf_counter() - start_time
+        same = all(same_bursts(whole.bursts(resolution), stream.bursts(resolution)) for resolution in whole.counters)
+        late = sum(counter.late for counter in stream.counters.values())
+        daily = stream.counts('day')
+        print(f">>>分批输入（{name}，每批20条）：耗时 {elapsed * 1000:.0f} 毫秒，{len(ordered) / elapsed:,.0f} 条/秒，"
+              f"晚到 {late} 条，爆发事件与一次性输入一致：{same}，"
+              f"按天计数与value_counts一致：{daily[daily > 0].equals(daily_expected.rename(None).rename_axis(None))}")
+    print(stream.bursts('day').to_string(index=False))
@@ -1,19 +1,26 @@
 # 评论活跃度分析
 
 import matplotlib
-import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+import pandas as pd
+
+from activity_clustering import activity_histogram, optimal_partition
+from activity_stream import ActivityStream
+from data_loader import load_comments
+
+# 活跃段的颜色，按活跃段编号依次使用
+CLUSTER_COLORS = ['blue', 'green', 'red', 'orange', 'purple', 'brown', 'pink', 'gray', 'olive', 'cyan']
+# 活跃点统计的时段对应的pandas频率
+ACTIVITY_FREQ = {'minute': 'min', 'hour': 'h', 'day': 'D'}
 
 
 def load_data(file_path):
     """
-    加载评论数据，并将评论时间转换为datetime格式
+    加载评论数据，评论时间在清洗时已转换为datetime64
     :param file_path: 评论数据的文件路径
     :return: 数据框df
     """
-    df = pd.read_excel(file_path)
-    df['pubdate'] = pd.to_datetime(df['pubdate'], errors='coerce')
+    df = load_comments(file_path, columns=['pubdate'])
     df['日期'] = df['pubdate'].dt.date
     df['小时'] = df['pubdate'].dt.hour
     return df
@@ -43,40 +50,48 @@ def plot_hourly_comments(df):
     plt.show()
 
 
-def plot_active_points(df, threshold=100):
+def plot_active_points(df, resolution='day', threshold=3.0, min_count=5):
     """
-    根据评论数量的差异，找出评论数剧烈变化的点，并绘制带标记的评论数量趋势图
+    用流式活跃度统计（见activity_stream.py）找出评论数明显高于近期水平的时段（爆发），并绘制带标记的评论数量趋势图
     :param df: 数据框df，包含评论数据
-    :param threshold: 设定评论数量变化的阈值，默认值为100
+    :param resolution: 统计的时段，'minute'、'hour'或'day'
+    :param threshold: 爆发的阈值，以近期评论数的标准差为单位，与视频的评论规模无关，默认值为3
+    :param min_count: 爆发时段至少要有的评论数
+    :return: pd.DataFrame, 爆发事件
     """
-    daily_comments = df.groupby('日期').size()
-    comment_diff = daily_comments.diff()
-    activity_peaks = comment_diff[comment_diff > threshold]
+    stream = ActivityStream(resolutions=(resolution,), threshold=threshold, min_count=min_count)
+    stream.update(df['pubdate'].dropna())
+    stream.finish()
+    activity_peaks = stream.bursts(resolution)
 
+    # 趋势图画出全部时段，滚动计数只保留最近的时段
+    comments = df.groupby(df['pubdate'].dt.floor(ACTIVITY_FREQ[resolution])).size()
     plt.figure(figsize=(10, 6))
-    daily_comments.plot(kind='line', title='评论数量变化趋势', xlabel='日期', ylabel='评论数量')
-    plt.scatter(activity_peaks.index, activity_peaks.values, color='red', label='活跃点')
+    comments.plot(kind='line', title='评论数量变化趋势', xlabel='时间', ylabel='评论数量')
+    plt.scatter(activity_peaks['start'], activity_peaks['count'], color='red', label='活跃点')
     plt.legend()
     plt.xticks(rotation=45)
     plt.show()
+    return activity_peaks
 
 
-def plot_activity_clusters(df):
+def plot_activity_clusters(df, n_clusters=3, wrap=True):
     """
-    使用KMeans聚类分析评论活跃的时间段，并绘制聚类结果
+    按小时统计评论数，用一维最优划分把一天分为若干个活跃段（见activity_clustering.py），并绘制聚类结果
     :param df: 数据框df，包含评论数据
+    :param n_clusters: 活跃段的数量，默认值为3
+    :param wrap: 是否允许活跃段跨过午夜
+    :return: 每个小时所属的活跃段，0为一天中最早开始的活跃段
     """
-    # 删除包含NaN 的行
-    df = df.dropna(subset=['小时'])
-    X = df[['小时']].values
-    kmeans = KMeans(n_clusters=3)  # 聚成3个类
-    df['活跃段'] = kmeans.fit_predict(X)
+    hourly_comments = activity_histogram(df['pubdate'])
+    labels, _ = optimal_partition(hourly_comments, n_clusters, wrap=wrap)
 
     plt.figure(figsize=(10, 6))
-    df.groupby('小时').size().plot(kind='bar', color=df['活跃段'].map({0: 'blue', 1: 'green', 2: 'red'}),
-                                   title='评论数量按小时和活跃段分布', xlabel='小时', ylabel='评论数量')
+    pd.Series(hourly_comments).plot(kind='bar', color=[CLUSTER_COLORS[label % len(CLUSTER_COLORS)] for label in labels],
+                                    title='评论数量按小时和活跃段分布', xlabel='小时', ylabel='评论数量')
     plt.xticks(rotation=0)
     plt.show()
+    return labels
 
 
 if __name__ == '__main__':
@@ -87,7 +102,7 @@ if __name__ == '__main__':
     matplotlib.rcParams['axes.unicode_minus'] = False
 
     # 目标文件路径
-    file_path = '../data_processed/7.xlsx'  # 请替换成你实际的文件路径
+    file_path = '../data_processed/瓦努阿图（荒岛版）第1集：两天一夜，探索南太平洋无人岛，只为找到传说中的“牢底坐穿贝”.parquet'  # 请替换成你实际的文件路径
 
     # 加载数据
     df = load_data(file_path)
@@ -98,8 +113,8 @@ if __name__ == '__main__':
     # 绘制评论数量按小时分布的图
     plot_hourly_comments(df)
 
-    # 绘制带有活动点标记的评论数量趋势图
-    plot_active_points(df, threshold=100)
+    # 绘制带有活动点标记的评论数量趋势图，打印爆发事件
+    print(plot_active_points(df, resolution='hour', threshold=3.0))
 
     # 绘制聚类结果
     plot_activity_clusters(df)
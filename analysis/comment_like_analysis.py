@@ -1,20 +1,22 @@
 # 评论点赞数分析
 
-import jieba
 import matplotlib.pyplot as plt
-import pandas as pd
 import seaborn as sns
 from wordcloud import WordCloud
 
+from data_loader import load_comments
+from token_corpus import tokenize_texts
+
 
 # 加载数据函数
-def load_data(file_path):
+def load_data(file_path, columns=('contents', 'like_count')):
     """
-    加载xlsx文件并返回数据框
+    加载清洗后的数据文件并返回数据框
     :param file_path: str, 文件路径
+    :param columns: 需要读取的列
     :return: pd.DataFrame, 数据框
     """
-    data = pd.read_excel(file_path)
+    data = load_comments(file_path, columns=columns)
     return data
 
 
@@ -65,16 +67,14 @@ def get_top_comments(data, top_n=10):
 
 
 # 评论内容关键词分析函数
-def generate_wordcloud(data, font_path='msyh.ttc', stopwords_path='./stopwords.txt'):
+def generate_wordcloud(data, font_path='msyh.ttc', stopwords_path='./stopwords.txt', corpus=None):
     """
     生成热门评论的词云，并剔除无意义的助词
     :param data: pd.DataFrame, 数据框
     :param font_path: str, 字体路径
     :param stopwords_path: str, 停用词文件路径
+    :param corpus: TokenCorpus, 共享的分词结果，默认打开cache目录下的分词结果（见token_corpus.py）
     """
-    # 拼接所有热门评论内容
-    text = ' '.join(data['contents'])
-
     # 加载停用词
     try:
         with open(stopwords_path, 'r', encoding='utf-8') as f:
@@ -83,8 +83,9 @@ def generate_wordcloud(data, font_path='msyh.ttc', stopwords_path='./stopwords.t
         stopwords = set()
         print("警告：未找到停用词文件，停用词过滤将被跳过。")
 
-    # 分词并过滤停用词
-    words = [word for word in jieba.cut(text) if word not in stopwords and len(word) > 1]
+    # 热门评论的分词结果（已经分过词的评论直接读取），过滤停用词
+    words = [word for comment_words in tokenize_texts(data['contents'], corpus=corpus) for word in comment_words
+             if word not in stopwords and len(word) > 1]
 
     # 转换为字符串
     filtered_text = ' '.join(words)
@@ -119,7 +120,7 @@ def analyze_length_vs_likes(data):
 
 if __name__ == '__main__':
     # 文件路径
-    file_path = '../data_processed/7.xlsx'  # 替换为实际文件路径
+    file_path = '../data_processed/瓦努阿图（荒岛版）第1集：两天一夜，探索南太平洋无人岛，只为找到传说中的“牢底坐穿贝”.parquet'  # 替换为实际文件路径
 
     # 加载数据
     data = load_data(file_path)
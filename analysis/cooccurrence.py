@@ -0,0 +1,189 @@
+# 关键词共现
+# generate_topic_network原来对每条评论在Python循环中调用Counter.update(combinations(set(words), 2))，
+# 每个词还要在关键词列表中线性查找，关键词多到上千个、评论多时耗时随词对的数量增长。
+# 这里把评论和关键词表示为稀疏的 评论×关键词 关联矩阵X，一次稀疏矩阵乘法XᵀX得到所有关键词对同时出现的评论数，
+# 对角线为每个关键词出现的评论数；耗时取决于关联矩阵的非零元素个数，而不是词对的数量。
+# 也可以只统计在同一条评论中相距不超过window个词的关键词对，并按PMI/NPMI加权，直接返回边列表
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# 可选的边权重
+WEIGHTINGS = ('count', 'pmi', 'npmi')
+
+
+def _window_pairs(rows, cols, positions, window):
+    """
+    同一条评论中相距小于window个词的关键词对
+    :param rows: 关键词所在的评论，按评论和位置排序
+    :param cols: 关键词的编号
+    :param positions: 关键词在评论中的位置
+    :return: (评论, 关键词a, 关键词b)，a != b
+    """
+    pair_rows, firsts, seconds = [], [], []
+    for offset in range(1, window):
+        # 第i个关键词与它后面第offset个关键词配对，距离超出窗口或不在同一条评论时不配对；
+        # 关键词按位置排序，某个offset下没有配对时更大的offset也不会有
+        valid = (rows[offset:] == rows[:-offset]) & (positions[offset:] - positions[:-offset] < window)
+        if not valid.any():
+            break
+        pair_rows.append(rows[offset:][valid])
+        firsts.append(cols[:-offset][valid])
+        seconds.append(cols[offset:][valid])
+    if not pair_rows:
+        return (np.empty(0, dtype=np.int64),) * 3
+    pair_rows, firsts, seconds = (np.concatenate(parts) for parts in (pair_rows, firsts, seconds))
+    distinct = firsts != seconds
+    return pair_rows[distinct], firsts[distinct], seconds[distinct]
+
+
+def cooccurrence_matrix(ids, lengths, num_keywords, window=None):
+    """
+    关键词共现矩阵
+    :param ids: 所有评论的词拼接成的数组，值为关键词编号，不是关键词的词为-1
+    :param lengths: 每条评论的词数
+    :param num_keywords: 关键词个数
+    :param window: 为None时统计同时出现在一条评论中的关键词对，否则只统计相距小于window个词的关键词对
+    :return: (对称的csr共现矩阵，元素为关键词对共同出现的评论数，对角线为0；每个关键词出现的评论数)
+    """
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    is_keyword = ids >= 0
+    rows, cols, positions = rows[is_keyword], ids[is_keyword], positions[is_keyword]
+    shape = (len(lengths), num_keywords)
+    # 评论×关键词的0/1关联矩阵，同一条评论中重复出现的关键词只算一次
+    incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape)
+    incidence.data[:] = 1
+    document_frequency = np.asarray(incidence.sum(axis=0)).ravel()
+    if window is None:
+        matrix = (incidence.T @ incidence).tocsr()
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        return matrix, document_frequency
+
+    if window < 2:
+        raise ValueError(f"window至少为2，当前为：{window}")
+    pair_rows, firsts, seconds = _window_pairs(rows, cols, positions, window)
+    # 每条评论中的每个关键词对只算一次
+    lower, upper = np.minimum(firsts, seconds), np.maximum(firsts, seconds)
+    pairs = np.unique(np.stack([pair_rows, lower, upper]), axis=1)
+    ones = np.ones(pairs.shape[1], dtype=np.int32)
+    matrix = sparse.coo_matrix((ones, (pairs[1], pairs[2])), shape=(num_keywords, num_keywords)).tocsr()
+    return (matrix + matrix.T).tocsr(), document_frequency
+
+
+def _edges(matrix, document_frequency, num_documents, keywords, weighting, min_count):
+    """
+    共现矩阵转换为边列表，每个关键词对一行
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"不支持的权重：{weighting}，可选 {list(WEIGHTINGS)}")
+    upper = sparse.triu(matrix, k=1).tocoo()
+    keep = upper.data >= min_count
+    first, second, count = upper.row[keep], upper.col[keep], upper.data[keep].astype(np.int64)
+    weight = count.astype(np.float64)
+    if weighting != 'count':
+        # PMI = log(p(a, b) / (p(a) p(b)))，概率按评论数计算
+        joint = count / num_documents
+        pmi = np.log(joint) - np.log(document_frequency[first] / num_documents) \
+            - np.log(document_frequency[second] / num_documents)
+        if weighting == 'pmi':
+            weight = pmi
+        else:
+            # NPMI = PMI / -log p(a, b)，p(a, b) = 1时两个词总是同时出现，记为1
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weight = np.where(joint < 1, pmi / -np.log(joint), 1.0)
+    keywords = np.asarray(keywords, dtype=object)
+    edges = pd.DataFrame({'source': keywords[first], 'target': keywords[second], 'count': count, 'weight': weight})
+    return edges.sort_values(['count', 'source', 'target'], ascending=[False, True, True], ignore_index=True)
+
+
+def encode_keywords(token_lists, keywords):
+    """
+    把分词结果转换为关键词编号
+    :param token_lists: 每条评论的词列表
+    :param keywords: 关键词列表，不要有重复
+    :return: (所有评论的词拼接成的关键词编号数组，不是关键词的词为-1；每条评论的词数)
+    """
+    lengths = np.fromiter((len(words) for words in token_lists), dtype=np.int64, count=len(token_lists))
+    words = pd.Index([word for words in token_lists for word in words], dtype=object)
+    return pd.Index(keywords, dtype=object).get_indexer(words), lengths
+
+
+def keyword_cooccurrence(token_lists, keywords, window=None, weighting='count', min_count=1):
+    """
+    关键词共现的边列表
+    :param token_lists: 每条评论的词列表（见token_corpus.tokenize_texts）
+    :param keywords: 关键词列表，不要有重复
+    :param window: 为None时统计同时出现在一条评论中的关键词对，否则只统计在一条评论中相距小于window个词的关键词对
+    :param weighting: 边的权重，'count'为共现的评论数，'pmi'为点互信息，'npmi'为归一化的点互信息（-1到1）
+    :param min_count: 共现的评论数的最小值，小于它的关键词对不返回
+    :return: pd.DataFrame，列为source、target、count（共现的评论数）、weight，按count从大到小排列
+    """
+    keywords = list(keywords)
+    ids, lengths = encode_keywords(token_lists, keywords)
+    matrix, document_frequency = cooccurrence_matrix(ids, lengths, len(keywords), window)
+    return _edges(matrix, document_frequency, len(lengths), keywords, weighting, min_count)
+
+
+def corpus_cooccurrence(corpus, texts, keywords, window=None, weighting='count', min_count=1):
+    """
+    与keyword_cooccurrence相同，直接使用共享分词结果中的词编号，不需要先转换为词列表
+    :param corpus: token_corpus.TokenCorpus
+    :param texts: 评论内容
+    """
+    keywords = list(keywords)
+    ids, lengths = corpus.encode(texts)
+    corpus.save()
+    # 词表中每个词对应的关键词编号
+    lookup = pd.Index(keywords, dtype=object).get_indexer(pd.Index(corpus.vocabulary, dtype=object))
+    matrix, document_frequency = cooccurrence_matrix(lookup[ids], lengths, len(keywords), window)
+    return _edges(matrix, document_frequency, len(lengths), keywords, weighting, min_count)
+
+
+if __name__ == '__main__':
+    # 测速：所有评论上出现最多的1000个关键词，原来的Counter循环与稀疏矩阵的耗时，并检查共现次数一致
+    import tempfile
+    import time
+    from collections import Counter
+    from itertools import combinations
+    from pathlib import Path
+
+    from token_corpus import TokenCorpus
+
+    texts = pd.concat([pd.read_parquet(file, columns=['contents'])
+                       for file in sorted(Path('../data_processed').glob('*.parquet'))])['contents'].tolist()
+    with open('stopwords.txt', 'r', encoding='utf-8') as f:
+        stopwords = set(line.strip() for line in f)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = TokenCorpus('jieba', Path(tmp) / 'tokens.npz')
+        token_lists = corpus.token_lists(texts)
+        frequency = Counter(word for words in token_lists for word in words if word not in stopwords and len(word) > 1)
+        for top_n in (15, 1000):
+            keywords = [word for word, _ in frequency.most_common(top_n)]
+            start_time = time.perf_counter()
+            expected = Counter()
+            for comment_words in token_lists:
+                words = [word for word in comment_words if word in keywords and word not in stopwords]
+                expected.update(combinations(set(words), 2))
+            baseline = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            edges = corpus_cooccurrence(corpus, texts, keywords)
+            elapsed = time.perf_counter() - start_time
+            # set的遍历顺序不固定，同一个关键词对在Counter中可能以两种顺序出现
+            counts = Counter()
+            for pair, count in expected.items():
+                counts[frozenset(pair)] += count
+            same = len(edges) == len(counts) and all(
+                counts[frozenset((source, target))] == count
+                for source, target, count in edges[['source', 'target', 'count']].itertuples(index=False))
+            print(f">>>{len(texts)} 条评论，{top_n} 个关键词，{len(edges)} 个关键词对：Counter循环 {baseline:.2f} 秒，"
+                  f"稀疏矩阵 {elapsed:.3f} 秒（加速 {baseline / elapsed:.0f} 倍），结果一致：{same}")
+
+        start_time = time.perf_counter()
+        windowed = corpus_cooccurrence(corpus, texts, keywords, window=5, weighting='npmi', min_count=5)
+        elapsed = time.perf_counter() - start_time
+        print(f">>>相距小于5个词的共现（NPMI加权，至少5条评论）：{len(windowed)} 个关键词对，耗时 {elapsed:.3f} 秒")
+        print(windowed.sort_values('weight', ascending=False).head(10).to_string(index=False))
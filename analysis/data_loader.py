@@ -0,0 +1,86 @@
+# 清洗后评论数据的统一加载
+# 各分析模块原来各自用pd.read_excel读取清洗后的表格，解析Excel很慢，而且每次运行分析都要重新解析。
+# 清洗阶段改为输出带类型的Parquet文件（like_count为int64，pubdate为datetime64），这里统一读取：只读取需要的列，用内存映射读取文件，
+# 旧的Excel表格仍然可以读取
+
+from pathlib import Path
+
+import pandas as pd
+
+# 清洗后数据所在目录
+PROCESSED_DIR = '../data_processed'
+# 支持的文件格式，按优先顺序排列
+SUFFIXES = ('.parquet', '.feather', '.xlsx')
+# 清洗时标记的重复簇代表评论（见data_cleansing/near_duplicates.py），每个簇只算一次时只保留这些行
+REPRESENTATIVE_COLUMN = 'dup_representative'
+
+
+def processed_path(name, data_dir=PROCESSED_DIR):
+    """
+    根据视频标题（原始文件名）找到清洗后的数据文件，有多种格式时优先使用Parquet
+    :param name: 视频标题，或带后缀的文件名
+    :param data_dir: 清洗后数据所在目录
+    :return: 文件路径
+    """
+    path = Path(data_dir) / name
+    if path.suffix in SUFFIXES and path.exists():
+        return path
+    for suffix in SUFFIXES:
+        candidate = Path(data_dir) / f'{name}{suffix}'
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(f"没有找到清洗后的数据：{path}（{'/'.join(SUFFIXES)}）")
+
+
+def load_comments(file_path, columns=None, memory_map=True, dedupe=False):
+    """
+    加载清洗后的评论数据
+    :param file_path: 数据文件路径，后缀为.parquet/.feather/.xlsx
+    :param columns: 需要读取的列，None表示全部列；Parquet和Feather只读取这些列
+    :param memory_map: 是否用内存映射读取Parquet和Feather文件
+    :param dedupe: 是否每个近似重复的簇只保留代表评论，刷屏评论只算一次；没有标记重复簇的旧数据不做处理
+    :return: 数据框df
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    columns = list(columns) if columns is not None else None
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        schema = pq.read_schema(file_path)
+        table = pq.read_table(file_path, columns=_with_flag(columns, schema.names, dedupe), memory_map=memory_map)
+        return _dedupe(table.to_pandas(), columns, dedupe)
+    if suffix == '.feather':
+        import pyarrow.feather as feather
+
+        table = feather.read_table(file_path, memory_map=memory_map)
+        table = table.select(_with_flag(columns, table.column_names, dedupe) or table.column_names)
+        return _dedupe(table.to_pandas(), columns, dedupe)
+    if suffix == '.xlsx':
+        # 旧的Excel表格中发布时间是文字，转换为与Parquet相同的datetime64
+        df = pd.read_excel(file_path, usecols=columns)
+        if 'pubdate' in df:
+            df['pubdate'] = pd.to_datetime(df['pubdate'], errors='coerce')
+        return df
+    raise ValueError(f"不支持的数据格式：{suffix}，可选 {list(SUFFIXES)}")
+
+
+def _with_flag(columns, available, dedupe):
+    """
+    需要去重时，在读取的列中加上代表评论的标记
+    """
+    if columns is None or not dedupe or REPRESENTATIVE_COLUMN not in available or REPRESENTATIVE_COLUMN in columns:
+        return columns
+    return columns + [REPRESENTATIVE_COLUMN]
+
+
+def _dedupe(df, columns, dedupe):
+    """
+    只保留每个重复簇的代表评论，并去掉不是调用方要求读取的标记列
+    """
+    if not dedupe or REPRESENTATIVE_COLUMN not in df:
+        return df
+    df = df[df[REPRESENTATIVE_COLUMN]].reset_index(drop=True)
+    if columns is not None and REPRESENTATIVE_COLUMN not in columns:
+        df = df.drop(columns=REPRESENTATIVE_COLUMN)
+    return df
@@ -0,0 +1,265 @@
+# 全部视频的关键词索引
+# extract_keywords只统计一个视频的词频，每个视频排在前面的都是"视频""真的"这类通用的词；
+# 要比较不同视频，还得重新读取、重新分词所有数据。
+# 这里对data_processed中的所有视频建立一个保存在磁盘上的索引：每个视频的词频（视频×词的稀疏矩阵）和每个词出现在几个视频中，
+# 清洗出新的视频（或某个视频重新清洗）后只更新这个视频，分词结果取自共享的分词结果（见token_corpus.py），已分过词的评论不再分词；
+# 查询时按TF-IDF或BM25给一个视频或所有视频的词打分，只涉及稀疏矩阵的一行或几行运算
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from data_loader import PROCESSED_DIR, load_comments
+from token_corpus import CORPUS_DIR, load_corpus
+
+# 可选的打分方式
+SCHEMES = ('count', 'tfidf', 'bm25')
+
+
+def file_hash(path):
+    """
+    文件内容的哈希，用来判断视频是否重新清洗过
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class KeywordIndex:
+    """
+    关键词索引：counts[i, j]为第i个视频videos[i]中词terms[j]出现的次数
+    """
+
+    def __init__(self, path=None, corpus=None, dedupe=True):
+        """
+        :param path: 索引文件，默认为cache目录下以分词方式标识命名的.npz文件
+        :param corpus: 共享的分词结果TokenCorpus，默认打开cache目录下的jieba分词结果
+        :param dedupe: 是否每个近似重复的簇（刷屏评论）只算一次
+        """
+        self.corpus = corpus if corpus is not None else load_corpus()
+        self.dedupe = dedupe
+        self.tag = f"{self.corpus.tag}-{'dedupe' if dedupe else 'all'}"
+        self.path = Path(path or Path(CORPUS_DIR) / f'keywords-{self.tag}.npz')
+        self.videos = []
+        self.hashes = []
+        self.terms = pd.Index([], dtype=object)
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self._changed = False
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        with np.load(self.path) as data:
+            if str(data['tag']) != self.tag:
+                # 分词方式变化，旧的索引作废
+                return
+            self.videos = data['videos'].tolist()
+            self.hashes = data['hashes'].tolist()
+            self.terms = pd.Index(data['terms'].tolist(), dtype=object)
+            self.counts = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                            shape=(len(self.videos), len(self.terms)))
+
+    def save(self):
+        """
+        保存索引（有更新时），先写临时文件再替换
+        """
+        if not self._changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, tag=np.array(self.tag), videos=np.array(self.videos, dtype=str),
+                 hashes=np.array(self.hashes, dtype=str), terms=np.array(list(self.terms), dtype=str),
+                 data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr)
+        os.replace(tmp_path, self.path)
+        self._changed = False
+
+    def _term_counts(self, texts):
+        """
+        一个视频的词频：词（去掉单字）-> 次数
+        """
+        ids, _ = self.corpus.encode(texts)
+        words = pd.Index(self.corpus.vocabulary, dtype=object)
+        counts = np.bincount(ids, minlength=len(words))
+        present = (counts > 0) & (words.str.len() > 1)
+        return pd.Series(counts[present], index=words[present])
+
+    def update(self, data_dir=PROCESSED_DIR):
+        """
+        更新索引：新增或重新清洗过的视频重新统计词频，已不存在的视频从索引中删除
+        :param data_dir: 清洗后数据所在目录
+        :return: (更新的视频列表, 删除的视频列表)
+        """
+        files = {path.stem: path for path in sorted(Path(data_dir).glob('*.parquet'))}
+        removed = [video for video in self.videos if video not in files]
+        rows = {video: self.counts[row] for row, video in enumerate(self.videos) if video in files}
+        hashes = {video: self.hashes[row] for row, video in enumerate(self.videos) if video in files}
+
+        updated, new_counts = [], {}
+        for video, path in files.items():
+            digest = file_hash(path)
+            if hashes.get(video) == digest:
+                continue
+            contents = load_comments(path, columns=['contents'], dedupe=self.dedupe)['contents']
+            new_counts[video] = self._term_counts(contents)
+            hashes[video] = digest
+            updated.append(video)
+        self.corpus.save()
+        if not updated and not removed:
+            return updated, removed
+
+        # 新出现的词追加到词表末尾
+        new_terms = pd.Index([word for counts in new_counts.values() for word in counts.index], dtype=object).unique()
+        terms = self.terms.append(new_terms[~new_terms.isin(self.terms)])
+        blocks, videos = [], []
+        for video in files:
+            if video in new_counts:
+                counts = new_counts[video]
+                columns = terms.get_indexer(counts.index)
+                blocks.append(sparse.csr_matrix((counts.to_numpy(), (np.zeros(len(columns), dtype=np.int64), columns)),
+                                                shape=(1, len(terms))))
+            else:
+                row = rows[video]
+                blocks.append(sparse.csr_matrix((row.data, row.indices, row.indptr), shape=(1, len(terms))))
+            videos.append(video)
+        counts = sparse.vstack(blocks, format='csr', dtype=np.int64)
+        # 删除的视频和重新统计的视频中不再出现的词，如果其他视频中也没有，从词表中去掉，词表不会只增不减
+        document_frequency = np.bincount(counts.indices, minlength=len(terms))
+        if not document_frequency.all():
+            keep = np.flatnonzero(document_frequency)
+            counts, terms = counts[:, keep], terms[keep]
+        self.counts = counts
+        self.videos = videos
+        self.hashes = [hashes[video] for video in videos]
+        self.terms = terms
+        self._changed = True
+        return updated, removed
+
+    def _scores(self, rows, scheme, k1=1.2, b=0.75):
+        """
+        给视频中的词打分
+        :param rows: 视频的行号
+        :return: 稀疏矩阵，行为视频，列为词
+        """
+        if scheme not in SCHEMES:
+            raise ValueError(f"不支持的打分方式：{scheme}，可选 {list(SCHEMES)}")
+        counts = self.counts[rows].astype(np.float64)
+        if scheme == 'count':
+            return counts
+        num_videos = len(self.videos)
+        # 每个词出现在几个视频中
+        document_frequency = np.bincount(self.counts.indices, minlength=len(self.terms))
+        lengths = np.asarray(self.counts.sum(axis=1)).ravel()
+        row_lengths = lengths[rows]
+        coo = counts.tocoo()
+        tf = coo.data
+        df = document_frequency[coo.col]
+        if scheme == 'tfidf':
+            # 词频按视频的总词数归一化，IDF平滑后加一（与sklearn的TfidfVectorizer相同）
+            idf = np.log((1 + num_videos) / (1 + df)) + 1
+            values = tf / row_lengths[coo.row] * idf
+        else:
+            idf = np.log(1 + (num_videos - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * row_lengths[coo.row] / lengths.mean())
+            values = idf * tf * (k1 + 1) / (tf + norm)
+        return sparse.csr_matrix((values, (coo.row, coo.col)), shape=counts.shape)
+
+    def _term_mask(self, stopwords):
+        """
+        可以作为关键词的词：不是停用词
+        """
+        if not stopwords:
+            return np.ones(len(self.terms), dtype=bool)
+        return ~self.terms.isin(list(stopwords))
+
+    def top_keywords(self, video, top_n=20, scheme='tfidf', stopwords=None):
+        """
+        一个视频的关键词
+        :param video: 视频标题（清洗后数据的文件名，不含后缀）
+        :param top_n: 关键词数量
+        :param scheme: 'count'为词频（与extract_keywords相同），'tfidf'为TF-IDF，'bm25'为BM25
+        :param stopwords: 停用词集合
+        :return: list of tuples, 关键词及其得分，按得分从大到小排列
+        """
+        return self.top_keywords_all(top_n, scheme, stopwords, videos=[video])[video]
+
+    def top_keywords_all(self, top_n=20, scheme='tfidf', stopwords=None, videos=None):
+        """
+        每个视频的关键词
+        :param videos: 视频标题列表，默认为所有视频
+        :return: {视频标题: list of tuples}
+        """
+        videos = self.videos if videos is None else list(videos)
+        missing = [video for video in videos if video not in self.videos]
+        if missing:
+            raise KeyError(f"索引中没有这些视频：{missing}，请先调用update()")
+        rows = [self.videos.index(video) for video in videos]
+        scores = self._scores(rows, scheme)
+        mask = self._term_mask(stopwords)
+        result = {}
+        for video, row in zip(videos, range(len(rows))):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end]
+            keep = mask[columns]
+            columns, values = columns[keep], values[keep]
+            # 先用argpartition取出前top_n个再排序；得分相同时按词在词表中的顺序
+            if len(values) > top_n:
+                candidates = np.argpartition(-values, top_n - 1)[:top_n]
+                columns, values = columns[candidates], values[candidates]
+            order = np.lexsort((columns, -values))
+            result[video] = [(self.terms[column], float(value)) for column, value in zip(columns[order], values[order])]
+        return result
+
+
+if __name__ == '__main__':
+    # 建立（或增量更新）所有视频的关键词索引，再模拟清洗出一个新视频后的增量更新，比较查询耗时
+    import shutil
+    import tempfile
+    import time
+
+    with open('stopwords.txt', 'r', encoding='utf-8') as f:
+        stopwords = set(line.strip() for line in f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / 'data_processed'
+        data_dir.mkdir()
+        files = sorted(Path(PROCESSED_DIR).glob('*.parquet'))
+        for path in files[:-1]:
+            shutil.copy(path, data_dir)
+        corpus = load_corpus(path=Path(tmp) / 'tokens.npz')
+        index = KeywordIndex(Path(tmp) / 'keywords.npz', corpus=corpus)
+
+        start_time = time.perf_counter()
+        updated, _ = index.update(data_dir)
+        index.save()
+        print(f">>>建立索引：{len(updated)} 个视频，{len(index.terms)} 个词，耗时 {time.perf_counter() - start_time:.2f} 秒")
+
+        shutil.copy(files[-1], data_dir)
+        start_time = time.perf_counter()
+        index = KeywordIndex(Path(tmp) / 'keywords.npz', corpus=load_corpus(path=Path(tmp) / 'tokens.npz'))
+        updated, _ = index.update(data_dir)
+        index.save()
+        print(f">>>新增一个视频后增量更新：更新 {updated}，耗时 {time.perf_counter() - start_time:.2f} 秒，"
+              f"{len(index.terms)} 个词")
+
+        for scheme in SCHEMES:
+            start_time = time.perf_counter()
+            keywords = index.top_keywords_all(top_n=8, scheme=scheme, stopwords=stopwords)
+            elapsed = time.perf_counter() - start_time
+            print(f">>>{scheme}（{len(keywords)} 个视频，耗时 {elapsed * 1000:.1f} 毫秒）：")
+            for video, words in keywords.items():
+                print(f"   {video[:20]}：{' '.join(word for word, _ in words)}")
+
+        # 删除新增的视频后，只在它的评论中出现的词也从词表中去掉，与没有添加过这个视频时的索引相同
+        (data_dir / files[-1].name).unlink()
+        _, removed = index.update(data_dir)
+        rebuilt = KeywordIndex(Path(tmp) / 'rebuilt.npz', corpus=index.corpus)
+        rebuilt.update(data_dir)
+        same = index.terms.sort_values().equals(rebuilt.terms.sort_values()) and \
+            (index.counts[:, index.terms.get_indexer(rebuilt.terms)] != rebuilt.counts).nnz == 0
+        print(f">>>删除视频 {removed}：{len(index.terms)} 个词，与重新建立的索引一致：{same}")
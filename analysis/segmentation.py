@@ -0,0 +1,146 @@
+# 多进程jieba分词
+# jieba在第一次调用jieba.cut时才加载词典、构建前缀词典，每个分析脚本都要付一次这个开销，之后也只在一个CPU核上分词；
+# jieba自带的jieba.enable_parallel只能切分一整段文本，不能保留每条评论的分词结果，也不支持Windows。
+# 这里用一个常驻的进程池分词：每个工作进程只初始化一次jieba，只加载一次用户词典和停用词，
+# 评论分块交给各进程并行分词，按输入顺序返回每条评论的词列表。
+# 可以作为共享分词结果的分词函数（见token_corpus.TokenCorpus），只有没有分过词的评论才交给进程池
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+
+# 工作进程中已初始化的分词函数
+_cut = None
+# 工作进程中加载的停用词
+_stopwords = frozenset()
+
+
+def _init_worker(user_dict=None, stopwords_path=None):
+    """
+    工作进程初始化：加载jieba词典、用户词典和停用词，每个进程只加载一次
+    :param user_dict: jieba用户词典的路径
+    :param stopwords_path: 停用词文件的路径，为None时不过滤停用词
+    """
+    global _cut, _stopwords
+    import jieba
+
+    tokenizer = jieba.Tokenizer()
+    tokenizer.initialize()
+    if user_dict:
+        tokenizer.load_userdict(user_dict)
+    if stopwords_path:
+        with open(stopwords_path, 'r', encoding='utf-8') as f:
+            _stopwords = frozenset(line.strip() for line in f)
+    _cut = tokenizer.cut
+
+
+def _segment_chunk(texts):
+    """
+    给一块评论分词，在工作进程中执行；去掉空白和停用词
+    """
+    return [[word for word in _cut(text) if word.strip() and word not in _stopwords] for text in texts]
+
+
+def segmenter_tag(user_dict=None, stopwords_path=None):
+    """
+    分词方式的标识：jieba的版本，加上用户词典和停用词文件的哈希，它们变化时分词结果需要重新生成
+    """
+    tag = f"jieba-{version('jieba')}"
+    for name, path in (('dict', user_dict), ('stop', stopwords_path)):
+        if path:
+            with open(path, 'rb') as f:
+                tag += f"-{name}{hashlib.sha1(f.read()).hexdigest()[:8]}"
+    return tag
+
+
+class Segmenter:
+    """
+    常驻的分词进程池
+    """
+
+    def __init__(self, workers=None, chunk_size=500, user_dict=None, stopwords_path=None):
+        """
+        :param workers: 进程数，默认为CPU核数；为1时在当前进程中分词
+        :param chunk_size: 每次交给工作进程的评论数
+        :param user_dict: jieba用户词典的路径
+        :param stopwords_path: 停用词文件的路径，为None时不过滤停用词
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.tag = segmenter_tag(user_dict, stopwords_path)
+        self._pool = None
+        if self.workers == 1:
+            _init_worker(user_dict, stopwords_path)
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(user_dict, stopwords_path))
+
+    def segment(self, texts):
+        """
+        分词
+        :param texts: 评论内容的列表
+        :return: 每条评论的词列表，与texts一一对应
+        """
+        chunks = [texts[start:start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+        if self._pool is None:
+            results = [_segment_chunk(chunk) for chunk in chunks]
+        else:
+            results = self._pool.map(_segment_chunk, chunks)
+        return [words for chunk in results for words in chunk]
+
+    def warm_up(self):
+        """
+        等待所有工作进程完成初始化，测速时不计入词典加载的时间
+        """
+        if self._pool is not None:
+            list(self._pool.map(_segment_chunk, [['预热']] * self.workers))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    # 测速：extract_keywords原来的做法（拼接所有评论后jieba.cut，包括第一次调用时加载词典）与进程池分词的速度，
+    # 并检查两者统计出的关键词一致
+    import time
+    from collections import Counter
+    from pathlib import Path
+
+    import pandas as pd
+
+    texts = pd.concat([pd.read_parquet(file, columns=['contents'])
+                       for file in sorted(Path('../data_processed').glob('*.parquet'))])['contents'].tolist()
+    stopwords_path = 'stopwords.txt'
+    with open(stopwords_path, 'r', encoding='utf-8') as f:
+        stopwords = set(line.strip() for line in f)
+    print(f">>>{len(texts)} 条评论，{os.cpu_count()} 个CPU核")
+
+    import jieba
+
+    start_time = time.perf_counter()
+    words = [word for word in jieba.cut(' '.join(texts)) if word not in stopwords and len(word) > 1]
+    baseline = time.perf_counter() - start_time
+    expected = Counter(words).most_common(20)
+    print(f">>>jieba.cut拼接后的文本（含加载词典）: 耗时 {baseline:.2f} 秒，{len(texts) / baseline:,.0f} 条/秒")
+
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        start_time = time.perf_counter()
+        with Segmenter(workers=workers, stopwords_path=stopwords_path) as segmenter:
+            segmenter.warm_up()
+            startup = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            token_lists = segmenter.segment(texts)
+            elapsed = time.perf_counter() - start_time
+        keywords = Counter(word for words in token_lists for word in words if len(word) > 1).most_common(20)
+        print(f">>>进程池分词 {workers} 个进程: 初始化 {startup:.2f} 秒，分词 {elapsed:.2f} 秒，"
+              f"{len(texts) / elapsed:,.0f} 条/秒，加速 {baseline / (startup + elapsed):.1f} 倍，"
+              f"关键词一致：{keywords == expected}")
@@ -5,11 +5,17 @@ import pandas as pd
 import seaborn as sns
 from snownlp import SnowNLP
 
+from data_loader import load_comments
+from sentiment_cache import SentimentCache
+from sentiment_scoring import model_tag, score_texts
 
-def load_data(file_path):
+
+def load_data(file_path, columns=('contents', 'pubdate', 'like_count'), dedupe=False):
     """
     加载评论数据
     :param file_path: 评论数据的文件路径
+    :param columns: 需要读取的列
+    :param dedupe: 是否每个近似重复的簇（刷屏评论）只算一次
     :return: 数据框df
     """
     # 读取表格数据显示设置
@@ -17,7 +23,7 @@ def load_data(file_path):
     pd.set_option('display.width', None)  # 不限宽度，显示整齐
     pd.set_option('display.max_colwidth', None)  # 显示完整内容
 
-    df = pd.read_excel(file_path)
+    df = load_comments(file_path, columns=columns, dedupe=dedupe)
     print(df.head(n=1))  # 测试
 
     return df
@@ -91,9 +97,7 @@ def plot_comment_sentiment_trends():
     绘制并展示评论与情感得分的时间趋势的折线图
     :return: 无
     """
-    # 转换评论时间为datetime格式
-    # errors='coerce' 遇到无法转换的值，将其转换为NaT（Not a Time）
-    data['pubdate'] = pd.to_datetime(data['pubdate'], errors='coerce')
+    # 评论时间在清洗时已转换为datetime64，无法解析的为NaT（Not a Time），分组时会被忽略
 
     # 按日期进行分组，统计每日评论数量及平均情感得分
     # groupby 根据某一列或多个列对数据进行分组
@@ -167,14 +171,20 @@ def plot_sentiment_like_heatmap():
 
 
 if __name__ == '__main__':
-    # 加载评论数据
-    data = load_data(file_path='../data_processed/7.xlsx')
+    # 加载评论数据，刷屏评论每个簇只算一次，避免左右情感均值
+    data = load_data(file_path='../data_processed/瓦努阿图（荒岛版）第1集：两天一夜，探索南太平洋无人岛，只为找到传说中的“牢底坐穿贝”.parquet',
+                     dedupe=True)
 
     # 设置Seaborn的绘图风格
     # 明确指定Seaborn使用支持中文的字体 whitegrid ，是其中的一种风格，它会在图表北京添加白色网格，更容易地查看图中的数据分布
     sns.set(style="whitegrid", font='SimHei', rc={"axes.unicode_minus": False})
-    # 对所有评论进行情感分析
-    data['sentiment_score'] = data['contents'].apply(snownlp_sentiment)
+    # 对所有评论进行情感分析，用进程池批量打分，结果与逐行调用snownlp_sentiment相同；
+    # 之前打过分的评论直接使用缓存中的得分，重新爬取后只给新增的评论打分
+    with SentimentCache(model_tag()) as cache:
+        data['sentiment_score'] = score_texts(data['contents'], cache=cache)
+        print(f">>>情感得分缓存：{cache.stats()}")
+    # 清洗后为空的评论（只有表情等）没有情感得分，不参与统计
+    data = data[data['sentiment_score'].notna()]
 
     # 测试
     plot_sentiment_distribution()
@@ -0,0 +1,124 @@
+# 情感得分缓存
+# 每次运行情感分析都要重新给所有评论打分，包括同一个视频里反复出现的刷屏评论，以及重新爬取后没有变化的评论。
+# 这里把得分保存在SQLite数据库中，键为 情感模型标识 + 规范化后评论内容的哈希，
+# 批量查询和写入，模型变化时标识不同，旧的得分不会被误用；需要时可以显式清除某个模型的得分
+
+import hashlib
+import sqlite3
+import unicodedata
+from pathlib import Path
+
+# 默认的缓存文件，cache目录不提交到仓库
+CACHE_PATH = '../cache/sentiment_scores.sqlite'
+# 每次查询的评论数，不超过SQLite单条语句的参数个数上限（旧版本为999）
+QUERY_BATCH = 900
+
+
+def normalize_text(text):
+    """
+    规范化评论内容：统一Unicode表示并去掉首尾空白，这些差异不影响情感得分
+    """
+    return unicodedata.normalize('NFC', text).strip()
+
+
+def text_key(text):
+    """
+    评论内容的哈希，作为缓存的键
+    :param text: 规范化后的评论内容
+    """
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+class SentimentCache:
+    """
+    情感得分缓存，记录每个模型下 评论内容哈希 -> 得分，并统计命中和未命中的次数
+    """
+
+    def __init__(self, model, path=CACHE_PATH):
+        """
+        :param model: 情感模型的标识（见sentiment_scoring.model_tag），模型或打分方式变化时标识必须不同
+        :param path: SQLite数据库文件
+        """
+        self.model = model
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                model TEXT NOT NULL,
+                key BLOB NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts):
+        """
+        批量查询得分
+        :param texts: 规范化后的评论内容，不要有重复
+        :return: {评论内容: 得分}，只包含缓存中有的评论
+        """
+        texts = list(texts)
+        found = {}
+        for start in range(0, len(texts), QUERY_BATCH):
+            batch = {text_key(text): text for text in texts[start:start + QUERY_BATCH]}
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(f"SELECT key, score FROM scores WHERE model = ? AND key IN ({placeholders})",
+                                     [self.model, *batch])
+            found.update((batch[key], score) for key, score in rows)
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        批量写入得分，在一个事务中完成
+        :param items: (规范化后的评论内容, 得分) 的可迭代对象
+        """
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO scores (model, key, score) VALUES (?, ?, ?)",
+                                  ((self.model, text_key(text), float(score)) for text, score in items))
+
+    def invalidate(self, model=None):
+        """
+        清除一个模型的所有得分
+        :param model: 模型标识，默认为当前模型；为'*'时清除所有模型的得分
+        :return: 清除的条数
+        """
+        with self.conn:
+            if model == '*':
+                cursor = self.conn.execute("DELETE FROM scores")
+            else:
+                cursor = self.conn.execute("DELETE FROM scores WHERE model = ?", (model or self.model,))
+        return cursor.rowcount
+
+    def size(self, model=None):
+        """
+        缓存中一个模型的得分条数，默认为当前模型
+        """
+        return self.conn.execute("SELECT COUNT(*) FROM scores WHERE model = ?", (model or self.model,)).fetchone()[0]
+
+    def stats(self):
+        """
+        命中统计
+        """
+        total = self.hits + self.misses
+        return {
+            'model': self.model,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': self.size(),
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
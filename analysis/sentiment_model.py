@@ -0,0 +1,147 @@
+# 向量化的朴素贝叶斯情感分类
+# SnowNLP的情感分类（snownlp.classification.bayes.Bayes.classify）对每条评论逐个词查词频、取对数、累加，全部是Python代码。
+# 这里把同一个训练好的模型一次性读入NumPy数组：词表索引，以及每个词在正面和负面类别中的对数似然之差，
+# 一批分好词的评论用一次分段求和（相当于 词频稀疏矩阵 × 权重向量）算出所有得分，与SnowNLP(text).sentiments一致。
+# 分词仍然使用SnowNLP的分词（与原来的得分保持一致），这是情感打分中最耗时的部分
+
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+
+def tokenize(text):
+    """
+    与SnowNLP情感分类相同的分词：snownlp.seg分词后去掉停用词
+    """
+    from snownlp import normal, seg
+
+    return normal.filter_stop(seg.seg(text))
+
+
+class NaiveBayesSentiment:
+    """
+    SnowNLP情感模型的NumPy实现
+    朴素贝叶斯的正面概率为 sigmoid(bias + Σ weights[词])，其中
+    bias = log(正面词数总和) - log(负面词数总和)，weights[词] = log(正面词频) - log(负面词频)，
+    词频按SnowNLP的加一平滑计算（没有出现过的词计数为1）
+    """
+
+    def __init__(self, classifier=None):
+        """
+        :param classifier: snownlp的Bayes分类器，默认为snownlp.sentiment中已加载的模型
+        """
+        if classifier is None:
+            from snownlp import sentiment
+
+            classifier = sentiment.classifier.classifier
+        if set(classifier.d) != {'pos', 'neg'}:
+            raise ValueError(f"只支持正面/负面两类的模型，模型的类别为：{sorted(classifier.d)}")
+        pos, neg = classifier.d['pos'], classifier.d['neg']
+        self.vocabulary = pd.Index(sorted(set(pos.d) | set(neg.d)))
+        pos_counts = np.array([pos.d.get(word, pos.none) for word in self.vocabulary], dtype=np.float64)
+        neg_counts = np.array([neg.d.get(word, neg.none) for word in self.vocabulary], dtype=np.float64)
+        self.pos_log_likelihood = np.log(pos_counts / pos.total)
+        self.neg_log_likelihood = np.log(neg_counts / neg.total)
+        # 最后一个位置是词表中没有的词
+        unknown = np.log(pos.none / pos.total) - np.log(neg.none / neg.total)
+        self.weights = np.append(self.pos_log_likelihood - self.neg_log_likelihood, unknown)
+        self.bias = np.log(pos.getsum()) - np.log(neg.getsum())
+
+    def token_ids(self, tokens):
+        """
+        词转换为词表中的位置，词表中没有的词为最后一个位置
+        """
+        ids = self.vocabulary.get_indexer(pd.Index(tokens, dtype=object))
+        ids[ids < 0] = len(self.vocabulary)
+        return ids
+
+    def encode(self, token_lists):
+        """
+        把一批分好词的评论转换为词表位置
+        :param token_lists: 每条评论的词列表（见tokenize）
+        :return: (所有评论的词表位置拼接成的数组, 每条评论的词数)
+        """
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+        return self.token_ids(list(chain.from_iterable(token_lists))), lengths
+
+    def score_ids(self, ids, lengths):
+        """
+        根据词表位置打分：按评论分段求和权重，相当于 词频稀疏矩阵 × 权重向量
+        :param ids: 所有评论的词表位置拼接成的数组（见encode）
+        :param lengths: 每条评论的词数
+        :return: float64数组，0-1，0为负面，1为正面
+        """
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        logit = self.bias + np.bincount(rows, weights=self.weights[ids], minlength=len(lengths))
+        # sigmoid，logit很大或很小时不溢出
+        return np.exp(-np.logaddexp(0, -logit))
+
+    def score_tokens(self, token_lists):
+        """
+        给一批分好词的评论打分
+        :param token_lists: 每条评论的词列表（见tokenize）
+        :return: float64数组，0-1，0为负面，1为正面
+        """
+        return self.score_ids(*self.encode(token_lists))
+
+    def score_texts(self, texts):
+        """
+        给一批评论打分（在当前进程中分词）
+        """
+        return self.score_tokens([tokenize(text) for text in texts])
+
+
+if __name__ == '__main__':
+    # 一致性检查：固定的样例和所有已清洗的评论上，得分与SnowNLP(text).sentiments的差异超过容差时报错；
+    # 测速：分词后的分类阶段逐条调用Bayes.classify与向量化打分的速度，以及包括分词在内的整体速度
+    import time
+    from pathlib import Path
+
+    from snownlp import SnowNLP, sentiment
+
+    # 固定的样例：正面、负面、中性、emoji、标点、中英文混合、重复的字词和模型词表外的词
+    samples = ['这个视频太好看了，强烈推荐！', '垃圾内容，浪费时间', '今天是2025年1月9日', '哈哈哈哈哈哈哈哈',
+               '[doge][doge]', '？？？', 'up主yyds，awsl', '好好好好好好', '呜呜呜感动哭了😭', '一般般吧，也就那样',
+               '瓦努阿图的牢底坐穿贝', '春晚节目一年不如一年']
+    np.testing.assert_allclose(NaiveBayesSentiment().score_texts(samples),
+                               [SnowNLP(text).sentiments for text in samples], rtol=0, atol=1e-9)
+    print(f">>>固定样例 {len(samples)} 条：与SnowNLP一致")
+
+    texts = pd.concat([pd.read_parquet(file, columns=['contents'])
+                       for file in sorted(Path('../data_processed').glob('*.parquet'))])['contents']
+    texts = [text.strip() for text in texts if text.strip()]
+    model = NaiveBayesSentiment()
+    print(f">>>{len(texts)} 条评论，模型词表 {len(model.vocabulary)} 个词")
+
+    start_time = time.perf_counter()
+    tokens = [tokenize(text) for text in texts]
+    tokenize_time = time.perf_counter() - start_time
+
+    expected = np.array([SnowNLP(text).sentiments for text in texts])
+    scores = model.score_tokens(tokens)
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-9)
+    difference = np.abs(scores - expected)
+    print(f">>>与SnowNLP的最大差异 {difference.max():.2e}，"
+          f"float32得分完全相同的比例 {np.mean(scores.astype(np.float32) == expected.astype(np.float32)):.4%}")
+
+    repeat = 20
+    corpus = tokens * repeat
+    classifier = sentiment.classifier.classifier
+    start_time = time.perf_counter()
+    for words in corpus:
+        classifier.classify(words)
+    bayes_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    ids, lengths = model.encode(corpus)
+    encode_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    model.score_ids(ids, lengths)
+    score_time = time.perf_counter() - start_time
+    numpy_time = encode_time + score_time
+    print(f">>>分类阶段（{len(corpus)} 条已分词的评论）：逐条Bayes.classify {len(corpus) / bayes_time:,.0f} 条/秒，"
+          f"向量化 {len(corpus) / numpy_time:,.0f} 条/秒（加速 {bayes_time / numpy_time:.0f} 倍），"
+          f"其中词转换为词表位置 {encode_time:.2f} 秒，"
+          f"已转换为词表位置时 {len(corpus) / score_time:,.0f} 条/秒（加速 {bayes_time / score_time:.0f} 倍）")
+    print(f">>>分词 {len(texts) / tokenize_time:,.0f} 条/秒，占逐条打分总耗时的 "
+          f"{tokenize_time / (tokenize_time + bayes_time / repeat):.1%}")
@@ -0,0 +1,186 @@
+# 批量情感打分
+# 原来用data['contents'].apply(snownlp_sentiment)逐行打分：每行都新建一个SnowNLP对象（还会顺带为这条评论建一个BM25索引），
+# 分词和朴素贝叶斯分类都在一个CPU核上运行，是分析中最慢的一步。
+# 这里把评论按块分给进程池，每个工作进程只加载一次情感模型，直接调用模型打分，结果与SnowNLP(text).sentiments相同。
+# engine='numpy'时工作进程只分词，分类由sentiment_model.NaiveBayesSentiment在当前进程中对整批评论向量化计算，
+# 分词结果保存在共享的分词结果中（见token_corpus.py），已经分过词的评论不再分词。
+# 传入cache（见sentiment_cache.py）时，只给缓存中没有的评论打分，同一批中重复的评论也只打一次分。
+# 这个模块不导入matplotlib，工作进程启动时不需要加载绘图库
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+
+import numpy as np
+
+from sentiment_cache import normalize_text
+
+# 工作进程中加载的打分函数
+_classify = None
+# 当前进程中的向量化情感模型，第一次使用时加载
+_numpy_model = None
+# 可选的打分方式
+ENGINES = ('snownlp', 'numpy')
+
+
+def _init_worker():
+    """
+    工作进程初始化：加载SnowNLP的情感模型（导入snownlp.sentiment时加载），每个进程只加载一次
+    """
+    global _classify
+    from snownlp import sentiment
+
+    _classify = sentiment.classify
+
+
+def model_tag(engine='snownlp'):
+    """
+    情感模型的标识：打分方式、snownlp的版本加上模型文件的哈希，用作缓存的键的一部分
+    """
+    from snownlp import sentiment
+
+    with open(sentiment.data_path + '.3', 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:8]
+    prefix = 'snownlp' if engine == 'snownlp' else f'snownlp-{engine}'
+    return f"{prefix}-{version('snownlp')}-{digest}"
+
+
+def _text(value):
+    """
+    打分前的评论内容：空值为空字符串，其余按str转换（与snownlp_sentiment相同）后规范化（见sentiment_cache.normalize_text）
+    """
+    if value is None or value != value:
+        return ''
+    return normalize_text(str(value))
+
+
+def _score_chunk(texts):
+    """
+    给一块评论打分，在工作进程中执行；空评论（清洗后只剩表情等）没有情感可言，得分为NaN
+    """
+    if _classify is None:
+        _init_worker()
+    return np.fromiter((_classify(text) if text else np.nan for text in texts), dtype=np.float32, count=len(texts))
+
+
+def _tokenize_chunk(texts):
+    """
+    给一块评论分词，在工作进程中执行
+    """
+    from sentiment_model import tokenize
+
+    return [tokenize(text) if text else [] for text in texts]
+
+
+def _map_chunks(function, texts, workers, chunk_size, initializer=None):
+    """
+    把评论分块交给function处理，评论多于一块且进程数大于1时使用进程池
+    :param initializer: 工作进程启动时调用的函数，如加载模型；只分词时不需要
+    :return: 每块的结果，按原顺序排列
+    """
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        return [function(chunk) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=initializer) as pool:
+        return list(pool.map(function, chunks))
+
+
+def _score(texts, workers, chunk_size, engine, corpus):
+    """
+    给评论打分
+    """
+    global _numpy_model
+    if engine == 'snownlp':
+        results = _map_chunks(_score_chunk, texts, workers, chunk_size, initializer=_init_worker)
+        return np.concatenate(results) if results else np.empty(0, dtype=np.float32)
+    if engine != 'numpy':
+        raise ValueError(f"不支持的打分方式：{engine}，可选 {list(ENGINES)}")
+    if _numpy_model is None:
+        from sentiment_model import NaiveBayesSentiment
+
+        _numpy_model = NaiveBayesSentiment()
+    from token_corpus import load_corpus, tokenize_texts
+
+    def segment(batch):
+        return [words for chunk in _map_chunks(_tokenize_chunk, batch, workers, chunk_size) for words in chunk]
+
+    if corpus is None:
+        corpus = load_corpus('snownlp')
+    tokens = tokenize_texts(texts, corpus=corpus, segment=segment)
+    scores = _numpy_model.score_tokens(tokens).astype(np.float32)
+    scores[[not text for text in texts]] = np.nan
+    return scores
+
+
+def score_texts(texts, workers=None, chunk_size=1000, cache=None, engine='snownlp', corpus=None):
+    """
+    批量计算评论的情感得分
+    :param texts: 评论内容，Series或任意可迭代对象；空值和空评论的得分为NaN，其余不是字符串的值按str转换
+    :param workers: 进程数，默认为CPU核数；为1时在当前进程中打分
+    :param chunk_size: 每次交给工作进程的评论数，太小时进程间通信的开销变大，太大时各进程的负载不均匀
+    :param cache: 得分缓存SentimentCache，为None时不使用缓存；缓存的模型标识应为model_tag(engine)
+    :param engine: 打分方式，'snownlp'逐条调用SnowNLP的模型，'numpy'用NaiveBayesSentiment向量化计算，两者得分相差小于1e-12
+    :param corpus: engine='numpy'时使用的分词结果TokenCorpus('snownlp')，默认打开cache目录下共享的分词结果
+    :return: 与输入一一对应的float32数组，0-1，0为负面，1为正面
+    """
+    texts = [_text(text) for text in texts]
+    workers = workers or os.cpu_count() or 1
+    if cache is None:
+        return _score(texts, workers, chunk_size, engine, corpus)
+
+    unique = list(dict.fromkeys(text for text in texts if text))
+    scores = cache.get_many(unique)
+    missing = [text for text in unique if text not in scores]
+    new_scores = _score(missing, workers, chunk_size, engine, corpus)
+    cache.put_many(zip(missing, new_scores))
+    scores.update(zip(missing, new_scores))
+    return np.fromiter((scores[text] if text else np.nan for text in texts), dtype=np.float32, count=len(texts))
+
+
+if __name__ == '__main__':
+    # 对一个视频的评论分别逐行打分和批量打分，比较速度并检查结果一致；
+    # 再模拟重新爬取（去掉一部分评论后打分，再对全部评论打分），检查缓存只给新增的评论打分
+    import tempfile
+    from pathlib import Path
+
+    from snownlp import SnowNLP
+
+    from data_loader import load_comments, processed_path
+    from sentiment_cache import SentimentCache
+    from token_corpus import TokenCorpus
+
+    texts = load_comments(processed_path('哪个坦克手能一挑十八？【小约翰】'), columns=['contents'])['contents']
+    print(f">>>{len(texts)} 条评论，{os.cpu_count()} 个CPU核")
+    # 测速时分词结果保存在临时目录，不使用cache目录下已有的分词结果
+    tmp_dir = tempfile.TemporaryDirectory()
+
+    start_time = time.perf_counter()
+    row_by_row = np.array([SnowNLP(text).sentiments if text.strip() else np.nan for text in texts], dtype=np.float32)
+    baseline = time.perf_counter() - start_time
+    print(f">>>逐行SnowNLP: 耗时 {baseline:.2f} 秒，{len(texts) / baseline:,.0f} 条/秒")
+
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        start_time = time.perf_counter()
+        scores = score_texts(texts, workers=workers)
+        elapsed = time.perf_counter() - start_time
+        print(f">>>批量打分 {workers} 个进程: 耗时 {elapsed:.2f} 秒，{len(texts) / elapsed:,.0f} 条/秒，"
+              f"加速 {baseline / elapsed:.1f} 倍，结果一致：{np.array_equal(scores, row_by_row, equal_nan=True)}")
+
+    start_time = time.perf_counter()
+    scores = score_texts(texts, engine='numpy', corpus=TokenCorpus('snownlp', Path(tmp_dir.name) / 'tokens.npz'))
+    elapsed = time.perf_counter() - start_time
+    print(f">>>分词后向量化分类: 耗时 {elapsed:.2f} 秒，{len(texts) / elapsed:,.0f} 条/秒，"
+          f"与逐行SnowNLP的最大差异 {np.nanmax(np.abs(scores - row_by_row)):.2e}")
+
+    with tempfile.TemporaryDirectory() as tmp, SentimentCache(model_tag(), Path(tmp) / 'cache.sqlite') as cache:
+        earlier = texts.iloc[:len(texts) * 9 // 10]
+        for name, batch in (('第一次爬取（90%的评论）', earlier), ('重新爬取（全部评论）', texts)):
+            hits, misses = cache.hits, cache.misses
+            start_time = time.perf_counter()
+            scores = score_texts(batch, cache=cache)
+            elapsed = time.perf_counter() - start_time
+            print(f">>>{name}: {len(batch)} 条评论，缓存命中 {cache.hits - hits} 条，打分 {cache.misses - misses} 条，"
+                  f"耗时 {elapsed:.2f} 秒，结果一致：{np.array_equal(scores, row_by_row[:len(batch)], equal_nan=True)}")
+        print(f">>>缓存统计：{cache.stats()}")
@@ -0,0 +1,230 @@
+# 共享的分词结果
+# 原来每个分析模块都各自调用jieba.cut：extract_keywords对所有评论拼接的文本分词，generate_topic_network又对每条评论分词一遍，
+# generate_wordcloud再对热门评论分词一遍，SnowNLP情感打分内部也要分词。
+# 这里每条评论只分词一次，分词结果按评论内容的哈希保存为紧凑的文件：词表 + 每条评论的词编号数组，
+# 各分析模块从这里取分词结果；评论内容没有变化时，重新运行分析不需要再分词
+
+import os
+from importlib.metadata import version
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sentiment_cache import normalize_text, text_key
+
+# 分词结果保存的目录，不提交到仓库
+CORPUS_DIR = '../cache'
+
+
+def jieba_tokenize(text):
+    """
+    jieba分词，去掉空白
+    """
+    import jieba
+
+    return [word for word in jieba.cut(text) if word.strip()]
+
+
+def snownlp_tokenize(text):
+    """
+    与SnowNLP情感分类相同的分词（见sentiment_model.tokenize）
+    """
+    from sentiment_model import tokenize
+
+    return tokenize(text)
+
+
+# 可用的分词方式：名称 -> (分词函数, 分词器的版本)
+TOKENIZERS = {
+    'jieba': (jieba_tokenize, lambda: version('jieba')),
+    'snownlp': (snownlp_tokenize, lambda: version('snownlp')),
+}
+
+
+def tokenizer_tag(tokenizer):
+    """
+    分词方式的标识，分词器的版本变化时分词结果需要重新生成
+    """
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"不支持的分词方式：{tokenizer}，可选 {list(TOKENIZERS)}")
+    return f"{tokenizer}-{TOKENIZERS[tokenizer][1]()}"
+
+
+class TokenCorpus:
+    """
+    分词结果：评论内容哈希 -> 词编号数组，词编号对应词表vocabulary中的词
+    所有评论的词编号拼接成一个int32数组ids，第i条评论的词为 ids[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, tokenizer='jieba', path=None, segmenter=None):
+        """
+        :param tokenizer: 分词方式，见TOKENIZERS
+        :param path: 分词结果文件，默认为cache目录下以分词方式标识命名的.npz文件
+        :param segmenter: 多进程分词的segmentation.Segmenter（只用于jieba），为None时在当前进程中逐条分词
+        """
+        if segmenter is not None and tokenizer != 'jieba':
+            raise ValueError(f"Segmenter只支持jieba分词，不支持：{tokenizer}")
+        self.tokenizer = tokenizer
+        self.segmenter = segmenter
+        # 使用用户词典或过滤停用词时分词结果不同，标识也不同
+        self.tag = segmenter.tag if segmenter is not None else tokenizer_tag(tokenizer)
+        self.path = Path(path or Path(CORPUS_DIR) / f'tokens-{self.tag}.npz')
+        self.vocabulary = []
+        self._word_ids = {}
+        self._rows = {}  # 评论内容哈希 -> 第几条评论
+        self._ids = np.empty(0, dtype=np.int32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._changed = False
+        if self.path.exists():
+            self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _load(self):
+        with np.load(self.path) as data:
+            if str(data['tag']) != self.tag:
+                # 分词器版本变化，旧的分词结果作废
+                return
+            blob, word_offsets = data['vocabulary'].tobytes(), data['vocabulary_offsets']
+            self.vocabulary = [blob[start:end].decode('utf-8')
+                               for start, end in zip(word_offsets[:-1], word_offsets[1:])]
+            self._word_ids = {word: index for index, word in enumerate(self.vocabulary)}
+            self._rows = {key: row for row, key in enumerate(data['keys'].tolist())}
+            self._ids = data['ids']
+            self._offsets = data['offsets']
+
+    def save(self):
+        """
+        保存分词结果（有新增的评论时），先写临时文件再替换
+        """
+        if not self._changed:
+            return
+        encoded = [word.encode('utf-8') for word in self.vocabulary]
+        word_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=word_offsets[1:])
+        keys = np.array(list(self._rows), dtype='S20')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, tag=np.array(self.tag), keys=keys, ids=self._ids, offsets=self._offsets,
+                 vocabulary=np.frombuffer(b''.join(encoded), dtype=np.uint8), vocabulary_offsets=word_offsets)
+        os.replace(tmp_path, self.path)
+        self._changed = False
+
+    def _keys(self, texts):
+        """
+        评论内容的哈希，空评论为None
+        """
+        keys = []
+        for text in texts:
+            text = '' if text is None or text != text else normalize_text(str(text))
+            keys.append(text_key(text) if text else None)
+        return keys
+
+    def update(self, texts, segment=None):
+        """
+        给还没有分词结果的评论分词
+        :param texts: 评论内容
+        :param segment: 分词函数，接收评论列表，返回每条评论的词列表；默认使用segmenter，没有时在当前进程中逐条分词
+        :return: 新增分词的评论数
+        """
+        missing = {}
+        for text, key in zip(texts, self._keys(texts)):
+            if key is not None and key not in self._rows and key not in missing:
+                missing[key] = normalize_text(str(text))
+        if not missing:
+            return 0
+        if segment is None and self.segmenter is not None:
+            segment = self.segmenter.segment
+        if segment is None:
+            tokenize = TOKENIZERS[self.tokenizer][0]
+            token_lists = [tokenize(text) for text in missing.values()]
+        else:
+            token_lists = segment(list(missing.values()))
+        new_ids = []
+        for key, tokens in zip(missing, token_lists):
+            self._rows[key] = len(self._rows)
+            new_ids.append([self._word_ids.setdefault(word, len(self._word_ids)) for word in tokens])
+        self.vocabulary.extend(list(self._word_ids)[len(self.vocabulary):])
+        lengths = np.fromiter((len(ids) for ids in new_ids), dtype=np.int64, count=len(new_ids))
+        self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(lengths)])
+        self._ids = np.concatenate([self._ids, np.fromiter((i for ids in new_ids for i in ids), dtype=np.int32,
+                                                           count=int(lengths.sum()))])
+        self._changed = True
+        return len(missing)
+
+    def encode(self, texts, segment=None):
+        """
+        评论的分词结果（词编号），没有分词结果的评论先分词
+        :param texts: 评论内容
+        :param segment: 分词函数，见update
+        :return: (所有评论的词编号拼接成的int32数组, 每条评论的词数)，空评论的词数为0
+        """
+        texts = list(texts)
+        self.update(texts, segment)
+        rows = np.array([-1 if key is None else self._rows[key] for key in self._keys(texts)], dtype=np.int64)
+        present = rows >= 0
+        starts = np.where(present, self._offsets[np.maximum(rows, 0)], 0)
+        lengths = np.where(present, self._offsets[rows + 1] - starts, 0)
+        # 每个词在ids中的位置：所在评论的起点 + 在评论中的序号
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self._ids[positions], lengths
+
+    def token_lists(self, texts, segment=None):
+        """
+        评论的分词结果（词列表），与texts一一对应
+        """
+        ids, lengths = self.encode(texts, segment)
+        words = np.array(self.vocabulary, dtype=object)[ids].tolist()
+        ends = np.cumsum(lengths).tolist()
+        return [words[end - length:end] for end, length in zip(ends, lengths.tolist())]
+
+
+def load_corpus(tokenizer='jieba', path=None, segmenter=None):
+    """
+    打开共享的分词结果
+    """
+    return TokenCorpus(tokenizer, path, segmenter)
+
+
+def tokenize_texts(texts, tokenizer='jieba', corpus=None, segment=None):
+    """
+    评论的分词结果，优先使用已保存的分词结果，新分词的结果保存下来供下次使用
+    :param texts: 评论内容，Series或任意可迭代对象
+    :param tokenizer: 分词方式，见TOKENIZERS
+    :param corpus: TokenCorpus，默认打开共享的分词结果
+    :param segment: 分词函数，见TokenCorpus.update
+    :return: 每条评论的词列表，与texts一一对应
+    """
+    if corpus is None:
+        corpus = load_corpus(tokenizer)
+    token_lists = corpus.token_lists(texts, segment)
+    corpus.save()
+    return token_lists
+
+
+if __name__ == '__main__':
+    # 对所有已清洗的评论分词并保存，再次读取时不需要分词；检查分词结果与逐条jieba.cut一致
+    import tempfile
+    import time
+
+    import jieba
+
+    texts = pd.concat([pd.read_parquet(file, columns=['contents'])
+                       for file in sorted(Path('../data_processed').glob('*.parquet'))])['contents'].tolist()
+    jieba.initialize()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'tokens.npz'
+        start_time = time.perf_counter()
+        token_lists = tokenize_texts(texts, corpus=TokenCorpus('jieba', path))
+        first = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        corpus = TokenCorpus('jieba', path)
+        cached = corpus.token_lists(texts)
+        second = time.perf_counter() - start_time
+        expected = [jieba_tokenize(normalize_text(text)) for text in texts]
+        print(f">>>{len(texts)} 条评论，{len(corpus)} 条不同的评论，词表 {len(corpus.vocabulary)} 个词，"
+              f"文件 {path.stat().st_size / 1024:.0f} KB")
+        print(f">>>第一次分词 {first:.2f} 秒，读取已保存的分词结果 {second:.2f} 秒，"
+              f"结果一致：{token_lists == cached == expected}")
@@ -1,23 +1,29 @@
 # 热门关键词分析和话题分析
 
 from collections import Counter
-from itertools import combinations
+from pathlib import Path
 
-import jieba
 import matplotlib
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-import pandas as pd
 
+from cooccurrence import corpus_cooccurrence
+from data_loader import load_comments
+from keyword_index import KeywordIndex
+from segmentation import Segmenter
+from token_corpus import load_corpus, tokenize_texts
 
-def load_data(file_path):
+
+def load_data(file_path, columns=('contents',), dedupe=False):
     """
     加载评论数据
     :param file_path: 评论数据的文件路径
+    :param columns: 需要读取的列
+    :param dedupe: 是否每个近似重复的簇（刷屏评论）只算一次
     :return: 数据框df
     """
-    df = pd.read_excel(file_path)
+    df = load_comments(file_path, columns=columns, dedupe=dedupe)
     return df
 
 
@@ -41,65 +47,60 @@ def load_stopwords(stopwords_path='./stopwords.txt'):
         return set()
 
 
-def extract_keywords(data, stopwords, top_n=20):
+def extract_keywords(data, stopwords, top_n=20, corpus=None):
     """
     提取高频关键词
     :param data: pd.DataFrame, 包含评论内容的数据
     :param stopwords: set, 停用词集合
     :param top_n: int, 要提取的关键词数量
+    :param corpus: TokenCorpus, 共享的分词结果，默认打开cache目录下的分词结果（见token_corpus.py）
     :return: list of tuples, 关键词及其频率
     """
-    # 拼接所有评论内容
-    text = ' '.join(data['contents'])
-    words = [word for word in jieba.cut(text) if word not in stopwords and len(word) > 1]
+    # 所有评论的分词结果，已经分过词的评论直接读取
+    token_lists = tokenize_texts(data['contents'], corpus=corpus)
     # 统计词频
-    word_counts = Counter(words)
+    word_counts = Counter(word for words in token_lists for word in words
+                          if word not in stopwords and len(word) > 1)
     return word_counts.most_common(top_n)
 
 
-def generate_topic_network(data, keywords, stopwords, min_cooccurrence=5):
+def generate_topic_network(data, keywords, stopwords, min_cooccurrence=5, corpus=None, window=None, weighting='count'):
     """
     根据评论生成关键词共现的话题网络。
     :param data: pd.DataFrame, 包含评论内容的 DataFrame
     :param keywords: list, 关键词列表
     :param stopwords: list, 停用词列表
     :param min_cooccurrence: int, 共现次数的最小阈值
+    :param corpus: TokenCorpus, 共享的分词结果，默认打开cache目录下的分词结果（见token_corpus.py）
+    :param window: int, 只统计在一条评论中相距小于window个词的关键词对，为None时统计同时出现在一条评论中的关键词对
+    :param weighting: str, 边的权重，'count'为共现次数，'pmi'或'npmi'为（归一化的）点互信息，见cooccurrence.py
+    :return: pd.DataFrame, 话题网络的边列表
     """
+    if corpus is None:
+        corpus = load_corpus()
 
-    # 提取关键词
-    comments = data['contents']
-
-    # 创建一个计数器，用于存储每对关键词的共现次数
-    cooccurrence = Counter()
-
-    # 遍历每一条评论
-    for comment in comments:
-        # 对每条评论进行分词，筛选出在关键词列表中且不在停用词列表中的词
-        words = [word for word in jieba.cut(comment) if word in keywords and word not in stopwords]
-
-        # 更新每对关键词的共现次数
-        # combinations() 生成二元组
-        cooccurrence.update(combinations(set(words), 2))
+    # 去掉停用词后的关键词，用稀疏矩阵一次算出每对关键词共同出现的评论数
+    keywords = [word for word in dict.fromkeys(keywords) if word not in stopwords]
+    edges = corpus_cooccurrence(corpus, data['contents'], keywords, window=window, weighting=weighting,
+                                min_count=min_cooccurrence)
 
     # -构建共现网络
     # 创建一个无向图，用于存储共现的关键词之间的关系
     graph = nx.Graph()
 
-    # 遍历每对关键词及其共现次数
-    for (word1, word2), count in cooccurrence.items():
-        # 只有共现次数大于 min_cooccurrence时，才建立边
-        if count >= min_cooccurrence:
-            # 在图中添加一条边，边的权重为共现次数
-            graph.add_edge(word1, word2, weight=count)
+    # 共现次数不少于 min_cooccurrence 的每对关键词建立一条边，记录权重和共现次数
+    for word1, word2, count, weight in edges.itertuples(index=False):
+        graph.add_edge(word1, word2, weight=weight, count=count)
 
     # -可视化网络
     # 使用spring_layout布局来确定节点位置 spring_layout 是一种常见的力导向布局算法，通过模拟节点间的弹簧力来调整节点的位置，使得图看起来更美观
     # k是节点之间的吸引力（相当于弹簧的强度）
     # iterations控制迭代次数，力导向算法通过迭代优化节点的位置，使得每个节点的总力接近平衡状态，直到达到一个稳定的布局
-    pos = nx.spring_layout(graph, k=0.5, iterations=50)
+    # 布局按共现次数计算弹簧的强度（PMI权重可能为负，不能用作弹簧强度）
+    pos = nx.spring_layout(graph, k=0.5, iterations=50, weight="count")
 
-    # 控制边的宽度 log(weight + 1)是为了避免共现次数为 0 时，边宽为0
-    edge_widths = [min(np.log(weight + 1), 10) for _, _, weight in graph.edges(data='weight')]  # 控制边宽
+    # 控制边的宽度 log(count + 1)是为了避免共现次数为 0 时，边宽为0
+    edge_widths = [min(np.log(count + 1), 10) for _, _, count in graph.edges(data='count')]  # 控制边宽
 
     # 设置图像大小
     plt.figure(figsize=(15, 10))
@@ -118,14 +119,16 @@ def generate_topic_network(data, keywords, stopwords, min_cooccurrence=5):
     plt.axis("off")
     # 显示图像
     plt.show()
+    return edges
 
 
 if __name__ == "__main__":
     # 设置中文字体，解决中文乱码问题
     matplotlib.rcParams['font.sans-serif'] = ['SimHei']
 
-    # 加载评论数据
-    data = load_data('../data_processed/3.xlsx')
+    # 加载评论数据，刷屏评论每个簇只算一次，避免抬高其中词语的词频
+    file_path = '../data_processed/和姐妹第一次雪地开房车吃泡面！零下20度直接陷车....parquet'
+    data = load_data(file_path, dedupe=True)
 
     # 数据清洗
     data = clean_data(data)
@@ -133,10 +136,21 @@ if __name__ == "__main__":
     # 加载停用词
     stopwords = load_stopwords('stopwords.txt')
 
+    # 打开共享的分词结果，提取关键词和生成话题网络时每条评论只分词一次，没有分过词的评论交给多进程分词
+    segmenter = Segmenter()
+    corpus = load_corpus(segmenter=segmenter)
+
     # 提取高频关键词
-    top_keywords = extract_keywords(data, stopwords, top_n=15)
+    top_keywords = extract_keywords(data, stopwords, top_n=15, corpus=corpus)
     print("高频关键词：", top_keywords)
 
+    # 更新所有视频的关键词索引（只处理新清洗的视频），按TF-IDF提取这个视频区别于其他视频的关键词
+    index = KeywordIndex(corpus=corpus)
+    index.update()
+    index.save()
+    print("TF-IDF关键词：", index.top_keywords(Path(file_path).stem, top_n=15, stopwords=stopwords))
+
     # 生成话题网络
     # 是用列表推导式从top_keywords中提取出每个关键词，以便进行话题网络的生成
-    generate_topic_network(data, [kw[0] for kw in top_keywords], stopwords, min_cooccurrence=5)
+    generate_topic_network(data, [kw[0] for kw in top_keywords], stopwords, min_cooccurrence=5, corpus=corpus)
+    segmenter.close()
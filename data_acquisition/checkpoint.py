@@ -0,0 +1,158 @@
+# 断点续爬
+# 爬取中途出错（元素失效、网络波动）时，不需要从第一条父评论重新开始：
+# 断点文件记录已存储的父评论、下一个评论id和存储写入的位置，重新运行时跳过已存储的父评论，评论id接着上次继续；
+# 一次完整爬取结束后再次运行，则只获取上次之后新发布的评论（增量爬取）。
+# 只有接口爬取（reply_api.py）按发布时间从新到旧获取父评论，遇到上次之前发布的评论就停止；
+# 网页爬取（data_acquisition.py）的评论区按热度排列，不能提前停止，仍然滚动整个评论区，只靠标识跳过已存储的父评论
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+# 网页上的绝对时间，如 2025-01-09 20:10；“3天前”“刚刚”这类相对时间每天都会变化，不能作为评论的标识
+ABSOLUTE_PUBDATE = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+
+def comment_key(contents, pubdate=None, parent_key=None, rpid=None, occurrence=0):
+    """
+    评论的稳定标识：有平台评论id(rpid)时只使用rpid，否则使用 内容+发布时间+父评论标识+第几次出现 的哈希
+    内容相同的评论（如刷屏评论）发布时间常常也相同或是相对时间，只靠内容区分不了，
+    所以按爬取顺序记录这是第几条内容相同的评论，第一条的标识与不带序号时相同
+    :param contents: 评论内容
+    :param pubdate: 发布时间，相对时间不参与计算
+    :param parent_key: 父评论的标识，父评论为None
+    :param rpid: 平台评论id
+    :param occurrence: 之前已经爬取到的内容、发布时间、父评论都相同的评论数
+    :return: 标识字符串
+    """
+    if rpid:
+        return f'rpid:{rpid}'
+    pubdate = str(pubdate) if pubdate is not None and ABSOLUTE_PUBDATE.match(str(pubdate)) else ''
+    parts = [str(contents), pubdate, parent_key or '']
+    if occurrence:
+        parts.append(str(occurrence))
+    text = '\x1f'.join(parts)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:20]
+
+
+class CrawlCheckpoint:
+    """
+    爬取断点
+    断点只在存储刷盘之后保存，并记录当时存储写入的位置；恢复时把存储回退到这个位置，
+    丢弃断点之后写入的数据，保证断点与存储中的数据一致，重新爬取时不会出现重复评论
+    """
+
+    def __init__(self, file_path, save_every=50):
+        """
+        :param file_path: 断点文件路径
+        :param save_every: 每存储多少条父评论保存一次断点
+        """
+        self.file_path = Path(file_path)
+        self.save_every = save_every
+        self.parent_index = 0  # 已处理的父评论数（爬取位置）
+        self.next_id = 1  # 下一个评论id
+        self.sink_position = None  # 保存断点时存储写入的位置
+        self.done_keys = set()  # 已存储的父评论标识
+        self.restored_keys = frozenset()  # 之前的爬取已存储的父评论标识，本次爬取只跳过这些父评论
+        self.newest = None  # 本次爬取到的最新评论发布时间戳
+        self.since = None  # 上一次完整爬取时最新评论的发布时间戳，增量爬取只获取比它新的评论
+        self.completed = False  # 上一次爬取是否已经完整结束
+        self._unsaved = 0
+        if self.file_path.exists():
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.parent_index = state['parent_index']
+            self.next_id = state['next_id']
+            self.sink_position = state['sink_position']
+            self.done_keys = set(state['done_keys'])
+            self.restored_keys = frozenset(self.done_keys)
+            self.newest = state['newest']
+            self.since = state['since']
+            self.completed = state['completed']
+
+    @classmethod
+    def for_sink(cls, sink, **kwargs):
+        """
+        存储对应的断点文件，与存储文件放在同一目录下
+        """
+        return cls(f'{sink.file_path}.checkpoint.json', **kwargs)
+
+    def restore(self, sink):
+        """
+        开始爬取前调用：把存储回退到断点保存时的位置
+        还没有断点文件时立即保存一个初始断点（记录存储当前的位置）：存储每累积batch_size行就会写入文件，
+        在第一次保存断点之前出错时，重新运行也能回退到爬取开始时的位置，评论id不会从1重新开始而重复
+        上一次爬取已完整结束时，开始一次增量爬取
+        :param sink: 评论存储
+        """
+        if self.sink_position is None:
+            self.save(sink)
+        else:
+            sink.rollback(self.sink_position)
+        if self.completed:
+            self.since = self.newest
+            self.parent_index = 0
+            self.completed = False
+
+    def is_done(self, key):
+        """
+        父评论是否在之前的爬取中已经存储过
+        本次爬取中标记的父评论不算：两条父评论的标识相同时，后一条不能因为前一条刚存储过而被跳过
+        :param key: 父评论的标识
+        """
+        return key in self.restored_keys
+
+    def is_old(self, ctime):
+        """
+        增量爬取时，评论是否在上一次完整爬取之前就已发布
+        """
+        return self.since is not None and ctime is not None and ctime <= self.since
+
+    def mark_done(self, keys, next_id, sink, ctime=None):
+        """
+        一条父评论及其回复已写入存储后调用，每累积save_every条保存一次断点
+        :param keys: 父评论的标识
+        :param next_id: 下一个评论id
+        :param sink: 评论存储
+        :param ctime: 父评论的发布时间戳
+        """
+        self.done_keys.update(keys)
+        self.next_id = next_id
+        self.parent_index = self.parent_index + 1
+        if ctime is not None and (self.newest is None or ctime > self.newest):
+            self.newest = ctime
+        self._unsaved = self._unsaved + 1
+        if self._unsaved >= self.save_every:
+            self.save(sink)
+
+    def save(self, sink):
+        """
+        存储刷盘后保存断点，先写临时文件再替换，保存过程中崩溃也不会损坏断点文件
+        """
+        sink.flush(sync=True)
+        self.sink_position = sink.position()
+        state = {
+            'parent_index': self.parent_index,
+            'next_id': self.next_id,
+            'sink_position': self.sink_position,
+            'done_keys': sorted(self.done_keys),
+            'newest': self.newest,
+            'since': self.since,
+            'completed': self.completed,
+        }
+        tmp_path = self.file_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+        self._unsaved = 0
+
+    def finish(self, sink):
+        """
+        爬取完整结束后调用，下次运行时进行增量爬取
+        """
+        self.completed = True
+        self.save(sink)
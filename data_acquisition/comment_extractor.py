@@ -0,0 +1,158 @@
+# 在浏览器内一次性提取评论
+# 逐层调用find_element穿过shadow DOM，每条评论要发送几十次WebDriver请求，每条回复还要再发送若干次。
+# 这里把遍历shadow DOM的逻辑写成js脚本，通过一次execute_script在浏览器内执行，
+# 一次调用返回当前已加载的全部父评论及其可见回复，WebDriver请求次数只与页面加载次数有关，与评论数量无关
+
+# 公共js函数：读取bili-comment-renderer/bili-comment-reply-renderer中的评论内容、发布时间、点赞数
+_JS_HELPERS = r"""
+const sr = (el) => (el ? el.shadowRoot : null);
+const q = (root, selector) => (root ? root.querySelector(selector) : null);
+const text = (el) => (el ? el.innerText.trim() : '');
+const rpidOf = (el) => (el && el.data && el.data.rpid_str) ? el.data.rpid_str : null;
+const readComment = (renderer, bodyId) => {
+    const root = sr(renderer);
+    const richText = q(q(root, '#' + bodyId), 'bili-rich-text');
+    const buttons = sr(q(q(root, '#footer'), 'bili-comment-action-buttons-renderer'));
+    return {
+        text: text(q(sr(richText), '#contents')),
+        pubdate: text(q(buttons, '#pubdate')),
+        like_count: text(q(buttons, '#count')),
+        rpid: rpidOf(renderer),
+    };
+};
+const repliesRootOf = (thread) => sr(q(q(sr(thread), '#replies'), 'bili-comment-replies-renderer'));
+const readReplies = (repliesRoot) => {
+    const expander = q(repliesRoot, '#expander-contents');
+    if (!expander) return [];
+    return Array.from(expander.querySelectorAll('bili-comment-reply-renderer'))
+        .map((reply) => readComment(reply, 'main'));
+};
+const signatureOf = (repliesRoot) => {
+    const expander = q(repliesRoot, '#expander-contents');
+    const value = expander ? expander.innerText : '';
+    let hash = 0;
+    for (let i = 0; i < value.length; i++) hash = (hash * 31 + value.charCodeAt(i)) | 0;
+    return value.length + ':' + hash;
+};
+const lastPageButton = (repliesRoot) => {
+    const paginationBody = q(repliesRoot, '#pagination-body');
+    if (!paginationBody) return null;
+    const buttons = paginationBody.querySelectorAll('bili-text-button');
+    return buttons.length ? buttons[buttons.length - 1] : null;
+};
+"""
+
+# 提取第start条之后的所有父评论及其当前可见的回复，并把页面滚动到最后一条评论处以加载更多评论
+# 父评论的内容还没有渲染出来时，只返回它之前的父评论并滚动到它那里，下次轮询再从它开始提取，不会存储空评论
+# arguments[0]: bili-comments元素  arguments[1]: start
+EXTRACT_THREADS_JS = _JS_HELPERS + r"""
+const feed = q(sr(arguments[0]), '#feed');
+if (!feed) return [];
+const threads = Array.from(feed.querySelectorAll('bili-comment-thread-renderer')).slice(arguments[1]);
+const isRendered = (thread) => !!q(sr(q(q(sr(q(sr(thread), '#comment')), '#content'), 'bili-rich-text')), '#contents');
+let rendered = threads.findIndex((thread) => !isRendered(thread));
+if (rendered < 0) rendered = threads.length;
+const batch = threads.slice(0, rendered).map((thread) => {
+    const comment = readComment(q(sr(thread), '#comment'), 'content');
+    const repliesRoot = repliesRootOf(thread);
+    const viewMore = q(repliesRoot, '#view-more');
+    comment.element = thread;
+    comment.replies = readReplies(repliesRoot);
+    comment.has_view_more = !!q(sr(q(viewMore, 'bili-text-button')), '.button');
+    return comment;
+});
+if (threads.length) threads[Math.min(rendered, threads.length - 1)].scrollIntoView();
+return batch;
+"""
+
+# 已加载的父评论数（包括还没有渲染出来的）
+# arguments[0]: bili-comments元素
+THREAD_COUNT_JS = _JS_HELPERS + r"""
+const feed = q(sr(arguments[0]), '#feed');
+return feed ? feed.querySelectorAll('bili-comment-thread-renderer').length : 0;
+"""
+
+# 点击父评论的“查看回复”按钮，返回点击前回复区的签名，没有按钮时返回null
+# arguments[0]: bili-comment-thread-renderer元素
+EXPAND_REPLIES_JS = _JS_HELPERS + r"""
+const repliesRoot = repliesRootOf(arguments[0]);
+const button = q(sr(q(q(repliesRoot, '#view-more'), 'bili-text-button')), '.button');
+if (!button) return null;
+const signature = signatureOf(repliesRoot);
+button.click();
+return signature;
+"""
+
+# 读取当前回复分页的全部回复，有“下一页”时点击下一页，没有时点击“收起”
+# arguments[0]: bili-comment-thread-renderer元素
+READ_REPLY_PAGE_JS = _JS_HELPERS + r"""
+const repliesRoot = repliesRootOf(arguments[0]);
+const replies = readReplies(repliesRoot);
+const signature = signatureOf(repliesRoot);
+const last = lastPageButton(repliesRoot);
+if (last && text(last) === '下一页') {
+    q(sr(last), '.button').click();
+    return {replies: replies, has_next: true, signature: signature};
+}
+const collapse = q(sr(q(q(repliesRoot, '#pagination-foot'), 'bili-text-button')), '.button');
+if (collapse) collapse.click();
+return {replies: replies, has_next: false, signature: signature};
+"""
+
+# 回复区当前内容的签名，回复加载出来或翻页后签名会变化
+# arguments[0]: bili-comment-thread-renderer元素
+REPLY_SIGNATURE_JS = _JS_HELPERS + r"""
+return signatureOf(repliesRootOf(arguments[0]));
+"""
+
+
+def extract_threads(webdriver, bili_comments, start=0):
+    """
+    一次WebDriver请求提取第start条之后已加载的所有父评论及其可见回复，遇到还没有渲染出来的父评论时到此为止
+    :param webdriver: 驱动
+    :param bili_comments: bili-comments元素
+    :param start: 从第几条父评论开始提取
+    :return: 父评论字典的列表，包含text、pubdate、like_count、rpid、replies、has_view_more、element
+    """
+    return webdriver.execute_script(EXTRACT_THREADS_JS, bili_comments, start)
+
+
+def thread_count(webdriver, bili_comments):
+    """
+    已加载的父评论数，包括还没有渲染出来的
+    :param webdriver: 驱动
+    :param bili_comments: bili-comments元素
+    :return: 父评论数
+    """
+    return webdriver.execute_script(THREAD_COUNT_JS, bili_comments)
+
+
+def expand_replies(webdriver, thread_element):
+    """
+    点击父评论的“查看回复”按钮
+    :param webdriver: 驱动
+    :param thread_element: bili-comment-thread-renderer元素
+    :return: 点击前回复区的签名，没有“查看回复”按钮时返回None
+    """
+    return webdriver.execute_script(EXPAND_REPLIES_JS, thread_element)
+
+
+def read_reply_page(webdriver, thread_element):
+    """
+    一次WebDriver请求读取当前回复分页的全部回复，并翻到下一页（最后一页时收起回复）
+    :param webdriver: 驱动
+    :param thread_element: bili-comment-thread-renderer元素
+    :return: (回复字典的列表, 是否还有下一页, 翻页前回复区的签名)
+    """
+    page = webdriver.execute_script(READ_REPLY_PAGE_JS, thread_element)
+    return page['replies'], page['has_next'], page['signature']
+
+
+def reply_signature(webdriver, thread_element):
+    """
+    回复区当前内容的签名，用于判断回复是否已经加载出来或已经翻页
+    :param webdriver: 驱动
+    :param thread_element: bili-comment-thread-renderer元素
+    :return: 签名字符串
+    """
+    return webdriver.execute_script(REPLY_SIGNATURE_JS, thread_element)
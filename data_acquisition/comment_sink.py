@@ -0,0 +1,355 @@
+# 评论数据存储层
+# 爬虫每爬完一条父评论就要存储一次，如果每次都重新打开并保存整个Excel表格，写入耗时会随已爬取的评论数增长，
+# 这里改为只追加写入（JSONL/CSV/Parquet），写入耗时只与本次新增的行数有关，爬取结束后再一次性导出Excel
+
+import csv
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# 评论数据的列名
+COLUMNS = ['id', 'contents', 'parent_id', 'pubdate', 'like_count']
+# 记录爬取时间的文件：存储文件名后加.crawl.json。页面上的“3小时前”这类相对时间，清洗时按这个时间换算
+CRAWL_TIME_SUFFIX = '.crawl.json'
+
+
+def crawl_time_path(file_path):
+    """
+    存储文件（或导出的Excel表格）对应的爬取时间文件
+    """
+    return Path(f'{file_path}{CRAWL_TIME_SUFFIX}')
+
+
+class CommentSink:
+    """
+    评论存储基类
+    写入的行先缓存在内存中，累积batch_size行后追加写入文件一次；
+    距离上次刷盘(fsync)超过fsync_interval秒时，把文件内容刷到磁盘上。
+    程序崩溃时最多丢失最后一批还没写入的数据，已经写入的数据不会被损坏
+    """
+    suffix = ''
+
+    def __init__(self, file_path, batch_size=200, fsync_interval=5.0, columns=None):
+        """
+        :param file_path: 存储文件路径
+        :param batch_size: 每累积多少行写入一次文件
+        :param fsync_interval: 两次刷盘之间的最大间隔（秒），为0时每次写入都刷盘
+        :param columns: 列名，默认为COLUMNS
+        """
+        self.file_path = Path(file_path)
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.columns = list(columns or COLUMNS)
+        self.rows_written = 0  # 已写入文件的行数
+        self._buffer = []
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._written_at = None  # 最后一次写入评论的时间
+        self._recorded_at = None  # 爬取时间文件中记录的时间
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write_rows(self, rows):
+        """
+        追加若干行评论数据
+        :param rows: 行的列表，每行与columns一一对应
+        """
+        self._buffer.extend(rows)
+        self._written_at = datetime.now()
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        """
+        把缓存中的行写入文件
+        :param sync: 是否强制刷盘
+        """
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        if sync or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._sync()
+            self._record_crawl_time()
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        """
+        写入剩余数据、刷盘并关闭文件
+        """
+        if self._closed:
+            return
+        self.flush(sync=True)
+        self._close()
+        self._closed = True
+
+    def position(self):
+        """
+        当前已写入文件的位置，调用前应先flush，配合rollback在断点续爬时回退到这个位置
+        """
+        raise NotImplementedError
+
+    def rollback(self, position):
+        """
+        丢弃position之后写入的数据（上次爬取在保存断点之后写入的部分）
+        """
+        raise NotImplementedError
+
+    def _record_crawl_time(self):
+        """
+        刷盘后记录爬取时间（最后一次写入评论的时间），先写临时文件再替换
+        """
+        if self._written_at is None or self._written_at == self._recorded_at:
+            return
+        path = crawl_time_path(self.file_path)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'crawl_time': self._written_at.strftime('%Y-%m-%d %H:%M:%S')}, f)
+        os.replace(tmp_path, path)
+        self._recorded_at = self._written_at
+
+    def _write_batch(self, rows):
+        raise NotImplementedError
+
+    def _sync(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _LineFileSink(CommentSink):
+    """
+    按行追加写入的文本文件（JSONL、CSV）
+    """
+
+    def __init__(self, file_path, **kwargs):
+        super().__init__(file_path, **kwargs)
+        new_file = not self.file_path.exists() or self.file_path.stat().st_size == 0
+        if not new_file:
+            _truncate_partial_line(self.file_path)
+        self._file = open(self.file_path, 'a', encoding='utf-8', newline='')
+        if new_file:
+            self._write_header()
+
+    def _write_header(self):
+        pass
+
+    def position(self):
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def rollback(self, position):
+        self._file.flush()
+        if position < os.fstat(self._file.fileno()).st_size:
+            self._file.truncate(position)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+
+class JsonlSink(_LineFileSink):
+    """
+    JSONL存储，每行一条评论，评论内容中的换行会被转义，崩溃后最多只有最后一行不完整
+    """
+    suffix = '.jsonl'
+
+    def _write_batch(self, rows):
+        lines = [json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n' for row in rows]
+        self._file.write(''.join(lines))
+        self._file.flush()
+
+
+class CsvSink(_LineFileSink):
+    """
+    CSV存储，首次创建文件时写入表头
+    """
+    suffix = '.csv'
+
+    def __init__(self, file_path, **kwargs):
+        self._writer = None
+        super().__init__(file_path, **kwargs)
+
+    def _csv_writer(self):
+        if self._writer is None:
+            self._writer = csv.writer(self._file)
+        return self._writer
+
+    def _write_header(self):
+        self._csv_writer().writerow(self.columns)
+        self._file.flush()
+
+    def _write_batch(self, rows):
+        self._csv_writer().writerows(rows)
+        self._file.flush()
+
+
+class ParquetSink(CommentSink):
+    """
+    Parquet存储，file_path是一个目录，每批数据写成一个独立的part文件
+    part文件先写到临时文件再重命名，所以已经写好的part文件不会因为崩溃而损坏
+    """
+    suffix = '.parquet'
+
+    def __init__(self, file_path, batch_size=2000, **kwargs):
+        super().__init__(file_path, batch_size=batch_size, **kwargs)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet存储需要安装pyarrow：pip install pyarrow")
+        self.file_path.mkdir(parents=True, exist_ok=True)
+        self._part_index = len(list(self.file_path.glob('part-*.parquet')))
+
+    def position(self):
+        return self._part_index
+
+    def rollback(self, position):
+        for part in self.file_path.glob('part-*.parquet'):
+            if int(part.stem.split('-')[1]) >= position:
+                part.unlink()
+        self._part_index = min(self._part_index, position)
+
+    def _write_batch(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # parent_id为空表示顶级评论，其余列保持网页上的原始文本
+        columns = list(zip(*rows))
+        arrays = []
+        for name, values in zip(self.columns, columns):
+            if name in ('id', 'parent_id'):
+                arrays.append(pa.array([None if v in (None, 'null') else int(v) for v in values], type=pa.int64()))
+            else:
+                arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+        table = pa.Table.from_arrays(arrays, names=self.columns)
+
+        part_path = self.file_path / f'part-{self._part_index:05d}.parquet'
+        tmp_path = part_path.with_suffix('.tmp')
+        pq.write_table(table, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, part_path)
+        self._part_index = self._part_index + 1
+
+
+class MemorySink(CommentSink):
+    """
+    把评论保存在内存列表rows中，用于测速和调试，不写文件
+    """
+
+    def __init__(self, columns=None):
+        self.rows = []
+        super().__init__('.', batch_size=1, fsync_interval=float('inf'), columns=columns)
+
+    def position(self):
+        return len(self.rows)
+
+    def rollback(self, position):
+        del self.rows[position:]
+
+    def _record_crawl_time(self):
+        pass
+
+    def _write_batch(self, rows):
+        self.rows.extend(rows)
+
+
+# 文件后缀与存储类的对应关系
+SINKS = {sink.suffix: sink for sink in (JsonlSink, CsvSink, ParquetSink)}
+
+
+def open_sink(file_path, **kwargs):
+    """
+    根据文件后缀创建对应的存储
+    :param file_path: 存储路径，后缀为.jsonl/.csv/.parquet
+    :param kwargs: 传给存储类的参数，如batch_size、fsync_interval
+    :return: CommentSink
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix not in SINKS:
+        raise ValueError(f"不支持的存储格式：{suffix}，可选 {list(SINKS)}")
+    return SINKS[suffix](file_path, **kwargs)
+
+
+def _truncate_partial_line(file_path):
+    """
+    截掉文件末尾不完整的一行（上次崩溃时写了一半的数据）
+    """
+    with open(file_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - 1, 0))
+        if f.read(1) == b'\n':
+            return
+        # 从后往前找到最后一个换行符
+        pos = size
+        while pos > 0:
+            step = min(65536, pos)
+            pos = pos - step
+            f.seek(pos)
+            chunk = f.read(step)
+            index = chunk.rfind(b'\n')
+            if index != -1:
+                f.truncate(pos + index + 1)
+                return
+        f.truncate(0)
+
+
+def read_comments(file_path):
+    """
+    读取存储中的评论数据
+    :param file_path: 存储路径，后缀为.jsonl/.csv/.parquet/.xlsx
+    :return: 数据框df
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == '.jsonl':
+        records = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 崩溃时写了一半的最后一行
+                    break
+        return pd.DataFrame.from_records(records, columns=COLUMNS)
+    if suffix == '.csv':
+        return pd.read_csv(file_path)
+    if suffix == '.parquet':
+        if file_path.is_dir():
+            parts = sorted(file_path.glob('part-*.parquet'))
+            if not parts:
+                return pd.DataFrame(columns=COLUMNS)
+            return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+        return pd.read_parquet(file_path)
+    if suffix == '.xlsx':
+        return pd.read_excel(file_path)
+    raise ValueError(f"不支持的存储格式：{suffix}")
+
+
+def export_excel(file_path, xlsx_path):
+    """
+    把存储中的评论数据一次性导出为Excel表格，爬取时间文件也复制一份给Excel表格
+    :param file_path: 存储路径
+    :param xlsx_path: 导出的Excel文件路径
+    :return: 导出的行数
+    """
+    df = read_comments(file_path)
+    df.to_excel(xlsx_path, index=False)
+    if crawl_time_path(file_path).exists():
+        shutil.copyfile(crawl_time_path(file_path), crawl_time_path(xlsx_path))
+    return len(df)
@@ -0,0 +1,280 @@
+# 多视频并发爬取调度
+# 给定一组BV号或视频链接，启动N个爬取会话（每个会话一个浏览器驱动或一个接口客户端）同时爬取，
+# 每个会话限制爬取频率并在失败时重试，每个视频的评论分别存储到以视频标题命名的文件中
+
+import logging
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.edge.options import Options
+
+from checkpoint import CrawlCheckpoint
+from comment_sink import crawl_time_path, export_excel, open_sink
+from data_acquisition import ensure_login, get_comments
+from login_session import COOKIE_PATH, cookie_dict, is_session_valid, read_cookies
+from metrics import CrawlMetrics
+from reply_api import ReplyApiClient, parse_bvid
+
+VIDEO_URL = 'https://www.bilibili.com/video/{bvid}/'
+
+# 与爬虫使用同一个日志记录器，多个会话线程同时输出时每条消息不会交错
+logger = logging.getLogger('data_acquisition')
+
+
+def safe_filename(title, max_length=100):
+    """
+    把视频标题转换成合法的文件名
+    :param title: 视频标题
+    :param max_length: 文件名最大长度
+    :return: 文件名（不含后缀）
+    """
+    title = re.sub(r'_哔哩哔哩_bilibili$', '', title.strip())
+    title = re.sub(r'[\\/:*?"<>|\r\n\t]', '_', title).strip(' .')
+    return title[:max_length] or 'untitled'
+
+
+def output_stem(title, bvid):
+    """
+    视频的存储文件名（不含后缀）：视频标题加BV号
+    同名的视频（合集、重新上传）或截断后同名的标题不会写入同一个存储和断点
+    :param title: 视频标题
+    :param bvid: BV号
+    """
+    return f'{safe_filename(title)}_{bvid}'
+
+
+def create_edge_driver(headless=False, profile_dir=None):
+    """
+    创建Edge浏览器驱动
+    :param headless: 是否无界面运行
+    :param profile_dir: 浏览器用户数据目录，使用固定目录可以保留登录状态；同一目录不能被多个浏览器同时使用
+    :return: 驱动
+    """
+    options = Options()
+    options.add_argument("--start-maximized")  # 全屏打开
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={Path(profile_dir).resolve()}")
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    return webdriver.Edge(options=options)
+
+
+class BrowserSession:
+    """
+    浏览器爬取会话，一个会话独占一个浏览器驱动
+    """
+
+    def __init__(self, driver_factory=create_edge_driver, mode='script', cookie_path=COOKIE_PATH):
+        self.driver_factory = driver_factory
+        self.mode = mode
+        self.cookie_path = cookie_path
+        self.driver = None
+
+    @property
+    def is_open(self):
+        return self.driver is not None
+
+    def open(self, url):
+        self.driver = self.driver_factory()
+        ensure_login(webdriver=self.driver, url=url, cookie_path=self.cookie_path)
+
+    def crawl(self, bvid, output_dir, suffix, resume=True):
+        """
+        爬取一个视频的评论
+        :param resume: 是否从断点继续，否则删除已有数据重新爬取
+        :return: (视频标题, 存储路径, 本次爬取的评论数)
+        """
+        self.driver.get(VIDEO_URL.format(bvid=bvid))
+        title = safe_filename(self.driver.title)
+        sink_path = Path(output_dir) / (output_stem(self.driver.title, bvid) + suffix)
+        if not resume:
+            _remove_partial(sink_path)
+        metrics = CrawlMetrics(labels={'bvid': bvid, 'mode': self.mode})
+        with open_sink(sink_path) as sink:
+            checkpoint = CrawlCheckpoint.for_sink(sink) if resume else None
+            get_comments(webdriver=self.driver, sink=sink, mode=self.mode, checkpoint=checkpoint, metrics=metrics)
+        # 每个视频的爬取统计追加到输出目录下的crawl_metrics.jsonl
+        metrics.export(Path(output_dir) / 'crawl_metrics.jsonl')
+        return title, sink_path, sink.rows_written
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+class ApiSession:
+    """
+    接口爬取会话，一个会话独占一个接口客户端（连接池）
+    """
+
+    def __init__(self, cookie_path=COOKIE_PATH, **client_kwargs):
+        self.cookie_path = cookie_path
+        self.client_kwargs = client_kwargs
+        self.client = None
+
+    @property
+    def is_open(self):
+        return self.client is not None
+
+    def open(self, url):
+        # 有效的登录cookies可以获取到更完整的评论
+        kwargs = dict(self.client_kwargs)
+        cookies = read_cookies(self.cookie_path)
+        if 'cookies' not in kwargs and is_session_valid(cookies):
+            kwargs['cookies'] = cookie_dict(cookies)
+        self.client = ReplyApiClient(**kwargs)
+
+    def crawl(self, bvid, output_dir, suffix, resume=True):
+        video = self.client.get_video(bvid)
+        title = safe_filename(video['title'])
+        sink_path = Path(output_dir) / (output_stem(video['title'], bvid) + suffix)
+        if not resume:
+            _remove_partial(sink_path)
+        with open_sink(sink_path) as sink:
+            checkpoint = CrawlCheckpoint.for_sink(sink) if resume else None
+            self.client.crawl(video['aid'], sink, checkpoint=checkpoint)
+        return title, sink_path, sink.rows_written
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+def _remove_partial(sink_path):
+    """
+    不从断点继续时，重新爬取前删除已有的数据、断点和爬取时间，避免重复
+    """
+    if sink_path.is_dir():
+        for part in sink_path.iterdir():
+            part.unlink()
+    elif sink_path.exists():
+        sink_path.unlink()
+    for path in (Path(f'{sink_path}.checkpoint.json'), crawl_time_path(sink_path)):
+        if path.exists():
+            path.unlink()
+
+
+class CrawlScheduler:
+    """
+    多视频并发爬取调度器
+    """
+
+    def __init__(self, videos, session_factory=BrowserSession, workers=2, output_dir='../data_raw',
+                 suffix='.jsonl', min_interval=10.0, retries=2, export_xlsx=True, resume=True):
+        """
+        :param videos: BV号或视频链接的列表
+        :param session_factory: 创建爬取会话的函数，如BrowserSession、ApiSession
+        :param workers: 同时运行的会话数
+        :param output_dir: 存储目录
+        :param suffix: 存储格式，.jsonl/.csv/.parquet
+        :param min_interval: 每个会话开始爬取两个视频之间的最小间隔（秒）
+        :param retries: 每个视频失败后的重试次数
+        :param export_xlsx: 每个视频爬取完成后是否导出Excel表格，供数据清洗使用
+        :param resume: 是否断点续爬：失败重试和再次运行时跳过已存储的评论，已完整爬取过的视频只获取新评论
+        """
+        self.bvids = [parse_bvid(video) for video in videos]
+        self.session_factory = session_factory
+        self.workers = workers
+        self.output_dir = Path(output_dir)
+        self.suffix = suffix
+        self.min_interval = min_interval
+        self.retries = retries
+        self.export_xlsx = export_xlsx
+        self.resume = resume
+        self.results = []  # 每个视频的爬取结果
+        self._lock = threading.Lock()
+
+    def _crawl_with_retry(self, session, bvid):
+        """
+        爬取一个视频，失败后重新建立会话并重试
+        """
+        for attempt in range(self.retries + 1):
+            start_time = time.time()
+            try:
+                if not session.is_open:
+                    session.open(VIDEO_URL.format(bvid=bvid))
+                title, sink_path, count = session.crawl(bvid, self.output_dir, self.suffix, self.resume)
+                if self.export_xlsx:
+                    export_excel(sink_path, sink_path.with_suffix('.xlsx'))
+                return {'bvid': bvid, 'title': title, 'path': str(sink_path), 'comments': count,
+                        'seconds': time.time() - start_time, 'attempts': attempt + 1, 'error': None}
+            except Exception as e:
+                logger.warning("%s 第%s次爬取失败：%r", bvid, attempt + 1, e)
+                error = repr(e)
+                # 会话可能已损坏（如浏览器崩溃），关闭后在下次重试时重新建立
+                session.close()
+                if attempt < self.retries:
+                    time.sleep(2 ** attempt)
+        return {'bvid': bvid, 'title': None, 'path': None, 'comments': 0, 'seconds': 0.0,
+                'attempts': self.retries + 1, 'error': error}
+
+    def _worker(self, tasks, worker_index):
+        session = self.session_factory()
+        last_start = 0.0
+        try:
+            while True:
+                try:
+                    bvid = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                # 限制每个会话的爬取频率
+                wait = self.min_interval - (time.time() - last_start)
+                if wait > 0:
+                    time.sleep(wait)
+                last_start = time.time()
+                result = self._crawl_with_retry(session, bvid)
+                result['worker'] = worker_index
+                with self._lock:
+                    self.results.append(result)
+                logger.info("[会话%s] %s 评论 %s 条，耗时 %.1f 秒", worker_index, result['title'] or bvid,
+                            result['comments'], result['seconds'])
+        finally:
+            session.close()
+
+    def run(self):
+        """
+        开始爬取，所有视频爬取完成后返回汇总信息
+        :return: 汇总字典，包含每个视频的结果、评论总数、总耗时和每秒爬取评论数
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tasks = queue.Queue()
+        for bvid in self.bvids:
+            tasks.put(bvid)
+
+        start_time = time.time()
+        threads = [threading.Thread(target=self._worker, args=(tasks, i), daemon=True)
+                   for i in range(min(self.workers, len(self.bvids)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start_time
+
+        total = sum(result['comments'] for result in self.results)
+        summary = {
+            'videos': self.results,
+            'comments': total,
+            'seconds': elapsed,
+            'comments_per_second': total / elapsed if elapsed else 0.0,
+            'failed': [result['bvid'] for result in self.results if result['error']],
+        }
+        logger.info("共爬取视频 %s 个，评论 %s 条，耗时 %.1f 秒，%.1f 条/秒，失败 %s 个", len(self.results), total, elapsed,
+                    summary['comments_per_second'], len(summary['failed']))
+        return summary
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='>>>%(message)s')
+    # 要爬取的视频，BV号或链接都可以
+    videos = [
+        'https://www.bilibili.com/video/BV1r1r6YfEhv/',
+    ]
+    scheduler = CrawlScheduler(videos, session_factory=BrowserSession, workers=2)
+    scheduler.run()
@@ -1,86 +1,145 @@
 # 爬取哔哩哔哩上所需的数据
+import logging
 import re
+import threading
 import time
+from collections import Counter
 
 from selenium import webdriver
-from selenium.common import NoSuchElementException
+from selenium.common import NoSuchElementException, TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.edge.options import Options
 
-import openpyxl
-import os
+from checkpoint import CrawlCheckpoint, comment_key
+from comment_extractor import expand_replies, extract_threads, read_reply_page, reply_signature, thread_count
+from comment_sink import JsonlSink, export_excel, open_sink
+from login_session import COOKIE_PATH, is_session_valid, load_cookies, load_credentials, read_cookies, save_cookies
+from metrics import CrawlMetrics
+from waits import AdaptiveWait, in_viewport
 
 
 # 优化方向：
-# 1.自定义存储路径和文件名，而不是固定存储到data/data_raw.xlsx
-# 2.爬取视频的网站名字作为文件名,不需要手动输入
-# 3.改成多线程，一次进行多个视频评论的爬取，然后数据分别对应存储到不同的表格中
+# 1.自定义存储路径和文件名，而不是固定存储到data/data_raw.xlsx（已完成，见comment_sink.py）
+# 2.爬取视频的网站名字作为文件名,不需要手动输入（已完成，见crawl_scheduler.py）
+# 3.改成多线程，一次进行多个视频评论的爬取，然后数据分别对应存储到不同的表格中（已完成，见crawl_scheduler.py）
 
 # 错误:
 # 1.查看分页回复不能直接点击对应的分页按钮,会疏忽很多回复页面的内容,要点下一页按钮,没有下一页按钮,那就说明到底了
 
-def login(webdriver, url):
+# 各类等待的超时时间（秒），未列出的使用AdaptiveWait的默认超时
+WAIT_TIMEOUTS = {
+    'login_done': 60,  # 登录可能需要手动完成验证码
+    'feed_grow': 5,  # 超过这个时间没有加载出新评论，认为评论已全部加载完毕
+}
+# 改为条件等待之前，各类等待固定睡眠的秒数，用于对比节省的时间
+FIXED_SLEEPS = {
+    'login_page': 5,
+    'login_modal': 5,
+    'login_done': 30,
+    'thread_rendered': 0.5,
+    'scroll': 0.75,
+    'replies_loaded': 2,
+    'next_page': 2,
+}
+
+# 日志：进度用INFO级别，逐条评论的细节用DEBUG级别（默认不输出，循环中先判断级别再格式化消息）
+logger = logging.getLogger('data_acquisition')
+
+# 多个爬取会话同时启动时，只让一个会话完整登录，其余会话等它保存cookies后直接复用
+_login_lock = threading.Lock()
+
+
+def login(webdriver, url, waiter=None, account=None, password=None):
     """
     登录
     :param webdriver: 驱动
     :param url: 目标网页地址
+    :param waiter: 条件等待（见waits），默认新建一个
+    :param account: 账号，默认从环境变量或配置文件读取（见login_session.load_credentials）
+    :param password: 密码，同上
     :return:
     """
-    # 打开目标链接
+    if waiter is None:
+        waiter = AdaptiveWait(timeouts=WAIT_TIMEOUTS)
+    if account is None or password is None:
+        account, password = load_credentials()
+    # 打开目标链接，等待登录入口出现
     webdriver.get(url)
-    time.sleep(5)
+    header_login_entry = waiter.until(
+        lambda: webdriver.find_element(By.CSS_SELECTOR, 'div.header-login-entry'), 'login_page',
+        raise_on_timeout=True)
     # 登录
-    print(">>>进行登录")
-    header_login_entry = webdriver.find_element(By.CSS_SELECTOR, 'div.header-login-entry')
+    logger.info("进行登录")
     header_login_entry.click()
-    time.sleep(5)
     # 账号输入框
-    print(">>>输入账号")
-    account = webdriver.find_element(By.XPATH, '/html/body/div[8]/div/div[4]/div[2]/form/div[1]/input')
-    account.send_keys('15347602198')
+    logger.info("输入账号")
+    account_input = waiter.until(
+        lambda: webdriver.find_element(By.XPATH, '/html/body/div[8]/div/div[4]/div[2]/form/div[1]/input'),
+        'login_modal', raise_on_timeout=True)
+    account_input.send_keys(account)
     # 密码输入框
-    print(">>>输入密码")
-    password = webdriver.find_element(By.XPATH, '/html/body/div[8]/div/div[4]/div[2]/form/div[3]/input')
-    password.send_keys('zhuyulin1015')
+    logger.info("输入密码")
+    password_input = webdriver.find_element(By.XPATH, '/html/body/div[8]/div/div[4]/div[2]/form/div[3]/input')
+    password_input.send_keys(password)
     # 登录按钮
-    print(">>>点击登录")
+    logger.info("点击登录")
     login_btn = webdriver.find_element(By.CSS_SELECTOR, 'body .bili-mini-mask .btn_wp div:nth-child(2)')
     login_btn.click()
-    time.sleep(30)
-
-
-def save_comments(file_path, comments):
-    if os.path.exists(file_path):
-        # 如果文件存在，打开
-        workbook = openpyxl.load_workbook(file_path)
-        sheet = workbook.active
-    else:
-        # 如果文件不存在，则创建新的工作薄和工作表
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        # 新文件，写入表头信息
-        sheet.append(['id', 'contents', 'parent_id', 'pubdate', 'like_count'])
+    # 登录弹窗关闭、登录入口消失，说明登录完成
+    waiter.until(lambda: not webdriver.find_elements(By.CSS_SELECTOR, 'div.header-login-entry, .bili-mini-mask'),
+                 'login_done')
 
-    # 遍历存入评论数据
-    for comment in comments:
-        sheet.append(comment)
 
-    print(">>>一条父评论及其子评论数据已存入")
-    # 保存文件
-    workbook.save(file_path)
-    print(">>>文件已保存")
+def ensure_login(webdriver, url, cookie_path=COOKIE_PATH, waiter=None):
+    """
+    优先复用保存的cookies，cookies失效时才完整登录，登录后保存cookies供下次和其他会话使用
+    :param webdriver: 驱动
+    :param url: 目标网页地址
+    :param cookie_path: cookies文件路径
+    :param waiter: 条件等待（见waits），默认新建一个
+    :return: 是否复用了保存的cookies
+    """
+    with _login_lock:
+        cookies = read_cookies(cookie_path)
+        if is_session_valid(cookies):
+            logger.info("复用已保存的登录状态")
+            load_cookies(webdriver, cookies)
+            webdriver.get(url)
+            return True
+        login(webdriver=webdriver, url=url, waiter=waiter)
+        save_cookies(webdriver, cookie_path)
+        logger.info("登录状态已保存")
+        return False
 
 
 # 1.使用By.TAG_NAME获取元素时，只能查找当前元素的直接子元素
 # 2.运行js脚本，让页面滚动到指定元素的位置
 # 3.使用 find_element() 或 find_elements() 获取元素时，Selenium 返回的是该 DOM 元素的引用（指向该元素的对象）。这个引用会保持同步，并且它与页面中的真实元素保持一致。
 # 4.如果不是使用Selenium接口中相关方法，不会与页面中元素实时保持同步如len(元素)，而是元素当前快照时的状态（即初始获取这个元素时候的状态）
-def get_comments(webdriver):
+def get_comments(webdriver, sink=None, mode='element', waiter=None, checkpoint=None, metrics=None):
     """
     获取评论内容、二级评论内容、评论发布时间、评论点赞数
     :param webdriver: 驱动
-    :return:
+    :param sink: 评论存储（见comment_sink），由调用者关闭；默认追加写入../data_raw/data_raw.jsonl，爬取结束后关闭
+    :param mode: 提取方式，'element'：逐个元素调用find_element；'script'：在浏览器内执行js脚本批量提取
+    :param waiter: 条件等待（见waits），默认新建一个
+    :param checkpoint: 断点（见checkpoint），为None时不记录断点
+    :param metrics: 爬取统计（见metrics），默认新建一个
+    :return: 爬取统计，包括各阶段耗时、WebDriver请求数、评论和回复数
     """
+    if sink is None:
+        # 默认的存储在这里创建，也在这里关闭（爬取出错时同样关闭）
+        with JsonlSink('../data_raw/data_raw.jsonl') as sink:
+            return get_comments(webdriver, sink, mode, waiter, checkpoint, metrics)
+    if waiter is None:
+        waiter = AdaptiveWait(timeouts=WAIT_TIMEOUTS)
+    if metrics is None:
+        metrics = CrawlMetrics()
+    metrics.watch_driver(webdriver)
+    if mode == 'script':
+        get_comments_by_script(webdriver, sink, waiter, checkpoint, metrics)
+        return metrics
+    debug = logger.isEnabledFor(logging.DEBUG)
     # 评论区
     # print(">>>评论区")
     comment_app = webdriver.find_element(By.ID, 'commentapp')
@@ -91,22 +150,36 @@ def get_comments(webdriver):
     # print(">>>将页面滚动到指定元素的位置")
     webdriver.execute_script('arguments[0].scrollIntoView()', comment_app)
 
-    time.sleep(0.5)
-    # 所以评论id
+    def load_threads():
+        feed = bili_comments_shadow.find_element(By.ID, 'feed')
+        return feed.find_elements(By.TAG_NAME, 'bili-comment-thread-renderer')
+
+    def more_threads():
+        # 评论列表比已爬取的父评论数多，说明加载出了新评论
+        threads = load_threads()
+        return threads if len(threads) > parent_comments_index else None
+
+    # 所以评论id，断点续爬时接着上次的id
     comment_id = 1
+    if checkpoint is not None:
+        checkpoint.restore(sink)
+        comment_id = checkpoint.next_id
     # 父评论索引
     parent_comments_index = 0
+    # 内容标识 -> 已爬取到的内容相同的父评论数
+    occurrences = Counter()
     # 父评论id
     parent_comment_id = 0
     while True:
         # 评论与二级评论
         # print(">>>评论与二级评论")
-        feed = bili_comments_shadow.find_element(By.ID, 'feed')
-        bili_comment_thread_renderers = feed.find_elements(By.TAG_NAME, 'bili-comment-thread-renderer')
+        # 等待评论列表加载出新评论
+        with metrics.phase('wait_feed'):
+            bili_comment_thread_renderers = waiter.until(more_threads, 'feed_grow')
         # print(f">>>评论数量 {len(bili_comment_thread_renderers)}")
 
-        # 评论全部加载完毕，退出循环
-        if parent_comments_index >= len(bili_comment_thread_renderers):
+        # 超时仍没有新评论，评论全部加载完毕，退出循环
+        if not bili_comment_thread_renderers:
             # print(">>>评论全部加载并爬取完毕，退出循环")
             # print(f">>>共爬取父评论数 {parent_comments_index}")
             break
@@ -114,40 +187,51 @@ def get_comments(webdriver):
             # 存储一条父评论，及其子评论
             comments = []
             # 获取shadow DOM
-            bili_comment_thread_renderer_shadow = bili_comment_thread_renderers[parent_comments_index].shadow_root
+            bili_comment_thread_renderer = bili_comment_thread_renderers[parent_comments_index]
+            bili_comment_thread_renderer_shadow = bili_comment_thread_renderer.shadow_root
 
             # 将页面滚动到该条评论的位置
             # print(">>>滚动到评论的位置")
-            webdriver.execute_script('arguments[0].scrollIntoView()',
-                                     bili_comment_thread_renderers[parent_comments_index])
-            time.sleep(0.5)
+            with metrics.phase('scroll'):
+                webdriver.execute_script('arguments[0].scrollIntoView()', bili_comment_thread_renderer)
 
             # 获取父评论的内容、发布时间、点赞数
-            # 内容
-            bili_comment_renderer = bili_comment_thread_renderer_shadow.find_element(By.ID,
-                                                                                     'comment')
-            bili_comment_renderer_shadow = bili_comment_renderer.shadow_root
-            content = bili_comment_renderer_shadow.find_element(By.ID, 'content')
-            bili_rich_text = content.find_element(By.TAG_NAME, 'bili-rich-text')
-            bili_rich_text_shadow = bili_rich_text.shadow_root
-            contents = bili_rich_text_shadow.find_element(By.ID, 'contents')
-            parent_comment_text = contents.text  # 获取该元素及其所有子元素的文本内容
-            # print(f">>>父评论内容\n {parent_comment_text}")
-            # 发布时间
-            footer = bili_comment_renderer_shadow.find_element(By.ID, 'footer')
-            bili_comment_action_buttons_renderer = footer.find_element(By.TAG_NAME,
-                                                                       'bili-comment-action-buttons-renderer')
-            bili_comment_action_buttons_renderer_shadow = bili_comment_action_buttons_renderer.shadow_root
-            pubdate = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'pubdate')
-            parent_comment_pubdate = pubdate.text
-            # print(f">>>父评论发布时间 {parent_comment_pubdate}")
-            # 点赞数
-            count = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'count')
-            parent_comment_like = count.text
-            # print(f">>>父评论点赞数 {parent_comment_like}")
+            with metrics.phase('extract'):
+                # 内容，等待评论渲染出来
+                bili_comment_renderer = waiter.until(
+                    lambda: bili_comment_thread_renderer_shadow.find_element(By.ID, 'comment'), 'thread_rendered',
+                    raise_on_timeout=True)
+                bili_comment_renderer_shadow = bili_comment_renderer.shadow_root
+                content = bili_comment_renderer_shadow.find_element(By.ID, 'content')
+                bili_rich_text = content.find_element(By.TAG_NAME, 'bili-rich-text')
+                bili_rich_text_shadow = bili_rich_text.shadow_root
+                contents = bili_rich_text_shadow.find_element(By.ID, 'contents')
+                parent_comment_text = contents.text  # 获取该元素及其所有子元素的文本内容
+                # 发布时间
+                footer = bili_comment_renderer_shadow.find_element(By.ID, 'footer')
+                bili_comment_action_buttons_renderer = footer.find_element(By.TAG_NAME,
+                                                                           'bili-comment-action-buttons-renderer')
+                bili_comment_action_buttons_renderer_shadow = bili_comment_action_buttons_renderer.shadow_root
+                pubdate = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'pubdate')
+                parent_comment_pubdate = pubdate.text
+                # 点赞数
+                count = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'count')
+                parent_comment_like = count.text
+            if debug:
+                logger.debug("父评论 %s %s 点赞 %s\n%s", parent_comments_index + 1, parent_comment_pubdate,
+                             parent_comment_like, parent_comment_text)
+
+            # 断点续爬时跳过已存储的父评论
+            base_key = comment_key(parent_comment_text, parent_comment_pubdate)
+            thread_key = comment_key(parent_comment_text, parent_comment_pubdate, occurrence=occurrences[base_key])
+            occurrences[base_key] += 1
+            if checkpoint is not None and checkpoint.is_done(thread_key):
+                parent_comments_index = parent_comments_index + 1
+                metrics.add('skipped_threads')
+                continue
 
             # 存储父评论
-            comments.append([comment_id, parent_comment_text, 'null', parent_comment_pubdate, parent_comment_like])
+            comments.append([comment_id, parent_comment_text, None, parent_comment_pubdate, parent_comment_like])
 
             # 评论数+1
             parent_comments_index = parent_comments_index + 1
@@ -156,11 +240,12 @@ def get_comments(webdriver):
             # 评论id 自增1
             comment_id = comment_id + 1
 
-            print(f">>>爬取父评论数 {parent_comments_index}")
+            metrics.add('threads')
+            if debug:
+                logger.debug("爬取父评论数 %s", parent_comments_index)
             replies_num = 0  # 每条评论回复评论的数量
             try:
                 # 查看回复按钮
-                print(">>>查看回复按钮")
                 replies = bili_comment_thread_renderer_shadow.find_element(By.ID, 'replies')
                 bili_comment_replies_renderer = replies.find_element(By.TAG_NAME, 'bili-comment'
                                                                                   '-replies-renderer')
@@ -180,104 +265,237 @@ def get_comments(webdriver):
                 bili_text_button_shadow = bili_text_button.shadow_root
                 button = bili_text_button_shadow.find_element(By.CLASS_NAME, 'button')
                 # 将页面滚动对应位置，在屏幕中能够显示，才能够被点击
-                webdriver.execute_script('arguments[0].scrollIntoView()', button)
-                time.sleep(0.5)
-                webdriver.execute_script('window.scrollBy(0, -100)')
-                time.sleep(0.25)
-                print(">>>点击查看回复按钮")
-                button.click()
-                time.sleep(2)  # 如果报错，很有可能是回复还没加载出来，在此处适当增加睡眠时间即可
+                with metrics.phase('scroll'):
+                    webdriver.execute_script('arguments[0].scrollIntoView(); window.scrollBy(0, -100)', button)
+                    waiter.until(lambda: in_viewport(webdriver, button), 'scroll')
+                with metrics.phase('expand'):
+                    signature = reply_signature(webdriver, bili_comment_thread_renderer)
+                    button.click()
+                    # 等待回复内容变化，说明回复已加载出来
+                    waiter.until(lambda: reply_signature(webdriver, bili_comment_thread_renderer) != signature,
+                                 'replies_loaded')
+                metrics.add('expanded_threads')
+                if debug:
+                    logger.debug("点击查看回复按钮，共 %s 条回复", replies_num)
             except NoSuchElementException:
                 # 没有查看回复按钮：1.可能是回复评论很少，不用分页就直接显示了 2.没有回复评论
                 # 对于第1种情况需要获取评论的信息
-                print(">>>没有查看回复按钮")
+                if debug:
+                    logger.debug("没有查看回复按钮")
 
             # 爬取二级评论
             paging_exist = True  # 分页按钮是否存在的标志
             # 获取分页按钮元素
             try:
                 pagination_body = bili_comment_replies_renderer_shadow.find_element(By.ID, 'pagination-body')
-                webdriver.execute_script('arguments[0].scrollIntoView()', pagination_body)
-                time.sleep(0.5)
-                webdriver.execute_script('window.scrollBy(0,-100)')
-                time.sleep(0.25)
+                with metrics.phase('scroll'):
+                    webdriver.execute_script('arguments[0].scrollIntoView(); window.scrollBy(0, -100)',
+                                             pagination_body)
+                    waiter.until(lambda: in_viewport(webdriver, pagination_body), 'scroll')
             except NoSuchElementException:
                 # 没有分页按钮
-                print("没有多个分页按钮")
+                if debug:
+                    logger.debug("没有多个分页按钮")
                 paging_exist = False
             while True:
                 # 获取回复内容
-                expander_contents = bili_comment_replies_renderer_shadow.find_element(By.ID,
-                                                                                      'expander-contents')
-                bili_comment_reply_renderers = expander_contents.find_elements(By.TAG_NAME,
-                                                                               'bili-comment-reply-renderer')
-
-                # 遍历每个评论
-                for bili_comment_reply_renderer in bili_comment_reply_renderers:
-                    bili_comment_reply_renderer_shadow = bili_comment_reply_renderer.shadow_root
-                    main = bili_comment_reply_renderer_shadow.find_element(By.ID, 'main')
-                    footer = bili_comment_reply_renderer_shadow.find_element(By.ID, 'footer')
-                    # 评论内容
-                    bili_rich_text = main.find_element(By.TAG_NAME, 'bili-rich-text')
-                    bili_rich_text_shadow = bili_rich_text.shadow_root
-                    contents = bili_rich_text_shadow.find_element(By.ID, 'contents')
-                    son_comment_text = contents.text
-                    # print(f">>>子评论内容\n {son_comment_text}")
-                    # 发布时间、点赞数
-                    # 发布时间
-                    bili_comment_action_buttons_renderer = footer.find_element(By.TAG_NAME,
-                                                                               'bili-comment-action-buttons'
-                                                                               '-renderer')
-                    bili_comment_action_buttons_renderer_shadow = bili_comment_action_buttons_renderer.shadow_root
-                    pubdate = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'pubdate')
-                    son_comment_pubdate = pubdate.text
-                    # print(f">>>子评论发布时间 {son_comment_pubdate}")
-                    # 点赞数
-                    count = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'count')
-                    son_comment_like = count.text
-                    # print(f">>>子评论点赞数 {son_comment_like}")
-
-                    # 存储子评论
-                    comments.append([comment_id, son_comment_text, parent_comment_id, son_comment_pubdate,
-                                     son_comment_like])
-                    # 评论id自增1
-                    comment_id = comment_id + 1
+                with metrics.phase('extract'):
+                    expander_contents = bili_comment_replies_renderer_shadow.find_element(By.ID,
+                                                                                          'expander-contents')
+                    bili_comment_reply_renderers = expander_contents.find_elements(By.TAG_NAME,
+                                                                                   'bili-comment-reply-renderer')
+
+                    # 遍历每个评论
+                    for bili_comment_reply_renderer in bili_comment_reply_renderers:
+                        bili_comment_reply_renderer_shadow = bili_comment_reply_renderer.shadow_root
+                        main = bili_comment_reply_renderer_shadow.find_element(By.ID, 'main')
+                        footer = bili_comment_reply_renderer_shadow.find_element(By.ID, 'footer')
+                        # 评论内容
+                        bili_rich_text = main.find_element(By.TAG_NAME, 'bili-rich-text')
+                        bili_rich_text_shadow = bili_rich_text.shadow_root
+                        contents = bili_rich_text_shadow.find_element(By.ID, 'contents')
+                        son_comment_text = contents.text
+                        # 发布时间、点赞数
+                        # 发布时间
+                        bili_comment_action_buttons_renderer = footer.find_element(By.TAG_NAME,
+                                                                                   'bili-comment-action-buttons'
+                                                                                   '-renderer')
+                        bili_comment_action_buttons_renderer_shadow = \
+                            bili_comment_action_buttons_renderer.shadow_root
+                        pubdate = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'pubdate')
+                        son_comment_pubdate = pubdate.text
+                        # 点赞数
+                        count = bili_comment_action_buttons_renderer_shadow.find_element(By.ID, 'count')
+                        son_comment_like = count.text
+                        if debug:
+                            logger.debug("子评论 %s 点赞 %s\n%s", son_comment_pubdate, son_comment_like,
+                                         son_comment_text)
+
+                        # 存储子评论
+                        comments.append([comment_id, son_comment_text, parent_comment_id, son_comment_pubdate,
+                                         son_comment_like])
+                        # 评论id自增1
+                        comment_id = comment_id + 1
+                metrics.add('replies', len(bili_comment_reply_renderers))
+                metrics.add('reply_pages')
 
                 # 获取下一页按钮
                 if paging_exist:
-                    # 重新获取页面按钮元素集合
-                    bili_text_buttons = pagination_body.find_elements(By.TAG_NAME, 'bili-text-button')
-                    # 如果有下一页，最后一个元素是“下一页”按钮
-                    bili_text_button = bili_text_buttons[len(bili_text_buttons) - 1]
-                    # print(f">>>最后一个分页按钮内容： {bili_text_button.text}")
-                    if bili_text_button.text == '下一页':
+                    with metrics.phase('paginate'):
+                        # 重新获取页面按钮元素集合
+                        bili_text_buttons = pagination_body.find_elements(By.TAG_NAME, 'bili-text-button')
+                        # 如果有下一页，最后一个元素是“下一页”按钮
+                        bili_text_button = bili_text_buttons[len(bili_text_buttons) - 1]
+                        has_next = bili_text_button.text == '下一页'
+                    if has_next:
                         # 移动页面
-                        webdriver.execute_script('arguments[0].scrollIntoView()', bili_text_button)
-                        time.sleep(0.5)
-                        webdriver.execute_script('window.scrollBy(0, -100)')
-                        time.sleep(0.25)
-                        bili_text_button.click()
-                        time.sleep(2)
+                        with metrics.phase('scroll'):
+                            webdriver.execute_script('arguments[0].scrollIntoView(); window.scrollBy(0, -100)',
+                                                     bili_text_button)
+                            waiter.until(lambda: in_viewport(webdriver, bili_text_button), 'scroll')
+                        with metrics.phase('paginate'):
+                            signature = reply_signature(webdriver, bili_comment_thread_renderer)
+                            bili_text_button.click()
+                            # 等待回复内容变化，说明已经翻到下一页
+                            waiter.until(
+                                lambda: reply_signature(webdriver, bili_comment_thread_renderer) != signature,
+                                'next_page')
                     else:
                         break
                 else:
                     break
 
             try:
-                pagination_foot = bili_comment_replies_renderer_shadow.find_element(By.ID, 'pagination-foot')
-                bili_text_button = pagination_foot.find_element(By.TAG_NAME, 'bili-text-button')
-                bili_text_button_shadow = bili_text_button.shadow_root
-                button = bili_text_button_shadow.find_element(By.CLASS_NAME, 'button')
-                button.click()
-                print(">>>点击收起按钮")
+                with metrics.phase('paginate'):
+                    pagination_foot = bili_comment_replies_renderer_shadow.find_element(By.ID, 'pagination-foot')
+                    bili_text_button = pagination_foot.find_element(By.TAG_NAME, 'bili-text-button')
+                    bili_text_button_shadow = bili_text_button.shadow_root
+                    button = bili_text_button_shadow.find_element(By.CLASS_NAME, 'button')
+                    button.click()
+                if debug:
+                    logger.debug("点击收起按钮")
             except NoSuchElementException:
-                print(">>>没有收起按钮")
+                if debug:
+                    logger.debug("没有收起按钮")
+
+            # 将一条父评论及其回复追加到存储中
+            with metrics.phase('persist'):
+                sink.write_rows(comments)
+                if checkpoint is not None:
+                    checkpoint.mark_done([thread_key], next_id=comment_id, sink=sink)
+            metrics.add('comments', len(comments))
+        logger.info("爬取父评论数 %s", parent_comments_index)
 
-            # 将一条父评论及其回复存储到表格中
-            save_comments(file_path='../data_raw/data_raw.xlsx', comments=comments)
+    # 爬取结束，写入剩余数据并刷盘
+    with metrics.phase('persist'):
+        if checkpoint is not None:
+            checkpoint.finish(sink)
+        else:
+            sink.flush(sync=True)
+    return metrics
+
+
+def get_comments_by_script(webdriver, sink, waiter, checkpoint=None, metrics=None):
+    """
+    通过js脚本批量提取评论，每次页面加载只需要一次WebDriver请求
+    :param webdriver: 驱动
+    :param sink: 评论存储
+    :param waiter: 条件等待
+    :param checkpoint: 断点，为None时不记录断点
+    :param metrics: 爬取统计，默认新建一个
+    :return: 爬取统计
+    """
+    if metrics is None:
+        metrics = CrawlMetrics()
+    comment_app = webdriver.find_element(By.ID, 'commentapp')
+    bili_comments = comment_app.find_element(By.TAG_NAME, 'bili-comments')
+    with metrics.phase('scroll'):
+        webdriver.execute_script('arguments[0].scrollIntoView()', comment_app)
+
+    comment_id = 1  # 所有评论id
+    if checkpoint is not None:
+        checkpoint.restore(sink)
+        comment_id = checkpoint.next_id
+    parent_comments_index = 0  # 父评论索引
+    occurrences = Counter()  # 内容标识 -> 已爬取到的内容相同的父评论数
+    while True:
+        # 一次请求取回所有新加载的父评论，并滚动页面以加载下一批；超时仍没有新评论，说明评论已全部加载完毕
+        # 等待时轮询extract_threads，父评论的提取和滚动都在这次等待中完成，耗时计入wait_feed
+        with metrics.phase('wait_feed'):
+            threads = waiter.until(lambda: extract_threads(webdriver, bili_comments, start=parent_comments_index),
+                                   'feed_grow')
+        if not threads:
+            # 还有父评论没有渲染出来时，与逐个元素提取时等待父评论渲染超时一样报错，不当作评论已全部加载
+            if thread_count(webdriver, bili_comments) > parent_comments_index:
+                raise TimeoutException(f"第{parent_comments_index + 1}条父评论没有渲染出来")
+            break
+
+        for thread in threads:
+            parent_comments_index = parent_comments_index + 1
+            # 断点续爬时跳过已存储的父评论，有rpid时只用rpid标识，否则用内容标识加上这是第几条内容相同的父评论
+            if thread['rpid']:
+                thread_key = comment_key(thread['text'], rpid=thread['rpid'])
+            else:
+                base_key = comment_key(thread['text'], thread['pubdate'])
+                thread_key = comment_key(thread['text'], thread['pubdate'], occurrence=occurrences[base_key])
+                occurrences[base_key] += 1
+            if checkpoint is not None and checkpoint.is_done(thread_key):
+                metrics.add('skipped_threads')
+                continue
+
+            comments = [[comment_id, thread['text'], None, thread['pubdate'], thread['like_count']]]
+            parent_comment_id = comment_id
+            comment_id = comment_id + 1
+
+            element = thread['element']
+            with metrics.phase('expand'):
+                signature = expand_replies(webdriver, element) if thread['has_view_more'] else None
+                if signature is not None:
+                    # 回复有分页，等回复加载出来
+                    waiter.until(lambda: reply_signature(webdriver, element) != signature, 'replies_loaded')
+            if signature is not None:
+                metrics.add('expanded_threads')
+                # 逐页读取回复，每页一次请求，读取时同时点击下一页
+                with metrics.phase('extract'):
+                    replies, has_next, signature = read_reply_page(webdriver, element)
+                pages = [replies]
+                while has_next:
+                    with metrics.phase('paginate'):
+                        waiter.until(lambda: reply_signature(webdriver, element) != signature, 'next_page')
+                    with metrics.phase('extract'):
+                        replies, has_next, signature = read_reply_page(webdriver, element)
+                    pages.append(replies)
+                metrics.add('reply_pages', len(pages))
+                replies = [reply for page in pages for reply in page]
+            else:
+                # 回复较少，已经全部显示
+                replies = thread['replies']
+
+            for reply in replies:
+                comments.append([comment_id, reply['text'], parent_comment_id, reply['pubdate'],
+                                 reply['like_count']])
+                comment_id = comment_id + 1
+            with metrics.phase('persist'):
+                sink.write_rows(comments)
+                if checkpoint is not None:
+                    checkpoint.mark_done([thread_key], next_id=comment_id, sink=sink)
+            metrics.add('threads')
+            metrics.add('replies', len(replies))
+            metrics.add('comments', len(comments))
+        logger.info("爬取父评论数 %s", parent_comments_index)
+
+    # 爬取结束，写入剩余数据并刷盘
+    with metrics.phase('persist'):
+        if checkpoint is not None:
+            checkpoint.finish(sink)
+        else:
+            sink.flush(sync=True)
+    return metrics
 
 
 if __name__ == '__main__':
+    # 日志级别，改为logging.DEBUG可以输出每条评论的内容
+    logging.basicConfig(level=logging.INFO, format='>>>%(message)s')
     # 设置网页打开配置选项
     options = Options()
     options.add_argument("--start-maximized")  # 全屏打开
@@ -288,13 +506,33 @@ if __name__ == '__main__':
     # 目标网页链接
     url = ("https://www.bilibili.com/video/BV1r1r6YfEhv/?spm_id_from=333.934.0.0&vd_source"
            "=fa17a360ca302344f8e38fc493ad2ecd")
-    # 登录
-    login(webdriver=webdriver, url=url)
+    # 评论存储路径，后缀可选.jsonl/.csv/.parquet
+    sink_path = '../data_raw/data_raw.jsonl'
+    # 条件等待，记录每次等待的实际耗时
+    waiter = AdaptiveWait(timeouts=WAIT_TIMEOUTS)
+    # 爬取统计，从登录开始记录
+    metrics = CrawlMetrics(labels={'video': 'BV1r1r6YfEhv'})
+    metrics.watch_driver(webdriver)
+    # 登录，保存的登录状态有效时直接复用
+    with metrics.phase('login'):
+        ensure_login(webdriver=webdriver, url=url, waiter=waiter)
     # 爬取评论
     # 耗时
     start_time = time.time()
-    get_comments(webdriver=webdriver)
+    with open_sink(sink_path) as sink:
+        # 断点文件与存储放在一起，中途出错后重新运行会从断点继续
+        checkpoint = CrawlCheckpoint.for_sink(sink)
+        get_comments(webdriver=webdriver, sink=sink, mode='script', waiter=waiter, checkpoint=checkpoint,
+                     metrics=metrics)
     end_time = time.time()
     # 计算运行时间
     execution_time = end_time - start_time
-    print(f">>>爬取评论耗时 {execution_time} 秒")
+    logger.info("爬取评论耗时 %.1f 秒，各阶段耗时：%s", execution_time, metrics.summary())
+    waiter.report(fixed_sleeps=FIXED_SLEEPS)
+    # 每次爬取的统计追加到jsonl文件，同时写一份Prometheus格式的文件
+    metrics.export('../data_raw/crawl_metrics.jsonl', waiter=waiter)
+    metrics.export('../data_raw/crawl_metrics.prom', waiter=waiter)
+
+    # 爬取结束后一次性导出为Excel表格，供数据清洗使用
+    rows = export_excel(sink_path, '../data_raw/data_raw.xlsx')
+    logger.info("已导出 %s 条评论到Excel", rows)
@@ -0,0 +1,246 @@
+# 评论区页面的录制与回放
+# 把评论区的DOM（包括所有shadow DOM）录制成本地html文件，shadow DOM保存为声明式的<template shadowrootmode="open">，
+# 浏览器打开本地文件时会重新挂上shadow root，提取脚本不需要联网就能在与线上相同的结构上运行；
+# 也可以把已爬取的评论表格生成为同样结构的html文件
+
+import functools
+import html
+import json
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+# 把一个节点及其shadow DOM序列化为html，shadow root里通过adoptedStyleSheets加载的样式也写成<style>，
+# 保证回放时元素的显示状态（影响innerText）与录制时一致
+# arguments[0]: 要录制的根元素  arguments[1]: 不录制的元素id列表
+CAPTURE_JS = r"""
+const VOID_TAGS = new Set(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source',
+                           'track', 'wbr']);
+const skipIds = new Set(arguments[1] || []);
+const escapeText = (value) => value.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+const escapeAttr = (value) => value.replace(/&/g, '&amp;').replace(/"/g, '&quot;');
+const sheetsOf = (root) => Array.from(root.adoptedStyleSheets || [])
+    .map((sheet) => Array.from(sheet.cssRules).map((rule) => rule.cssText).join('\n')).join('\n');
+const serializeChildren = (root) => Array.from(root.childNodes).map(serialize).join('');
+const serialize = (node) => {
+    if (node.nodeType === Node.TEXT_NODE) return escapeText(node.data);
+    if (node.nodeType !== Node.ELEMENT_NODE) return '';
+    const tag = node.localName;
+    if (tag === 'script' || skipIds.has(node.id)) return '';
+    let out = '<' + tag;
+    for (const attr of node.attributes) out += ' ' + attr.name + '="' + escapeAttr(attr.value) + '"';
+    out += '>';
+    if (VOID_TAGS.has(tag)) return out;
+    if (node.shadowRoot) {
+        const styles = sheetsOf(node.shadowRoot);
+        out += '<template shadowrootmode="open">' + (styles ? '<style>' + styles + '</style>' : '')
+            + serializeChildren(node.shadowRoot) + '</template>';
+    }
+    out += serializeChildren(tag === 'template' ? node.content : node);
+    return out + '</' + tag + '>';
+};
+return serialize(arguments[0]);
+"""
+
+# 录制时去掉的按钮区：录制的页面没有网站的js，按钮点了也不会加载回复，去掉后可见的回复按“回复较少直接显示”处理
+STATIC_SKIP_IDS = ['view-more', 'pagination-body', 'pagination-foot']
+
+# 生成的页面中模拟“查看回复”、回复分页和“收起”按钮的脚本，按钮点击后延迟LATENCY毫秒才显示回复，模拟网络加载
+# REPLY_DATA: {父评论序号: [[内容, 发布时间, 点赞数], ...]}，只包含需要分页查看的回复
+PAGING_JS = r"""
+const textButton = (label, onClick) => {
+    const host = document.createElement('bili-text-button');
+    host.textContent = label;
+    const button = document.createElement('button');
+    button.className = 'button';
+    button.appendChild(document.createElement('slot'));
+    button.addEventListener('click', onClick);
+    host.attachShadow({mode: 'open'}).appendChild(button);
+    return host;
+};
+const shadowHost = (tag, html) => {
+    const host = document.createElement(tag);
+    host.attachShadow({mode: 'open'}).innerHTML = html;
+    return host;
+};
+const escapeHtml = (value) => value.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+const replyRenderer = ([contents, pubdate, like]) => {
+    const renderer = shadowHost('bili-comment-reply-renderer', '<div id="main"></div><div id="footer"></div>');
+    renderer.shadowRoot.querySelector('#main').appendChild(shadowHost('bili-rich-text',
+        '<p id="contents"><span>' + escapeHtml(contents) + '</span></p>'));
+    renderer.shadowRoot.querySelector('#footer').appendChild(shadowHost('bili-comment-action-buttons-renderer',
+        '<div id="pubdate">' + escapeHtml(pubdate) + '</div><div id="like"><button><span id="count">'
+        + escapeHtml(like) + '</span></button></div>'));
+    return renderer;
+};
+const threads = document.querySelector('bili-comments').shadowRoot.querySelectorAll('bili-comment-thread-renderer');
+for (const [index, replies] of Object.entries(REPLY_DATA)) {
+    const root = threads[index].shadowRoot.querySelector('#replies bili-comment-replies-renderer').shadowRoot;
+    const expander = root.querySelector('#expander-contents');
+    const preview = Array.from(expander.children);
+    const pages = Math.ceil(replies.length / PAGE_SIZE);
+    const clear = () => root.querySelectorAll('#view-more, #pagination-body, #pagination-foot')
+        .forEach((el) => el.remove());
+    const showPreview = () => {
+        clear();
+        expander.replaceChildren(...preview);
+        const viewMore = document.createElement('div');
+        viewMore.id = 'view-more';
+        const count = document.createElement('span');
+        count.textContent = '共' + replies.length + '条回复, ';
+        viewMore.append(count, textButton('点击查看', () => showPage(0)));
+        root.appendChild(viewMore);
+    };
+    const showPage = (page) => setTimeout(() => {
+        clear();
+        expander.replaceChildren(...replies.slice(page * PAGE_SIZE, (page + 1) * PAGE_SIZE).map(replyRenderer));
+        if (pages > 1) {
+            const body = document.createElement('div');
+            body.id = 'pagination-body';
+            if (page > 0) body.appendChild(textButton('上一页', () => showPage(page - 1)));
+            for (let i = 0; i < pages; i++) {
+                const number = document.createElement('span');
+                number.textContent = String(i + 1);
+                body.appendChild(number);
+            }
+            if (page < pages - 1) body.appendChild(textButton('下一页', () => showPage(page + 1)));
+            root.appendChild(body);
+        }
+        const foot = document.createElement('div');
+        foot.id = 'pagination-foot';
+        foot.appendChild(textButton('收起', showPreview));
+        root.appendChild(foot);
+    }, LATENCY);
+    showPreview();
+}
+"""
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def record_fixture(webdriver, file_path, root_id='commentapp', static=True):
+    """
+    录制当前页面的评论区，保存为本地html文件
+    录制的是调用时的页面状态，可以在展开回复、加载更多评论之后再录制
+    :param webdriver: 驱动
+    :param file_path: 输出的html文件路径
+    :param root_id: 评论区根元素的id
+    :param static: 是否去掉“查看回复”和分页按钮（见STATIC_SKIP_IDS）
+    :return: html文件大小（字节）
+    """
+    root = webdriver.execute_script('return document.getElementById(arguments[0])', root_id)
+    body = webdriver.execute_script(CAPTURE_JS, root, STATIC_SKIP_IDS if static else [])
+    page = PAGE_TEMPLATE.format(title=html.escape(webdriver.title), body=body)
+    Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(file_path).write_text(page, encoding='utf-8')
+    return len(page.encode('utf-8'))
+
+
+def _shadow(tag, inner, attrs=''):
+    """
+    带声明式shadow DOM的元素
+    """
+    return f'<{tag}{attrs}><template shadowrootmode="open">{inner}</template></{tag}>'
+
+
+def _comment_parts(text, pubdate, like_count):
+    """
+    评论内容和底部按钮区，与线上bili-rich-text、bili-comment-action-buttons-renderer的结构一致
+    """
+    rich_text = _shadow('bili-rich-text', f'<p id="contents"><span>{html.escape(text)}</span></p>')
+    buttons = _shadow('bili-comment-action-buttons-renderer',
+                      f'<div id="pubdate">{html.escape(pubdate)}</div>'
+                      f'<div id="like"><button><span id="count">{html.escape(like_count)}</span></button></div>')
+    return rich_text, f'<div id="footer">{buttons}</div>'
+
+
+def _cell(value):
+    """
+    表格单元格转成网页上显示的文本
+    """
+    if pd.isna(value):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def synthesize_fixture(table_path, file_path, max_threads=None, preview=3, page_size=10, latency=50):
+    """
+    用已爬取的评论表格生成评论区html文件，结构与线上评论区一致：
+    回复不超过preview条时直接显示；超过时先显示前preview条和“查看回复”按钮，点击后分页显示，每页page_size条
+    :param table_path: 评论表格路径
+    :param file_path: 输出的html文件路径
+    :param max_threads: 最多生成多少条父评论，None表示全部
+    :param preview: 直接显示的回复数
+    :param page_size: 回复每页条数
+    :param latency: 点击按钮后延迟多少毫秒显示回复
+    :return: (父评论数, 回复数)
+    """
+    df = pd.read_excel(table_path)
+    parents = df[df['parent_id'].isna()]
+    if max_threads is not None:
+        parents = parents.head(max_threads)
+    replies_by_root = {root: group for root, group in df[df['parent_id'].notna()].groupby('parent_id')}
+
+    threads = []
+    reply_data = {}  # 需要分页查看的回复，由PAGING_JS生成
+    reply_count = 0
+    for index, (_, parent) in enumerate(parents.iterrows()):
+        rich_text, footer = _comment_parts(_cell(parent['contents']), _cell(parent['pubdate']),
+                                           _cell(parent['like_count']))
+        comment = _shadow('bili-comment-renderer', f'<div id="content">{rich_text}</div>{footer}', ' id="comment"')
+        group = replies_by_root.get(parent['id'])
+        rows = [] if group is None else [[_cell(reply[column]) for column in ('contents', 'pubdate', 'like_count')]
+                                         for _, reply in group.iterrows()]
+        if len(rows) > preview:
+            reply_data[index] = rows
+        reply_count = reply_count + len(rows)
+        replies = []
+        for contents, pubdate, like_count in rows[:preview]:
+            rich_text, footer = _comment_parts(contents, pubdate, like_count)
+            replies.append(_shadow('bili-comment-reply-renderer', f'<div id="main">{rich_text}</div>{footer}'))
+        replies_renderer = _shadow('bili-comment-replies-renderer',
+                                   f'<div id="expander-contents">{"".join(replies)}</div>')
+        threads.append(_shadow('bili-comment-thread-renderer',
+                               f'{comment}<div id="replies">{replies_renderer}</div>'))
+
+    feed = _shadow('bili-comments', f'<div id="feed">{"".join(threads)}</div>')
+    # json中的</script>会提前结束脚本，需要转义
+    data = json.dumps(reply_data, ensure_ascii=False).replace('</', '<\\/')
+    script = (f'<script>\nconst REPLY_DATA = {data};\nconst PAGE_SIZE = {page_size};\nconst LATENCY = {latency};\n'
+              f'{PAGING_JS}</script>')
+    page = PAGE_TEMPLATE.format(title=html.escape(Path(table_path).stem),
+                                body=f'<div id="commentapp">{feed}</div>\n{script}')
+    Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(file_path).write_text(page, encoding='utf-8')
+    return len(parents), reply_count
+
+
+def serve_fixtures(fixture_dir, port=0):
+    """
+    在后台线程中启动静态文件服务器，提供录制的html文件
+    :param fixture_dir: html文件所在目录
+    :param port: 端口，0表示随机选择空闲端口
+    :return: (server, base_url)，用完后调用server.shutdown()
+    """
+    handler = functools.partial(_QuietHandler, directory=str(fixture_dir))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # 不打印每个请求的日志
+        pass
@@ -0,0 +1,80 @@
+# 评论提取速度测试
+# 在本地录制/生成的评论区页面上无界面运行get_comments，不需要联网和登录，
+# 统计每秒提取的父评论数、回复数，以及每条评论平均发送的WebDriver请求数，用来比较不同提取方式和优化前后的速度
+
+import tempfile
+from pathlib import Path
+
+from crawl_scheduler import create_edge_driver
+from comment_sink import MemorySink
+from data_acquisition import WAIT_TIMEOUTS, get_comments
+from dom_fixtures import serve_fixtures, synthesize_fixture
+from metrics import CrawlMetrics
+from waits import AdaptiveWait
+
+
+def run_benchmark(webdriver, url, mode, feed_timeout=1.0):
+    """
+    在一个页面上运行一次评论提取
+    :param webdriver: 驱动
+    :param url: 评论区页面地址
+    :param mode: 提取方式，见get_comments
+    :param feed_timeout: 没有新评论时的等待时间（秒），本地页面的评论一次全部加载，不需要等待很久
+    :return: 结果字典
+    """
+    webdriver.get(url)
+    waiter = AdaptiveWait(timeouts={**WAIT_TIMEOUTS, 'feed_grow': feed_timeout})
+    sink = MemorySink()
+    metrics = CrawlMetrics(labels={'mode': mode})
+    get_comments(webdriver, sink=sink, mode=mode, waiter=waiter, metrics=metrics)
+    snapshot = metrics.snapshot(waiter)
+    # 最后一次等待新评论必然超时，这段时间不算提取时间
+    elapsed = snapshot['elapsed'] - feed_timeout
+
+    threads = sum(1 for row in sink.rows if row[2] is None)
+    replies = len(sink.rows) - threads
+    commands = snapshot['webdriver_commands']
+    return {
+        'mode': mode,
+        'threads': threads,
+        'replies': replies,
+        'seconds': elapsed,
+        'threads_per_second': threads / elapsed,
+        'replies_per_second': replies / elapsed,
+        'commands': snapshot['webdriver_commands_total'],
+        'commands_per_comment': snapshot['webdriver_commands_total'] / max(len(sink.rows), 1),
+        'top_commands': sorted(commands.items(), key=lambda item: -item[1])[:5],
+        'phases': metrics.summary(),
+        'rows': sink.rows,
+    }
+
+
+def print_result(result):
+    print(f">>>{result['mode']:<8} 父评论 {result['threads']} 条，回复 {result['replies']} 条，"
+          f"耗时 {result['seconds']:.2f} 秒，{result['threads_per_second']:.1f} 父评论/秒，"
+          f"{result['replies_per_second']:.1f} 回复/秒，"
+          f"WebDriver请求 {result['commands']} 次（每条评论 {result['commands_per_comment']:.2f} 次）")
+    print(f"   请求最多的命令：{result['top_commands']}")
+    print(f"   各阶段耗时：{result['phases']}")
+
+
+if __name__ == '__main__':
+    # 用已爬取的视频生成评论区页面，对两种提取方式分别测速，并检查两者提取的数据一致
+    table_path = '../data_raw/春晚来B站啦！有了春晚就是年！.xlsx'
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_dir = Path(tmp) / 'fixtures'
+        thread_count, reply_count = synthesize_fixture(table_path, fixture_dir / 'comments.html', max_threads=200)
+        server, base_url = serve_fixtures(fixture_dir)
+        print(f">>>评论区页面 {base_url}/comments.html，父评论 {thread_count} 条，回复 {reply_count} 条")
+
+        webdriver = create_edge_driver(headless=True)
+        try:
+            results = [run_benchmark(webdriver, f'{base_url}/comments.html', mode) for mode in ('element', 'script')]
+        finally:
+            webdriver.quit()
+            server.shutdown()
+
+    for result in results:
+        print_result(result)
+    element_rows, script_rows = results[0]['rows'], results[1]['rows']
+    print(f">>>两种提取方式数据一致：{element_rows == script_rows}")
@@ -0,0 +1,95 @@
+# 登录状态复用
+# 每次爬取都要重新登录：登录弹窗的绝对XPath容易失效，而且登录前后要等待很久，每启动一个爬取会话都要再来一遍。
+# 这里把登录后的cookies保存到文件，下次启动时先用一次接口请求检查cookies是否仍然有效，有效就直接加载，
+# 只有失效时才重新登录；账号密码从环境变量或配置文件读取，不写在代码里
+
+import json
+import os
+from pathlib import Path
+
+import requests
+
+# 默认的配置文件和cookies文件（都不提交到仓库）
+CONFIG_PATH = '../config.json'
+COOKIE_PATH = '../cookies.json'
+# 检查登录状态的接口，返回的data.isLogin表示cookies是否有效
+NAV_URL = 'https://api.bilibili.com/x/web-interface/nav'
+HOME_URL = 'https://www.bilibili.com/'
+
+
+def load_credentials(config_path=CONFIG_PATH):
+    """
+    读取登录账号和密码，环境变量BILI_ACCOUNT、BILI_PASSWORD优先，其次是配置文件中的account、password
+    :param config_path: 配置文件路径，json格式
+    :return: (账号, 密码)
+    """
+    config = {}
+    if Path(config_path).exists():
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    account = os.environ.get('BILI_ACCOUNT') or config.get('account')
+    password = os.environ.get('BILI_PASSWORD') or config.get('password')
+    if not account or not password:
+        raise RuntimeError(f"未配置登录账号：请设置环境变量BILI_ACCOUNT、BILI_PASSWORD，或在{config_path}中填写account、password")
+    return account, password
+
+
+def save_cookies(webdriver, cookie_path=COOKIE_PATH):
+    """
+    保存浏览器当前的cookies，先写临时文件再替换，多个会话同时保存也不会写坏文件
+    :param webdriver: 驱动
+    :param cookie_path: cookies文件路径
+    """
+    cookie_path = Path(cookie_path)
+    tmp_path = cookie_path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(webdriver.get_cookies(), f, ensure_ascii=False)
+    os.replace(tmp_path, cookie_path)
+
+
+def read_cookies(cookie_path=COOKIE_PATH):
+    """
+    读取保存的cookies
+    :return: selenium格式的cookies列表，文件不存在时为空列表
+    """
+    if not Path(cookie_path).exists():
+        return []
+    with open(cookie_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def cookie_dict(cookies):
+    """
+    selenium格式的cookies转换成 {名称: 值} 字典，可直接用于requests和ReplyApiClient
+    """
+    return {cookie['name']: cookie['value'] for cookie in cookies}
+
+
+def is_session_valid(cookies, timeout=5):
+    """
+    用一次接口请求检查cookies是否仍处于登录状态，不需要打开浏览器
+    :param cookies: selenium格式的cookies列表
+    :param timeout: 请求超时时间（秒）
+    :return: 是否有效
+    """
+    if not cookies:
+        return False
+    try:
+        response = requests.get(NAV_URL, cookies=cookie_dict(cookies), timeout=timeout,
+                                headers={'User-Agent': 'Mozilla/5.0', 'Referer': HOME_URL})
+        return bool(response.json().get('data', {}).get('isLogin'))
+    except (requests.RequestException, ValueError):
+        return False
+
+
+def load_cookies(webdriver, cookies):
+    """
+    把cookies加载到浏览器中，需要先打开同一域名的页面才能添加cookies
+    :param webdriver: 驱动
+    :param cookies: selenium格式的cookies列表
+    """
+    webdriver.get(HOME_URL)
+    for cookie in cookies:
+        # sameSite取值不合法时add_cookie会报错
+        cookie = {key: value for key, value in cookie.items() if key != 'sameSite'}
+        webdriver.add_cookie(cookie)
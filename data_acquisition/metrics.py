@@ -0,0 +1,210 @@
+# 爬取过程统计
+# 原来只打印一次总耗时，看不出时间花在了滚动、等待、查找shadow DOM还是存储上。
+# 这里按阶段累计耗时，统计WebDriver请求数和评论/回复数，每次爬取结束后导出为JSON行或Prometheus文本格式
+
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Prometheus指标名前缀
+METRIC_PREFIX = 'bili_crawl'
+
+
+class CommandCounter:
+    """
+    统计驱动发送的WebDriver请求数
+    元素、shadow root的查找和点击最终都通过驱动的execute发送，替换驱动实例的execute即可统计全部请求
+    """
+
+    def __init__(self, webdriver):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._execute = webdriver.execute
+
+        def execute(driver_command, params=None):
+            with self._lock:
+                self.counts[driver_command] = self.counts[driver_command] + 1
+            return self._execute(driver_command, params)
+
+        webdriver.execute = execute
+
+    @classmethod
+    def attach(cls, webdriver):
+        """
+        获取驱动上的计数器，没有时创建一个，避免重复包装execute
+        """
+        counter = getattr(webdriver, 'command_counter', None)
+        if counter is None:
+            counter = webdriver.command_counter = cls(webdriver)
+        return counter
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+class CrawlMetrics:
+    """
+    一次爬取的统计：各阶段耗时、计数器、WebDriver请求数
+    """
+
+    def __init__(self, run_id=None, labels=None):
+        """
+        :param run_id: 本次爬取的标识，默认为开始时间
+        :param labels: 附加的标签，如 {'bvid': 'BV...'}，导出时写入每个指标
+        """
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.labels = dict(labels or {})
+        self.started = time.time()
+        self.phases = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0})
+        self.counters = Counter()
+        self.command_counter = None
+        self._command_base = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        累计一个阶段的耗时
+        用法：with metrics.phase('scroll'): ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, elapsed):
+        """
+        记录一次阶段耗时（秒）
+        """
+        with self._lock:
+            phase = self.phases[name]
+            phase['count'] = phase['count'] + 1
+            phase['total'] = phase['total'] + elapsed
+            phase['max'] = max(phase['max'], elapsed)
+
+    def add(self, name, value=1):
+        """
+        计数器加value
+        """
+        with self._lock:
+            self.counters[name] = self.counters[name] + value
+
+    def watch_driver(self, webdriver):
+        """
+        统计驱动从现在开始发送的WebDriver请求
+        """
+        self.command_counter = CommandCounter.attach(webdriver)
+        self._command_base = Counter(self.command_counter.counts)
+
+    def commands(self):
+        """
+        开始统计之后各WebDriver命令的请求数
+        """
+        if self.command_counter is None:
+            return {}
+        counts = Counter(self.command_counter.counts)
+        counts.subtract(self._command_base)
+        return {command: count for command, count in counts.items() if count > 0}
+
+    def snapshot(self, waiter=None):
+        """
+        当前的统计结果
+        :param waiter: 条件等待（见waits），不为空时附带每类等待的耗时
+        :return: 字典
+        """
+        commands = self.commands()
+        comments = self.counters.get('comments', 0)
+        snapshot = {
+            'run_id': self.run_id,
+            'labels': self.labels,
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'elapsed': time.time() - self.started,
+            'phases': {name: dict(phase) for name, phase in self.phases.items()},
+            'counters': dict(self.counters),
+            'webdriver_commands': commands,
+            'webdriver_commands_total': sum(commands.values()),
+            'commands_per_comment': sum(commands.values()) / comments if comments else None,
+        }
+        if waiter is not None:
+            snapshot['waits'] = waiter.stats()
+        return snapshot
+
+    def to_prometheus(self, waiter=None):
+        """
+        转成Prometheus文本格式
+        """
+        snapshot = self.snapshot(waiter)
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                labels = {'run_id': self.run_id, **self.labels, **labels}
+                label_text = ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+                lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}')
+
+        metric('elapsed_seconds', 'gauge', '爬取总耗时', [({}, f"{snapshot['elapsed']:.6f}")])
+        phases = sorted(snapshot['phases'].items())
+        metric('phase_seconds_total', 'counter', '各阶段累计耗时',
+               [({'phase': name}, f"{phase['total']:.6f}") for name, phase in phases])
+        metric('phase_calls_total', 'counter', '各阶段执行次数',
+               [({'phase': name}, phase['count']) for name, phase in phases])
+        metric('phase_max_seconds', 'gauge', '各阶段单次最长耗时',
+               [({'phase': name}, f"{phase['max']:.6f}") for name, phase in phases])
+        metric('items_total', 'counter', '爬取计数（评论、回复等）',
+               [({'item': name}, value) for name, value in sorted(snapshot['counters'].items())])
+        metric('webdriver_commands_total', 'counter', 'WebDriver请求数',
+               [({'command': name}, value) for name, value in sorted(snapshot['webdriver_commands'].items())])
+        if 'waits' in snapshot:
+            metric('wait_seconds_total', 'counter', '各类条件等待累计耗时',
+                   [({'wait': name}, f"{s['total']:.6f}") for name, s in sorted(snapshot['waits'].items())])
+            metric('wait_timeouts_total', 'counter', '各类条件等待超时次数',
+                   [({'wait': name}, s['timeouts']) for name, s in sorted(snapshot['waits'].items())])
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_path, waiter=None):
+        """
+        导出统计结果
+        .jsonl：追加一行，多次爬取的结果保存在同一个文件中；.prom：Prometheus文本格式，覆盖写入
+        :param file_path: 导出文件路径
+        :param waiter: 条件等待，不为空时附带每类等待的耗时
+        """
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = file_path.suffix.lower()
+        if suffix == '.jsonl':
+            line = json.dumps(self.snapshot(waiter), ensure_ascii=False) + '\n'
+            # 追加模式下一次写入一整行，多个爬取会话同时导出也不会交错
+            with open(file_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        elif suffix == '.prom':
+            tmp_path = file_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_text(self.to_prometheus(waiter), encoding='utf-8')
+            os.replace(tmp_path, file_path)
+        else:
+            raise ValueError(f"不支持的导出格式：{suffix}，可选 ['.jsonl', '.prom']")
+
+    def summary(self):
+        """
+        按耗时从多到少排列的各阶段耗时，用于日志输出
+        """
+        elapsed = time.time() - self.started
+        parts = [f"{name} {phase['total']:.2f}秒({phase['total'] / elapsed:.0%})"
+                 for name, phase in sorted(self.phases.items(), key=lambda item: -item[1]['total'])]
+        return '，'.join(parts)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
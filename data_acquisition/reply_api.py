@@ -0,0 +1,253 @@
+# 通过评论接口直接获取评论数据
+# 浏览器爬虫每翻一页回复都要点击按钮并等待2秒，回复多的评论爬取很慢。
+# 这里直接请求评论和回复的json接口，使用连接池复用HTTP连接，并发获取回复分页，
+# 输出与浏览器爬虫相同的 id, contents, parent_id, pubdate, like_count 数据
+
+import json
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from checkpoint import comment_key
+
+# 接口地址
+API_BASE = 'https://api.bilibili.com'
+VIEW_PATH = '/x/web-interface/view'  # 视频信息
+MAIN_PATH = '/x/v2/reply'  # 父评论分页，sort=0按时间排序
+REPLY_PATH = '/x/v2/reply/reply'  # 某条父评论的回复分页
+
+HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                   'Chrome/131.0.0.0 Safari/537.36 Edg/131.0.0.0'),
+    'Referer': 'https://www.bilibili.com/',
+}
+
+
+class ReplyApiError(Exception):
+    """
+    接口返回的code不为0
+    """
+
+
+def parse_bvid(url_or_bvid):
+    """
+    从视频链接中提取BV号
+    :param url_or_bvid: 视频链接或BV号
+    :return: BV号
+    """
+    match = re.search(r'BV[0-9A-Za-z]{10}', url_or_bvid)
+    if not match:
+        raise ValueError(f"无法识别的视频：{url_or_bvid}")
+    return match.group(0)
+
+
+def fixture_name(path, params):
+    """
+    接口请求对应的录制文件名，录制和本地回放服务器都使用这个命名
+    :param path: 接口路径
+    :param params: 请求参数
+    :return: 文件名
+    """
+    if path == VIEW_PATH:
+        return f"view_{params['bvid']}.json"
+    if path == MAIN_PATH:
+        return f"main_{params['oid']}_{params['pn']}.json"
+    if path == REPLY_PATH:
+        return f"reply_{params['oid']}_{params['root']}_{params['pn']}.json"
+    return None
+
+
+def format_ctime(ctime):
+    """
+    把时间戳转成与网页上一致的时间格式
+    """
+    return datetime.fromtimestamp(ctime).strftime('%Y-%m-%d %H:%M')
+
+
+class ReplyApiClient:
+    """
+    评论接口客户端
+    """
+
+    def __init__(self, base_url=API_BASE, workers=8, page_size=20, cookies=None, timeout=10, record_dir=None):
+        """
+        :param base_url: 接口地址，测试时可以换成本地回放服务器的地址
+        :param workers: 并发获取回复分页的线程数，也是连接池的大小
+        :param page_size: 每页评论数
+        :param cookies: 登录后的cookies字典，不登录时部分评论可能无法获取
+        :param timeout: 请求超时时间（秒）
+        :param record_dir: 录制目录，不为空时把每个接口响应保存下来，供本地回放服务器使用
+        """
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.page_size = page_size
+        self.timeout = timeout
+        self.record_dir = Path(record_dir) if record_dir else None
+        if self.record_dir:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+        self.request_count = 0
+        self._count_lock = threading.Lock()  # 回复分页在线程池中并发请求，计数时加锁
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        if cookies:
+            self.session.cookies.update(cookies)
+        # 连接池，请求失败或被限流时自动重试
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[412, 429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def get_json(self, path, params):
+        """
+        请求接口并返回data部分
+        :param path: 接口路径
+        :param params: 请求参数
+        :return: 接口返回的data
+        """
+        response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        with self._count_lock:
+            self.request_count = self.request_count + 1
+        body = response.json()
+        if body.get('code') != 0:
+            raise ReplyApiError(f"{path} {params} 返回 {body.get('code')}: {body.get('message')}")
+        if self.record_dir:
+            with open(self.record_dir / fixture_name(path, params), 'w', encoding='utf-8') as f:
+                json.dump(body, f, ensure_ascii=False)
+        return body['data']
+
+    def get_video(self, bvid):
+        """
+        获取视频信息
+        :param bvid: BV号
+        :return: 包含aid（评论接口的oid）和title的字典
+        """
+        return self.get_json(VIEW_PATH, {'bvid': bvid})
+
+    def get_main_page(self, oid, pn):
+        """
+        获取一页父评论
+        :return: 父评论列表，没有更多时为空列表
+        """
+        data = self.get_json(MAIN_PATH, {'oid': oid, 'type': 1, 'sort': 0, 'pn': pn, 'ps': self.page_size})
+        return data.get('replies') or []
+
+    def get_reply_page(self, oid, root, pn):
+        """
+        获取某条父评论的一页回复
+        :return: 回复列表
+        """
+        data = self.get_json(REPLY_PATH, {'oid': oid, 'type': 1, 'root': root, 'pn': pn, 'ps': self.page_size})
+        return data.get('replies') or []
+
+    def _fetch_replies(self, oid, thread):
+        """
+        并发提交一条父评论所有回复分页的请求
+        :return: 按页码排列的future列表
+        """
+        pages = math.ceil(thread.get('rcount', 0) / self.page_size)
+        return [self._executor.submit(self.get_reply_page, oid, thread['rpid'], pn) for pn in range(1, pages + 1)]
+
+    def iter_threads(self, oid, start_page=1, skip=None, stop=None):
+        """
+        逐页获取父评论，每页的所有回复分页并发获取
+        :param oid: 视频aid
+        :param start_page: 从第几页父评论开始
+        :param skip: 函数skip(父评论)返回真时跳过这条父评论，不获取它的回复
+        :param stop: 函数stop(父评论)返回真时停止获取（父评论按时间从新到旧排列）
+        :return: 生成器，每次产生(父评论, 回复列表)
+        """
+        pn = start_page
+        next_page = self._executor.submit(self.get_main_page, oid, pn)
+        while True:
+            threads = next_page.result()
+            last_page = not threads
+            if stop is not None:
+                for index, thread in enumerate(threads):
+                    if stop(thread):
+                        threads = threads[:index]
+                        last_page = True
+                        break
+            if skip is not None:
+                threads = [thread for thread in threads if not skip(thread)]
+            # 先提交这一页所有父评论的回复请求和下一页父评论的请求，再按顺序取结果
+            futures = [self._fetch_replies(oid, thread) for thread in threads]
+            if not last_page:
+                pn = pn + 1
+                next_page = self._executor.submit(self.get_main_page, oid, pn)
+            for thread, reply_futures in zip(threads, futures):
+                replies = [reply for future in reply_futures for reply in future.result()]
+                yield thread, replies
+            if last_page:
+                break
+
+    def crawl(self, oid, sink, checkpoint=None):
+        """
+        爬取一个视频的全部评论并写入存储
+        有断点时跳过已存储的父评论；上一次已完整爬取时只获取之后新发布的父评论（旧父评论下的新回复不会获取）
+        :param oid: 视频aid
+        :param sink: 评论存储（见comment_sink）
+        :param checkpoint: 断点（见checkpoint），为None时不记录断点
+        :return: 本次写入的评论数
+        """
+        comment_id = 1
+        skip = stop = None
+        if checkpoint is not None:
+            checkpoint.restore(sink)
+            comment_id = checkpoint.next_id
+            skip = lambda thread: checkpoint.is_done(comment_key(None, rpid=thread['rpid']))
+            stop = lambda thread: checkpoint.is_old(thread['ctime'])
+        first_id = comment_id
+        for thread, replies in self.iter_threads(oid, skip=skip, stop=stop):
+            comments = [[comment_id, thread['content']['message'], None, format_ctime(thread['ctime']),
+                         thread.get('like', 0)]]
+            parent_comment_id = comment_id
+            comment_id = comment_id + 1
+            for reply in replies:
+                comments.append([comment_id, reply['content']['message'], parent_comment_id,
+                                 format_ctime(reply['ctime']), reply.get('like', 0)])
+                comment_id = comment_id + 1
+            sink.write_rows(comments)
+            if checkpoint is not None:
+                checkpoint.mark_done([comment_key(None, rpid=thread['rpid'])], next_id=comment_id, sink=sink,
+                                     ctime=thread['ctime'])
+        if checkpoint is not None:
+            checkpoint.finish(sink)
+        else:
+            sink.flush(sync=True)
+        return comment_id - first_id
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    import time
+
+    from comment_sink import open_sink
+
+    url = ("https://www.bilibili.com/video/BV1r1r6YfEhv/?spm_id_from=333.934.0.0&vd_source"
+           "=fa17a360ca302344f8e38fc493ad2ecd")
+    with ReplyApiClient() as client:
+        video = client.get_video(parse_bvid(url))
+        print(f">>>视频 {video['title']}")
+        start_time = time.time()
+        with open_sink('../data_raw/data_raw.jsonl') as sink:
+            count = client.crawl(video['aid'], sink)
+        print(f">>>共爬取评论 {count} 条，耗时 {time.time() - start_time:.1f} 秒，请求 {client.request_count} 次")
@@ -0,0 +1,152 @@
+# 本地评论接口回放服务器
+# 回放ReplyApiClient(record_dir=...)录制的接口响应，不联网也可以测试和测量接口爬取的速度；
+# 也可以把已爬取的评论表格转换成接口格式的响应文件
+
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+from reply_api import MAIN_PATH, REPLY_PATH, VIEW_PATH, fixture_name
+
+# 找不到录制文件时返回的空分页，父评论和回复接口没有更多数据时也是这个格式
+EMPTY_PAGE = {'code': 0, 'message': '0', 'data': {'replies': []}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    按请求路径和参数找到对应的录制文件并返回
+    """
+    fixture_dir = None
+    latency = 0  # 模拟的网络延迟（秒）
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            name = fixture_name(url.path, params)
+        except KeyError:
+            name = None
+        file = self.fixture_dir / name if name else None
+        if file is not None and file.exists():
+            body = file.read_bytes()
+        elif url.path in (MAIN_PATH, REPLY_PATH):
+            body = json.dumps(EMPTY_PAGE).encode('utf-8')
+        else:
+            body = json.dumps({'code': -404, 'message': '啥都木有'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不打印每个请求的日志
+        pass
+
+
+def start_stub_server(fixture_dir, port=0, latency=0):
+    """
+    在后台线程中启动回放服务器
+    :param fixture_dir: 录制文件所在目录
+    :param port: 端口，0表示随机选择空闲端口
+    :param latency: 每个请求模拟的网络延迟（秒）
+    :return: (server, base_url)，用完后调用server.shutdown()
+    """
+    handler = type('Handler', (StubHandler,), {'fixture_dir': Path(fixture_dir), 'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _reply_json(row, oid, root=0, rcount=0):
+    """
+    把一行评论数据转换成接口格式
+    """
+    ctime = pd.to_datetime(row['pubdate'], errors='coerce')
+    like = pd.to_numeric(row['like_count'], errors='coerce')
+    return {
+        'rpid': int(row['id']),
+        'oid': oid,
+        'root': root,
+        'rcount': rcount,
+        'ctime': 0 if pd.isna(ctime) else int(ctime.timestamp()),
+        'like': 0 if pd.isna(like) else int(like),
+        'content': {'message': '' if pd.isna(row['contents']) else str(row['contents'])},
+    }
+
+
+def build_fixtures_from_table(file_path, fixture_dir, bvid, oid=1, title=None, page_size=20):
+    """
+    把已爬取的评论表格转换成接口格式的录制文件
+    :param file_path: 评论表格路径
+    :param fixture_dir: 录制文件输出目录
+    :param bvid: 视频BV号
+    :param oid: 视频aid
+    :param title: 视频标题，默认使用文件名
+    :param page_size: 每页评论数，与ReplyApiClient的page_size一致
+    :return: 评论总数
+    """
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    df = pd.read_excel(file_path)
+    parents = df[df['parent_id'].isna()]
+    replies = df[df['parent_id'].notna()]
+    replies_by_root = {int(root): group for root, group in replies.groupby('parent_id')}
+
+    def dump(path, params, data):
+        with open(fixture_dir / fixture_name(path, params), 'w', encoding='utf-8') as f:
+            json.dump({'code': 0, 'message': '0', 'data': data}, f, ensure_ascii=False)
+
+    dump(VIEW_PATH, {'bvid': bvid}, {'bvid': bvid, 'aid': oid, 'title': title or Path(file_path).stem,
+                                     'pubdate': int(datetime.now().timestamp())})
+
+    threads = [_reply_json(row, oid, rcount=len(replies_by_root.get(int(row['id']), [])))
+               for _, row in parents.iterrows()]
+    for pn in range(1, math.ceil(len(threads) / page_size) + 1):
+        page = threads[(pn - 1) * page_size:pn * page_size]
+        dump(MAIN_PATH, {'oid': oid, 'pn': pn}, {'page': {'num': pn, 'size': page_size, 'count': len(threads)},
+                                                'replies': page})
+
+    for root, group in replies_by_root.items():
+        rows = [_reply_json(row, oid, root=root) for _, row in group.iterrows()]
+        for pn in range(1, math.ceil(len(rows) / page_size) + 1):
+            dump(REPLY_PATH, {'oid': oid, 'root': root, 'pn': pn},
+                 {'page': {'num': pn, 'size': page_size, 'count': len(rows)},
+                  'replies': rows[(pn - 1) * page_size:pn * page_size]})
+    return len(df)
+
+
+if __name__ == '__main__':
+    # 离线测试：把一个已爬取的视频转换成录制文件，用回放服务器测量不同并发数下的爬取速度
+    import tempfile
+
+    from comment_sink import read_comments, open_sink
+    from reply_api import ReplyApiClient
+
+    file_path = '../data_raw/春晚来B站啦！有了春晚就是年！.xlsx'
+    with tempfile.TemporaryDirectory() as tmp:
+        total = build_fixtures_from_table(file_path, Path(tmp) / 'fixtures', bvid='BV1xx411c7mD')
+        server, base_url = start_stub_server(Path(tmp) / 'fixtures', latency=0.02)
+        print(f">>>回放服务器 {base_url}，评论 {total} 条，每个请求延迟 20 毫秒")
+        for workers in (1, 4, 16):
+            sink_path = Path(tmp) / f'comments_{workers}.jsonl'
+            with ReplyApiClient(base_url=base_url, workers=workers) as client:
+                video = client.get_video('BV1xx411c7mD')
+                start_time = time.perf_counter()
+                with open_sink(sink_path) as sink:
+                    count = client.crawl(video['aid'], sink)
+                elapsed = time.perf_counter() - start_time
+            assert count == len(read_comments(sink_path)) == total
+            print(f">>>workers={workers:>2} 评论 {count} 条，耗时 {elapsed:.2f} 秒，{count / elapsed:.0f} 条/秒，"
+                  f"请求 {client.request_count} 次")
+        server.shutdown()
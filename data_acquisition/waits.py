@@ -0,0 +1,127 @@
+# 按条件等待页面加载
+# 固定时长的time.sleep不管内容有没有加载出来都要睡满，爬取大量评论时大部分时间都在空等。
+# 这里改为轮询具体的条件（新回复出现、分页状态变化、评论列表变长），条件满足立即返回，
+# 轮询间隔按指数退避逐渐变长，并记录每次等待实际花费的时间
+
+import logging
+import time
+from collections import defaultdict
+
+from selenium.common import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+# 与爬虫使用同一个日志记录器
+logger = logging.getLogger('data_acquisition')
+
+# 轮询过程中出现这些异常时视为条件暂未满足（元素还没渲染出来或正在重新渲染）
+IGNORED_EXCEPTIONS = (NoSuchElementException, StaleElementReferenceException)
+
+# 判断元素是否已经在可视区域内
+IN_VIEWPORT_JS = """
+const rect = arguments[0].getBoundingClientRect();
+return rect.top >= 0 && rect.bottom <= (window.innerHeight || document.documentElement.clientHeight);
+"""
+
+
+class AdaptiveWait:
+    """
+    条件等待
+    每种等待按名称分别记录耗时，第一次轮询前先等待该类等待以往耗时的一部分，之后轮询间隔按backoff倍数增长
+    """
+
+    def __init__(self, timeout=10.0, poll_interval=0.05, max_poll_interval=1.0, backoff=1.5, timeouts=None):
+        """
+        :param timeout: 默认超时时间（秒）
+        :param poll_interval: 初始轮询间隔（秒）
+        :param max_poll_interval: 最大轮询间隔（秒）
+        :param backoff: 每次轮询后间隔的增长倍数
+        :param timeouts: 按等待名称单独设置的超时时间，如 {'login_done': 60}
+        """
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.timeouts = dict(timeouts or {})
+        self.records = defaultdict(list)  # 等待名称 -> [(耗时, 是否超时), ...]
+        self._typical = {}  # 等待名称 -> 耗时的指数移动平均
+
+    def until(self, condition, name, timeout=None, raise_on_timeout=False):
+        """
+        轮询直到condition()返回真值或超时
+        :param condition: 无参函数，返回真值表示条件满足
+        :param name: 等待名称，用于分别设置超时和统计耗时
+        :param timeout: 本次等待的超时时间，默认使用timeouts[name]或timeout
+        :param raise_on_timeout: 超时时是否抛出TimeoutException，否则返回condition()最后的结果
+        :return: condition()的结果
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(name, self.timeout)
+        start = time.perf_counter()
+        interval = self.poll_interval
+        # 根据以往的耗时，第一次轮询前先等一会，减少无效的轮询请求
+        first_delay = min(self._typical.get(name, 0.0) * 0.5, self.max_poll_interval)
+        if first_delay > 0:
+            time.sleep(first_delay)
+        while True:
+            try:
+                result = condition()
+            except IGNORED_EXCEPTIONS:
+                result = None
+            elapsed = time.perf_counter() - start
+            if result:
+                self._record(name, elapsed, timed_out=False)
+                return result
+            if elapsed >= timeout:
+                self._record(name, elapsed, timed_out=True)
+                if raise_on_timeout:
+                    raise TimeoutException(f"等待 {name} 超时（{timeout} 秒）")
+                return result
+            time.sleep(min(interval, timeout - elapsed))
+            interval = min(interval * self.backoff, self.max_poll_interval)
+
+    def _record(self, name, elapsed, timed_out):
+        self.records[name].append((elapsed, timed_out))
+        if not timed_out:
+            typical = self._typical.get(name)
+            self._typical[name] = elapsed if typical is None else 0.8 * typical + 0.2 * elapsed
+
+    def stats(self):
+        """
+        每种等待的统计
+        :return: {等待名称: {'count', 'timeouts', 'total', 'mean', 'max'}}
+        """
+        stats = {}
+        for name, records in self.records.items():
+            durations = [elapsed for elapsed, _ in records]
+            stats[name] = {
+                'count': len(records),
+                'timeouts': sum(1 for _, timed_out in records if timed_out),
+                'total': sum(durations),
+                'mean': sum(durations) / len(durations),
+                'max': max(durations),
+            }
+        return stats
+
+    def report(self, fixed_sleeps=None):
+        """
+        输出（INFO级别日志）每种等待的实际耗时，与原来的固定睡眠时长对比
+        :param fixed_sleeps: {等待名称: 原来固定睡眠的秒数}
+        :return: 输出的各行
+        """
+        fixed_sleeps = fixed_sleeps or {}
+        lines = []
+        for name, s in sorted(self.stats().items()):
+            line = (f"等待 {name}: {s['count']} 次，超时 {s['timeouts']} 次，共 {s['total']:.2f} 秒，"
+                    f"平均 {s['mean'] * 1000:.0f} 毫秒，最长 {s['max'] * 1000:.0f} 毫秒")
+            if name in fixed_sleeps:
+                line += f"，比固定睡眠节省 {fixed_sleeps[name] * s['count'] - s['total']:.1f} 秒"
+            logger.info(line)
+            lines.append(line)
+        return lines
+
+
+def in_viewport(webdriver, element):
+    """
+    元素是否已经滚动到可视区域内
+    """
+    return webdriver.execute_script(IN_VIEWPORT_JS, element)
+
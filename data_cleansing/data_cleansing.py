@@ -1,9 +1,23 @@
 # 数据清洗
 
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import re
 from pathlib import Path
 
+from cleaning_engine import DEFAULT_RULES, EMOJI_CHARS, RULES, CleaningEngine
+from manifest import CleaningManifest, output_name
+from normalize import source_crawl_time
+
+# 预先编译的正则表达式，逐条清洗评论时不需要每次重新编译
+EMOJI_PATTERN = re.compile(f"[{EMOJI_CHARS}]+", flags=re.UNICODE)
+REPLY_PATTERN = re.compile(RULES['reply_prefix'].pattern)
+# 输出文件中id列的类型，parent_id为空表示顶级评论
+ID_TYPES = {'id': 'int64', 'parent_id': 'Int64'}
+
 
 # 去除评论内容为空的数据
 def remove_empty(df):
@@ -13,41 +27,194 @@ def remove_empty(df):
 # 定义去除表情的正则表达式
 def remove_emojis(text):
     # 只匹配常见的表情符号范围
-    emoji_pattern = re.compile(
-        "[\U0001F600-\U0001F64F"  # 表情符号
-        "\U0001F300-\U0001F5FF"  # 符号和图像
-        "\U0001F680-\U0001F6FF"  # 交通和地图符号
-        "\U0001F700-\U0001F77F"  # 炼金符号
-        "\U0001F780-\U0001F7FF"  # 几何图形扩展
-        "\U0001F800-\U0001F8FF"  # 辅助箭头-C
-        "\U0001F900-\U0001F9FF"  # 补充符号和图像
-        "\U0001FA00-\U0001FA6F"  # 国际象棋符号
-        "\U0001FA70-\U0001FAFF"  # 符号和图像扩展-A
-        "]+", flags=re.UNICODE)  # 仅删除表情符号
-    return emoji_pattern.sub(r'', str(text))  # 替换为''，即删除表情符号
+    return EMOJI_PATTERN.sub(r'', str(text))  # 替换为''，即删除表情符号
 
 
 # 去除回复部分的提示如‘回复@用户昵称：’这部分内容
 def remove_replies(text):
     # 使用正则表达式去除以“回复”开头，以冒号结尾的部分
-    return re.sub(r'^回复.*?:', '', text)
-
-
-# 存储数据的文件夹
-data_path = Path('../data_raw')
-file_index = 1  # 文件名前缀
-# 遍历文件夹
-for file in data_path.iterdir():
-    # 检测是否是文件,并且后缀为.xlsx 的表格
-    if file.is_file() and file.suffix == '.xlsx':
-        print(file)
-        print(type(file))
-        df = pd.read_excel(file)
-        df = remove_empty(df=df)
-        df['contents'] = df['contents'].apply(remove_replies)
-        df['contents'] = df['contents'].apply(remove_emojis)
-
-        # 保存处理后的数据
-        df.to_excel(f'../data_processed/{file_index}.xlsx', index=False)
-        file_index = file_index + 1
+    return REPLY_PATTERN.sub('', text)
+
+
+def write_processed(df, target, excel=False):
+    """
+    保存清洗后的数据为Parquet文件，分析模块通过analysis/data_loader.py读取
+    先写临时文件再替换，写到一半出错不会留下损坏的文件
+    :param df: 清洗后的数据
+    :param target: 输出的.parquet文件
+    :param excel: 是否同时导出一份同名的Excel表格，方便直接查看
+    """
+    df = df.astype(ID_TYPES)
+    target = Path(target)
+    tmp_path = target.with_suffix('.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, target)
+    if excel:
+        df.to_excel(target.with_suffix('.xlsx'), index=False)
+
+
+def crawl_time_of(source, df, crawl_time=None):
+    """
+    原始文件的爬取时间，相对的发布时间按它换算；没有给出时根据文件修改时间和发布时间估计（见normalize.source_crawl_time）
+    """
+    if crawl_time is not None or 'pubdate' not in df:
+        return crawl_time
+    return source_crawl_time(source, df['pubdate'])
+
+
+def clean_file(source, target, rules=DEFAULT_RULES, excel=False, crawl_time=None):
+    """
+    清洗一个表格文件，在进程池的工作进程中执行
+    :param source: 原始数据文件
+    :param target: 输出文件
+    :param rules: 清洗规则（见cleaning_engine.RULES）
+    :param excel: 是否同时导出Excel表格
+    :param crawl_time: 爬取时间，为None时估计
+    :return: 各步骤耗时
+    """
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    df = pd.read_excel(source)
+    read_time = time.perf_counter()
+    cleaned = CleaningEngine(rules=rules).clean(df, crawl_time_of(source, df, crawl_time))
+    clean_time = time.perf_counter()
+    write_processed(cleaned, target, excel)
+    return {
+        'file': Path(source).name,
+        'output': str(target),
+        'rows_in': len(df),
+        'rows_out': len(cleaned),
+        'read': read_time - start_time,
+        'clean': clean_time - read_time,
+        'write': time.perf_counter() - clean_time,
+        'cpu': time.process_time() - start_cpu,
+    }
+
+
+def clean_chunk(df, rules=DEFAULT_RULES, crawl_time=None):
+    """
+    清洗大文件的一块数据，在进程池的工作进程中执行
+    """
+    return CleaningEngine(rules=rules).clean(df, crawl_time, tag_duplicates=False)
+
+
+def clean_large_file(pool, source, target, rules=DEFAULT_RULES, chunk_rows=200_000, excel=False, crawl_time=None):
+    """
+    清洗大文件：在当前进程读取表格，按行分块交给进程池清洗，按原顺序合并后写出
+    读取和写出期间，进程池中的其他工作进程继续清洗别的文件
+    :param pool: 进程池
+    :param chunk_rows: 每块的行数
+    :return: 各步骤耗时
+    """
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    df = pd.read_excel(source)
+    read_time = time.perf_counter()
+    # 爬取时间按整个文件估计，各块使用同一个时间
+    crawl_time = crawl_time_of(source, df, crawl_time)
+    futures = [pool.submit(clean_chunk, df.iloc[start:start + chunk_rows], rules, crawl_time)
+               for start in range(0, len(df), chunk_rows)]
+    cleaned = pd.concat([future.result() for future in futures]) if futures else df
+    # 近似重复要在整个文件中查找，合并后再标记
+    cleaned = CleaningEngine(rules=rules).tag_duplicates(cleaned)
+    clean_time = time.perf_counter()
+    write_processed(cleaned, target, excel)
+    return {
+        'file': Path(source).name,
+        'output': str(target),
+        'rows_in': len(df),
+        'rows_out': len(cleaned),
+        'read': read_time - start_time,
+        'clean': clean_time - read_time,
+        'write': time.perf_counter() - clean_time,
+        'cpu': time.process_time() - start_cpu,  # 不含分块清洗在工作进程中的CPU时间
+    }
+
+
+def clean_directory(input_dir='../data_raw', output_dir='../data_processed', workers=None, rules=DEFAULT_RULES,
+                    large_file_bytes=50 * 1024 * 1024, chunk_rows=200_000, force=False, excel=False,
+                    crawl_times=None):
+    """
+    用进程池并行清洗目录下的所有表格
+    每个原始文件输出为同名的Parquet文件（见manifest.output_name），输出与其他文件和处理顺序无关；
+    清单中记录的原始文件哈希和清洗规则版本都没有变化时跳过该文件；
+    超过large_file_bytes的大文件按行分块并行清洗
+    :param input_dir: 原始数据目录
+    :param output_dir: 输出目录
+    :param workers: 进程数，默认为CPU核数
+    :param rules: 清洗规则（见cleaning_engine.RULES）
+    :param large_file_bytes: 大文件的大小阈值（字节）
+    :param chunk_rows: 大文件每块的行数
+    :param force: 是否忽略清单，重新清洗所有文件
+    :param excel: 是否同时导出Excel表格
+    :param crawl_times: {原始文件名: 爬取时间}，没有给出的文件根据文件修改时间和发布时间估计
+    :return: 本次清洗的文件的耗时统计，按文件名排列
+    """
+    files = sorted(file for file in Path(input_dir).iterdir() if file.is_file() and file.suffix == '.xlsx')
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    crawl_times = crawl_times or {}
+    manifest = CleaningManifest(output_dir)
+    rules_version = CleaningEngine(rules=rules).version
+
+    start_time = time.perf_counter()
+    # 找出原始文件或清洗规则有变化的文件
+    pending = []
+    for source in files:
+        source_hash = manifest.source_hash(source)
+        target = Path(output_dir) / output_name(source)
+        if force or not manifest.is_current(source, rules_version, source_hash, target):
+            pending.append((source, target, source_hash))
+    for name in manifest.missing_sources(files):
+        print(f">>>原始文件已不存在：{name}，保留其清洗结果 {manifest.entries[name]['output']}")
+
+    results = [None] * len(pending)
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            # 先把小文件全部提交给进程池，再在当前进程中逐个读取大文件，分块清洗
+            futures = {}
+            large = []
+            for index, (source, target, _) in enumerate(pending):
+                if source.stat().st_size > large_file_bytes:
+                    large.append(index)
+                else:
+                    futures[index] = pool.submit(clean_file, source, target, rules, excel,
+                                                 crawl_times.get(source.name))
+            for index in large:
+                source, target, _ = pending[index]
+                results[index] = clean_large_file(pool, source, target, rules, chunk_rows, excel,
+                                                  crawl_times.get(source.name))
+            for index, future in futures.items():
+                results[index] = future.result()
+        for (source, target, source_hash), result in zip(pending, results):
+            manifest.record(source, source_hash, rules_version, target, result['rows_out'])
+    manifest.save()
+    elapsed = time.perf_counter() - start_time
+
+    print_summary(results, elapsed, workers, skipped=len(files) - len(pending))
+    return results
+
+
+def print_summary(results, elapsed, workers, skipped=0):
+    """
+    打印每个文件的清洗耗时
+    :param skipped: 没有变化而跳过的文件数
+    """
+    if not results:
+        print(f">>>{skipped} 个文件都没有变化，不需要清洗，耗时 {elapsed:.2f} 秒")
+        return
+    for result in results:
+        total = result['read'] + result['clean'] + result['write']
+        print(f">>>{result['output']}  {result['rows_in']} -> {result['rows_out']} 行，"
+              f"读取 {result['read']:.2f} 秒，清洗 {result['clean']:.2f} 秒，写出 {result['write']:.2f} 秒，"
+              f"共 {total:.2f} 秒  {result['file']}")
+    # 进程数超过CPU核数时各文件的耗时会互相重叠，用CPU时间估计逐个处理所需的时间
+    cpu = sum(result['cpu'] for result in results)
+    print(f">>>共清洗 {len(results)} 个文件，跳过没有变化的文件 {skipped} 个，{workers} 个进程，耗时 {elapsed:.2f} 秒，"
+          f"各文件CPU时间合计 {cpu:.2f} 秒（并行度 {cpu / elapsed if elapsed else 0:.1f}）")
+
 
+if __name__ == '__main__':
+    # 并行清洗data_raw下的所有表格，需要更多清洗规则时传入rules，如 rules=list(RULES)；
+    # 需要直接查看清洗结果时传入excel=True，同时导出Excel表格
+    clean_directory('../data_raw', '../data_processed')
@@ -0,0 +1,114 @@
+# 增量清洗清单
+# 原来每次清洗都要重新处理所有原始文件，输出按遍历顺序编号为1.xlsx、2.xlsx……，新增一个原始文件就可能打乱所有编号。
+# 清单记录每个原始文件的内容哈希、清洗规则版本和输出文件，原始文件和规则都没有变化时跳过；
+# 输出文件以视频标题（原始文件名）命名，不受其他文件增删的影响
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+# 清单文件名，放在输出目录下
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_hash(file_path, block_size=1024 * 1024):
+    """
+    文件内容的sha256哈希
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_name(source, suffix='.parquet'):
+    """
+    原始文件对应的输出文件名：与原始文件同名（爬取时已用视频标题命名）
+    """
+    return Path(source).stem + suffix
+
+
+class CleaningManifest:
+    """
+    清洗清单，记录 原始文件名 -> {source_hash, size, mtime, rules_version, output, rows, cleaned_at}
+    """
+
+    def __init__(self, output_dir):
+        """
+        :param output_dir: 清洗输出目录，清单保存为其中的manifest.json
+        """
+        self.output_dir = Path(output_dir)
+        self.file_path = self.output_dir / MANIFEST_NAME
+        self.entries = {}
+        if self.file_path.exists():
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)['files']
+
+    def source_hash(self, source):
+        """
+        原始文件的内容哈希；文件大小和修改时间与清单记录相同时直接使用记录的哈希，不重新读取文件
+        """
+        stat = Path(source).stat()
+        entry = self.entries.get(Path(source).name)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['source_hash']
+        return file_hash(source)
+
+    def is_current(self, source, rules_version, source_hash=None, output=None):
+        """
+        原始文件是否已经用同一版本的规则清洗过，且输出文件仍然存在
+        :param source: 原始文件
+        :param rules_version: 清洗规则版本（见CleaningEngine.version）
+        :param source_hash: 原始文件的内容哈希，为None时计算
+        :param output: 期望的输出文件，与记录的不同时（如输出格式改变）需要重新清洗
+        """
+        entry = self.entries.get(Path(source).name)
+        if entry is None:
+            return False
+        if output is not None and entry['output'] != Path(output).name:
+            return False
+        if source_hash is None:
+            source_hash = self.source_hash(source)
+        if entry['source_hash'] != source_hash or entry['rules_version'] != rules_version:
+            return False
+        if not (self.output_dir / entry['output']).exists():
+            return False
+        # 内容没有变化但修改时间变了（如重新检出仓库），更新记录，下次不用再计算哈希
+        stat = Path(source).stat()
+        entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+        return True
+
+    def record(self, source, source_hash, rules_version, output, rows):
+        """
+        记录一个已清洗的文件
+        """
+        stat = Path(source).stat()
+        self.entries[Path(source).name] = {
+            'source_hash': source_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'rules_version': rules_version,
+            'output': Path(output).name,
+            'rows': rows,
+            'cleaned_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def missing_sources(self, sources):
+        """
+        清单中有记录、但原始文件已不存在的文件名
+        """
+        names = {Path(source).name for source in sources}
+        return sorted(name for name in self.entries if name not in names)
+
+    def save(self):
+        """
+        保存清单，先写临时文件再替换
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.file_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': dict(sorted(self.entries.items()))}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
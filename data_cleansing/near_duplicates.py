@@ -0,0 +1,200 @@
+# 近似重复评论检测
+# 热门视频的评论区有大量复制粘贴的“刷屏”评论和小改动的变体，会让关键词统计和情感均值偏向这些重复内容，
+# 只删除完全相同的评论又会漏掉改了几个字的变体。这里用字符片段的MinHash签名和LSH分段找出近似重复的评论，
+# 不删除，而是标记所在的重复簇、簇的大小和每个簇的代表评论，分析时可以每个簇只算一次。
+# 完全相同的评论只计算一次，不同的评论拼接成一个数组后按列向量化计算，耗时与评论总字数成正比
+
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# 计算签名前去掉的字符：空白、标点和符号，只差标点的评论视为相同
+NORMALIZE_PATTERN = re.compile(r'[\W_]+')
+# 字符片段哈希的乘数
+SHINGLE_MULTIPLIER = np.uint64(0x100000001B3)
+# LSH分段的乘数
+BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# 输出的列
+CLUSTER_COLUMN = 'dup_cluster'  # 重复簇的编号，为簇中代表评论的id
+COUNT_COLUMN = 'dup_count'  # 簇中的评论数，没有重复的评论为1
+REPRESENTATIVE_COLUMN = 'dup_representative'  # 是否为簇的代表评论（簇中的第一条），每个簇只算一次时只保留这些行
+
+
+class NearDuplicateDetector:
+    """
+    用MinHash和LSH找出近似重复的评论
+    两条评论的字符片段集合的Jaccard相似度约为1 - (1/bands)^(1/rows)以上时大概率落入同一个桶，
+    同一个桶中的评论再用签名估计的相似度与桶中第一条评论比较，不低于threshold的合并为一个簇
+    """
+
+    def __init__(self, shingle_size=3, num_perm=64, bands=16, threshold=0.6, seed=1):
+        """
+        :param shingle_size: 字符片段的长度，比它短的评论整条作为一个片段
+        :param num_perm: MinHash签名的长度
+        :param bands: LSH的分段数，每段num_perm // bands个哈希值
+        :param threshold: 合并为一个簇的最低相似度（签名估计的Jaccard相似度）
+        :param seed: 随机种子，相同的参数和种子得到相同的结果
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm（{num_perm}）必须是bands（{bands}）的整数倍")
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.seed = seed
+        # 每个哈希函数为 (a * h + b) 的高32位，a为奇数
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    @property
+    def params(self):
+        """
+        影响结果的参数，写入清洗规则版本
+        """
+        return [self.shingle_size, self.num_perm, self.bands, self.threshold, self.seed]
+
+    @staticmethod
+    def normalize(texts):
+        """
+        计算签名前的文本：转为小写，去掉空白、标点和符号
+        """
+        return texts.astype('str').str.lower().str.replace(NORMALIZE_PATTERN, '', regex=True)
+
+    def _shingle_hashes(self, texts):
+        """
+        所有评论的字符片段哈希
+        :param texts: 非空的评论列表
+        :return: (片段哈希, 每条评论第一个片段的位置)
+        """
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        owner = np.repeat(np.arange(len(texts)), lengths)
+        remaining = ends[owner] - np.arange(len(codes))  # 从每个位置到所在评论末尾的字符数
+
+        k = self.shingle_size
+        padded = np.concatenate([codes, np.zeros(k, dtype=np.uint64)])
+        hashes = np.zeros(len(codes), dtype=np.uint64)
+        for j in range(k):
+            hashes = hashes * SHINGLE_MULTIPLIER + np.where(remaining > j, padded[j:j + len(codes)], 0)
+        # 完整的片段，加上短评论开头的整条评论
+        valid = (remaining >= k) | ((lengths[owner] < k) & (np.arange(len(codes)) == starts[owner]))
+        counts = np.bincount(owner[valid], minlength=len(texts))
+        return hashes[valid], np.cumsum(counts) - counts
+
+    def signatures(self, texts):
+        """
+        MinHash签名
+        :param texts: 非空的评论列表（已经normalize）
+        :return: (评论数, num_perm) 的uint32数组
+        """
+        hashes, offsets = self._shingle_hashes(texts)
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i in range(self.num_perm):
+            values = ((self._a[i] * hashes + self._b[i]) >> np.uint64(32)).astype(np.uint32)
+            signatures[:, i] = np.minimum.reduceat(values, offsets)
+        return signatures
+
+    def clusters(self, signatures):
+        """
+        根据签名把近似重复的评论合并为簇
+        :param signatures: MinHash签名
+        :return: 每条评论所在簇中第一条评论的位置
+        """
+        n = len(signatures)
+        labels = np.arange(n)
+        sources, targets = [], []
+        for band in range(self.bands):
+            columns = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+            keys = np.zeros(n, dtype=np.uint64)
+            for column in columns.T:
+                keys = keys * BAND_MULTIPLIER + column
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            heads = first[inverse]
+            candidates = np.flatnonzero(heads != labels)
+            # 与桶中第一条评论的签名相同的比例即Jaccard相似度的估计
+            similarity = (signatures[candidates] == signatures[heads[candidates]]).mean(axis=1)
+            matched = candidates[similarity >= self.threshold]
+            sources.append(matched)
+            targets.append(heads[matched])
+        sources, targets = np.concatenate(sources), np.concatenate(targets)
+
+        # 连通分量：沿边传播较小的编号，再压缩路径，直到不再变化
+        while True:
+            smaller = np.minimum(labels[sources], labels[targets])
+            updated = labels.copy()
+            np.minimum.at(updated, sources, smaller)
+            np.minimum.at(updated, targets, smaller)
+            while True:
+                compressed = updated[updated]
+                if np.array_equal(compressed, updated):
+                    break
+                updated = compressed
+            if np.array_equal(updated, labels):
+                return labels
+            labels = updated
+
+    def tag(self, df, column='contents', id_column='id'):
+        """
+        标记近似重复的评论，增加dup_cluster、dup_count、dup_representative三列；空评论各自为一个簇
+        :param df: 数据框，直接修改
+        :param column: 评论内容所在的列
+        :param id_column: 评论id所在的列，簇的编号为代表评论的id
+        :return: df
+        """
+        texts = self.normalize(df[column])
+        present = np.flatnonzero((texts != '').to_numpy())
+        labels = np.arange(len(df))
+        if len(present):
+            # 完全相同的评论（刷屏时占大多数）只计算一次签名；uniques按第一次出现的顺序排列
+            codes, uniques = pd.factorize(texts.iloc[present])
+            first = present[np.unique(codes, return_index=True)[1]]
+            labels[present] = first[self.clusters(self.signatures(list(uniques)))[codes]]
+        ids = df[id_column].to_numpy() if id_column in df else np.arange(len(df))
+        df[CLUSTER_COLUMN] = ids[labels]
+        df[COUNT_COLUMN] = np.bincount(labels, minlength=len(df))[labels]
+        df[REPRESENTATIVE_COLUMN] = labels == np.arange(len(df))
+        return df
+
+
+def cluster_summary(df, column='contents', top_n=10):
+    """
+    最大的几个重复簇
+    :return: 数据框，每个簇一行：代表评论、簇大小
+    """
+    clusters = df[df[REPRESENTATIVE_COLUMN] & (df[COUNT_COLUMN] > 1)]
+    return clusters.nlargest(top_n, COUNT_COLUMN)[[CLUSTER_COLUMN, COUNT_COLUMN, column]]
+
+
+if __name__ == '__main__':
+    # 统计每个已清洗视频中的重复评论，再在一百万行语料上测速
+    from pathlib import Path
+
+    from cleaning_engine import build_corpus
+
+    pd.set_option('display.max_colwidth', 40)
+    detector = NearDuplicateDetector()
+    frames = []
+    for file in sorted(Path('../data_processed').glob('*.parquet')):
+        df = pd.read_parquet(file, columns=['id', 'contents'])
+        frames.append(df.copy())
+        detector.tag(df)
+        duplicated = (~df[REPRESENTATIVE_COLUMN]).sum()
+        print(f">>>{file.stem[:20]}  {len(df)} 条评论，{(df[COUNT_COLUMN] > 1).sum()} 条在重复簇中，"
+              f"按簇计数后 {df[REPRESENTATIVE_COLUMN].sum()} 条（减少 {duplicated} 条）")
+        print(cluster_summary(df, top_n=3).to_string(index=False))
+
+    # 重复抽样的语料中完全相同的评论很多，末尾加上行号让每条评论都不同，测量最坏情况下的速度
+    corpus = build_corpus(pd.concat(frames, ignore_index=True), rows=1_000_000)
+    corpus['contents'] = corpus['contents'] + corpus.index.astype('str')
+    start_time = time.perf_counter()
+    detector.tag(corpus)
+    elapsed = time.perf_counter() - start_time
+    print(f">>>语料 {len(corpus)} 行，耗时 {elapsed:.2f} 秒，{len(corpus) / elapsed:,.0f} 行/秒，"
+          f"{corpus[REPRESENTATIVE_COLUMN].sum()} 个簇")
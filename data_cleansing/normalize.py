@@ -0,0 +1,161 @@
+# 点赞数和发布时间的类型转换
+# 爬虫保存的like_count和pubdate是页面上的原始文字：点赞数可能是“1.2万”、空或“赞”，
+# 发布时间可能是“3小时前”“刚刚”这样的相对时间。分析模块原来各自用pd.to_datetime(errors='coerce')重新解析，
+# 解析不了的直接丢掉，点赞数还可能按字符串排序。这里在清洗时一次性向量化地转换为int64和datetime64，
+# 相对时间按爬取时间换算
+
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# 点赞数的单位
+LIKE_UNITS = {'万': 10_000, '亿': 100_000_000}
+# 相对时间的单位（秒数）
+RELATIVE_UNITS = {'秒': 1, '分钟': 60, '小时': 3600, '天': 86400}
+# “昨天 12:30”这类时间相对爬取日期的天数
+RELATIVE_DAYS = {'今天': 0, '昨天': 1, '前天': 2}
+# B站对一天内发布的评论显示相对时间，更早的评论显示日期
+RELATIVE_WINDOW = pd.Timedelta(days=1)
+# 爬虫记录爬取时间的文件：原始文件名后加.crawl.json（与data_acquisition/comment_sink.py相同）
+CRAWL_TIME_SUFFIX = '.crawl.json'
+
+# 页面上最常见的完整时间格式
+FULL_FORMAT = '%Y-%m-%d %H:%M'
+LIKE_PATTERN = r'^(\d+(?:\.\d+)?)\s*(万|亿)?$'
+ABSOLUTE_PATTERN = r'^(?:(\d{4})-)?(\d{1,2})-(\d{1,2})(?:\s+(\d{1,2}):(\d{2}))?$'
+AGO_PATTERN = rf"^(\d+)\s*({'|'.join(RELATIVE_UNITS)})前$"
+DAY_PATTERN = rf"^({'|'.join(RELATIVE_DAYS)})\s*(\d{{1,2}}):(\d{{2}})$"
+
+
+def parse_like_count(series):
+    """
+    点赞数转换为int64：“1.2万”为12000，空或“赞”（没有人点赞时按钮只显示“赞”）为0
+    :param series: 点赞数，原始文字或数值
+    :return: int64的点赞数
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0).round().astype('int64')
+    parts = series.astype('str').str.strip().str.extract(LIKE_PATTERN)
+    number = pd.to_numeric(parts[0], errors='coerce') * parts[1].map(LIKE_UNITS).fillna(1)
+    return number.fillna(0).round().astype('int64')
+
+
+def _combine(parts, year):
+    """
+    把提取出的年、月、日、时、分组合为时间，缺少年份时使用year
+    """
+    columns = pd.DataFrame({
+        'year': pd.to_numeric(parts[0], errors='coerce').fillna(year),
+        'month': pd.to_numeric(parts[1], errors='coerce'),
+        'day': pd.to_numeric(parts[2], errors='coerce'),
+        'hour': pd.to_numeric(parts[3], errors='coerce').fillna(0),
+        'minute': pd.to_numeric(parts[4], errors='coerce').fillna(0),
+    })
+    return pd.to_datetime(columns, errors='coerce')
+
+
+def parse_pubdate(series, crawl_time):
+    """
+    发布时间转换为datetime64：
+    “2025-01-13 23:51”“2025-01-13”为绝对时间，“01-13 23:51”“01-13”为爬取当年的日期；
+    “刚刚”“5秒前”“33分钟前”“13小时前”“3天前”“昨天 12:30”按爬取时间换算；无法解析的为NaT
+    :param series: 发布时间，原始文字
+    :param crawl_time: 爬取时间
+    :return: datetime64的发布时间
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('datetime64[ns]')
+    crawl_time = pd.Timestamp(crawl_time)
+    # 按位置处理，原数据的索引可能有重复
+    text = series.astype('str').str.strip().reset_index(drop=True)
+
+    # 绝大多数评论是“2025-01-13 23:51”格式，先直接按格式解析，其余的再用正则提取
+    result = pd.to_datetime(text, format=FULL_FORMAT, errors='coerce').astype('datetime64[ns]')
+    rest = result.isna()
+    if rest.any():
+        absolute = text[rest].str.extract(ABSOLUTE_PATTERN)
+        matched = absolute[1].notna()
+        if matched.any():
+            result[matched[matched].index] = _combine(absolute[matched], crawl_time.year)
+
+    relative = text[result.isna()]
+    if relative.empty:
+        return result.dt.floor('min').set_axis(series.index)
+    ago = relative.str.extract(AGO_PATTERN)
+    matched = ago[0].notna()
+    if matched.any():
+        seconds = ago.loc[matched, 0].astype('int64') * ago.loc[matched, 1].map(RELATIVE_UNITS)
+        result[seconds.index] = crawl_time - pd.to_timedelta(seconds, unit='s')
+    result[relative.index[relative == '刚刚']] = crawl_time
+
+    day = relative.str.extract(DAY_PATTERN)
+    matched = day[0].notna()
+    if matched.any():
+        days = day.loc[matched, 0].map(RELATIVE_DAYS)
+        result[days.index] = (crawl_time.normalize() - pd.to_timedelta(days, unit='D')
+                              + pd.to_timedelta(day.loc[matched, 1].astype('int64'), unit='h')
+                              + pd.to_timedelta(day.loc[matched, 2].astype('int64'), unit='min'))
+    return result.dt.floor('min').set_axis(series.index)
+
+
+def estimate_crawl_time(series, upper=None):
+    """
+    估计爬取时间：B站对一天内的评论显示相对时间，所以显示为日期的最晚一条评论发布时，距离爬取至少已经一天；
+    评论持续增加的视频中，爬取时间接近这个下限。upper为爬取时间的上限（如原始文件的修改时间）
+    :param series: 发布时间，原始文字；也可以是按块读取的发布时间列的迭代器（流式清洗）
+    :param upper: 爬取时间的上限，为None时不限制
+    :return: 爬取时间，无法估计时为upper
+    """
+    chunks = [series] if isinstance(series, pd.Series) else series
+    year = datetime.now().year
+    latest = pd.Series([_combine(chunk.astype('str').str.strip().str.extract(ABSOLUTE_PATTERN), year).max()
+                        for chunk in chunks], dtype='datetime64[ns]').max()
+    if pd.isna(latest):
+        return upper
+    estimate = latest + RELATIVE_WINDOW
+    return estimate if upper is None else min(estimate, pd.Timestamp(upper))
+
+
+def read_crawl_time(source):
+    """
+    爬虫记录的爬取时间（见data_acquisition/comment_sink.py），没有记录时为None
+    :param source: 原始数据文件
+    """
+    path = Path(f'{source}{CRAWL_TIME_SUFFIX}')
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return pd.Timestamp(json.load(f)['crawl_time']).floor('min')
+
+
+def source_crawl_time(source, pubdate):
+    """
+    原始文件的爬取时间，整个文件清洗和流式清洗都用它，同一个文件的相对时间换算结果相同：
+    优先使用爬虫记录的爬取时间；没有记录时（如较早爬取的数据）文件修改时间是上限，再根据显示为日期的评论估计（见estimate_crawl_time）。
+    重新检出仓库等操作会改变文件修改时间，有准确的爬取时间时应直接传给clean_file
+    :param source: 原始数据文件
+    :param pubdate: 该文件的发布时间列，或按块读取的发布时间列的迭代器；有记录的爬取时间时不读取
+    """
+    recorded = read_crawl_time(source)
+    if recorded is not None:
+        return recorded
+    mtime = pd.Timestamp(datetime.fromtimestamp(Path(source).stat().st_mtime)).floor('min')
+    return estimate_crawl_time(pubdate, upper=mtime)
+
+
+def normalize_columns(df, crawl_time=None, like_column='like_count', date_column='pubdate'):
+    """
+    转换点赞数和发布时间的类型，数据中没有的列跳过
+    :param df: 数据框，直接修改
+    :param crawl_time: 爬取时间，相对时间按它换算；为None时根据数据估计，无法估计时使用当前时间
+    :return: df
+    """
+    if like_column in df:
+        df[like_column] = parse_like_count(df[like_column])
+    if date_column in df:
+        if crawl_time is None:
+            crawl_time = estimate_crawl_time(df[date_column], upper=pd.Timestamp.now().floor('min'))
+        df[date_column] = parse_pubdate(df[date_column], crawl_time)
+    return df
@@ -0,0 +1,168 @@
+# 大文件流式清洗
+# data_cleansing.py把每个文件整个读入一个数据框，清洗后一次写出，多次爬取合并得到的几百万行评论会占用大量内存。
+# 这里按固定行数分块读取CSV/JSONL/Parquet格式的评论（与data_acquisition/comment_sink.py的存储格式相同），
+# 每块清洗后作为一个行组追加写入Parquet文件，内存占用只与每块的行数有关，与文件大小无关。
+# 近似重复检测需要整个文件的评论，流式清洗不做标记
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from cleaning_engine import DEFAULT_RULES, CleaningEngine
+from data_cleansing import ID_TYPES
+from normalize import source_crawl_time
+
+try:
+    import resource
+except ImportError:
+    # Windows上没有resource模块，不统计内存峰值
+    resource = None
+
+# 评论数据的列名，与comment_sink.COLUMNS相同
+COLUMNS = ['id', 'contents', 'parent_id', 'pubdate', 'like_count']
+# CSV中按文字读取的列，避免“666”这样的评论被读成数字
+TEXT_COLUMNS = {'contents': 'str', 'pubdate': 'str', 'like_count': 'str'}
+
+
+def peak_rss():
+    """
+    当前进程的内存峰值（MB），不支持的平台返回None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _jsonl_chunks(file_path, chunk_rows):
+    records = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # 崩溃时写了一半的最后一行
+                break
+            if len(records) >= chunk_rows:
+                yield pd.DataFrame.from_records(records, columns=COLUMNS)
+                records = []
+    if records:
+        yield pd.DataFrame.from_records(records, columns=COLUMNS)
+
+
+def _parquet_chunks(file_path, chunk_rows):
+    import pyarrow.parquet as pq
+
+    # ParquetSink的存储是一个目录，按顺序读取其中的part文件
+    parts = sorted(file_path.glob('part-*.parquet')) if file_path.is_dir() else [file_path]
+    for part in parts:
+        for batch in pq.ParquetFile(part).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+
+
+def iter_chunks(file_path, chunk_rows=100_000):
+    """
+    分块读取评论数据
+    :param file_path: 评论文件，后缀为.csv/.jsonl/.parquet（可以是ParquetSink的目录）
+    :param chunk_rows: 每块的行数
+    :return: 数据框的迭代器
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == '.csv':
+        return pd.read_csv(file_path, chunksize=chunk_rows, dtype=TEXT_COLUMNS)
+    if suffix == '.jsonl':
+        return _jsonl_chunks(file_path, chunk_rows)
+    if suffix == '.parquet':
+        return _parquet_chunks(file_path, chunk_rows)
+    raise ValueError(f"不支持的流式清洗格式：{suffix}，可选 ['.csv', '.jsonl', '.parquet']")
+
+
+def stream_clean(source, target, rules=DEFAULT_RULES, chunk_rows=100_000, crawl_time=None):
+    """
+    流式清洗一个大文件：分块读取、清洗，每块作为一个行组追加写入Parquet文件
+    先写临时文件再替换，写到一半出错不会留下损坏的文件
+    :param source: 评论文件，后缀为.csv/.jsonl/.parquet
+    :param target: 输出的.parquet文件
+    :param rules: 清洗规则（见cleaning_engine.RULES）
+    :param chunk_rows: 每块的行数，决定内存占用
+    :param crawl_time: 爬取时间，相对的发布时间按它换算；为None时与整个文件清洗相同（见normalize.source_crawl_time），
+                       没有爬虫记录的爬取时间时先分块读一遍发布时间列来估计
+    :return: 统计结果：行数、耗时、每秒行数、内存峰值
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if crawl_time is None:
+        crawl_time = source_crawl_time(source, (chunk['pubdate'] for chunk in iter_chunks(source, chunk_rows)))
+    engine = CleaningEngine(rules=rules, duplicates=False)
+    target = Path(target)
+    tmp_path = target.with_suffix('.tmp')
+    start_time = time.perf_counter()
+    rows_in = rows_out = chunks = 0
+    writer = None
+    try:
+        for chunk in iter_chunks(source, chunk_rows):
+            rows_in += len(chunk)
+            cleaned = engine.clean(chunk, crawl_time, tag_duplicates=False).astype(ID_TYPES)
+            table = pa.Table.from_pandas(cleaned, preserve_index=False)
+            if writer is None:
+                # 所有行组使用第一块的表结构
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows_out += len(cleaned)
+            chunks += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"没有读取到评论数据：{source}")
+    os.replace(tmp_path, target)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'file': Path(source).name,
+        'output': str(target),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'chunks': chunks,
+        'seconds': elapsed,
+        'rows_per_second': rows_in / elapsed if elapsed else 0,
+        'peak_rss_mb': peak_rss(),
+    }
+
+
+def print_result(result):
+    peak = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else '不支持统计'
+    print(f">>>{result['output']}  {result['rows_in']} -> {result['rows_out']} 行，{result['chunks']} 块，"
+          f"耗时 {result['seconds']:.2f} 秒，{result['rows_per_second']:,.0f} 行/秒，内存峰值 {peak}")
+
+
+if __name__ == '__main__':
+    # 用七个视频的评论分批重复抽样，生成几百万行的CSV评论文件，再流式清洗，
+    # 对比不同的分块大小下的内存峰值（每种分块大小在单独的进程中运行，内存峰值互不影响）
+    import subprocess
+    import tempfile
+
+    if len(sys.argv) == 4:
+        # 子进程：python streaming.py 输入文件 输出文件 每块行数
+        print_result(stream_clean(sys.argv[1], sys.argv[2], chunk_rows=int(sys.argv[3])))
+        sys.exit()
+
+    raw = pd.concat([pd.read_excel(file) for file in sorted(Path('../data_raw').glob('*.xlsx'))],
+                    ignore_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'comments.csv'
+        for batch in range(20):
+            sample = raw.sample(n=100_000, replace=True, random_state=batch)
+            sample.to_csv(source, mode='a', header=batch == 0, index=False)
+        print(f">>>生成评论文件 {source.stat().st_size / 1024 / 1024:.0f} MB，共 2000000 行")
+        for chunk_rows in (10_000, 100_000, 500_000):
+            print(f">>>每块 {chunk_rows} 行：")
+            subprocess.run([sys.executable, __file__, str(source), str(Path(tmp) / 'comments.parquet'),
+                            str(chunk_rows)], check=True)